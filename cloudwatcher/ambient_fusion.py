@@ -0,0 +1,235 @@
+"""
+CloudWatcher Ambient Temperature Fusion
+Modified: 2026-10-19 - Initial creation
+
+One ambient temperature estimate with uncertainty for the heater control,
+fused from all available sources by a scalar Kalman filter:
+
+    shadow  ESP "Schatten" sensor (reference, smallest noise)
+    sun     ESP "Sonne" sensor (heated by the sun in daylight: large noise)
+    pws     PWS temperature via the weather aggregator (PWS_URL, optional)
+    ntc     rain sensor NTC while the heater is off (cools down towards ambient)
+
+The true ambient temperature is modelled as a random walk: between
+cycles the variance grows by AMBIENT_PROCESS_NOISE per second. Every new
+reading is weighted by its variance, which grows with its age (a reading
+from 10 minutes ago tells less about now), so stale PWS data counts less
+than a fresh ESP reading. The NTC counts only as far as it has cooled
+down: its residual heater excess decays with AMBIENT_NTC_TAU.
+
+Offsets of the secondary sources against the shadow sensor (sun sensor
+at night, PWS, settled NTC) are learned while the shadow sensor reports,
+and subtracted during its outages.
+
+When the ESP fetch fails, the estimate is carried forward (prediction
+only, or PWS/NTC updates) with growing uncertainty. The heater control
+keeps running until the uncertainty exceeds AMBIENT_MAX_SIGMA, instead of
+stopping at the first failed fetch and then heating hard to catch up.
+Readings further than AMBIENT_GATE sigmas from the estimate are rejected
+(sensor glitches); repeated rejections of the shadow sensor reset the
+filter to it.
+"""
+
+import math
+from typing import Dict, Optional, Tuple
+
+import config
+
+SOURCES = ('shadow', 'sun', 'pws', 'ntc')
+# Keys of config.AMBIENT_NOISE
+NOISE_KEYS = SOURCES + ('sun_daylight',)
+
+# Shadow readings rejected in a row before the filter is reset to the shadow sensor
+MAX_SHADOW_REJECTS = 3
+# Older PWS readings do not train the PWS offset (seconds)
+OFFSET_MAX_AGE = 600
+
+
+class AmbientFusion:
+    """Scalar Kalman filter over the ambient temperature sources of one device."""
+
+    def __init__(self):
+        self.estimate: Optional[float] = None
+        self.variance: Optional[float] = None
+        self.updated: Optional[float] = None  # time of the last prediction
+        self.used: Tuple[str, ...] = ()
+        self.sources = {
+            name: {'value': None, 'ts': None, 'offset': 0.0, 'fused': None, 'rejected': 0}
+            for name in SOURCES
+        }
+        self._shadow_rejects = 0
+        # Heater-off tracking for the NTC cooldown
+        self._heater_off_since: Optional[float] = None
+        self._ntc_excess: Optional[float] = None
+        self.configure()
+
+    def configure(self):
+        """(Re)load settings from config (live config reload)."""
+        self.process_noise = config.AMBIENT_PROCESS_NOISE
+        self.noise = dict(config.AMBIENT_NOISE)
+        self.max_sigma = config.AMBIENT_MAX_SIGMA
+        self.gate = config.AMBIENT_GATE
+        self.offset_alpha = config.AMBIENT_OFFSET_ALPHA
+        self.ntc_tau = config.AMBIENT_NTC_TAU
+
+    @property
+    def sigma(self) -> Optional[float]:
+        return math.sqrt(self.variance) if self.variance is not None else None
+
+    @property
+    def valid(self) -> bool:
+        """True if the estimate is good enough for heater control."""
+        return self.estimate is not None and self.sigma <= self.max_sigma
+
+    def _predict(self, now: float):
+        if self.estimate is not None and self.updated is not None and now > self.updated:
+            self.variance += self.process_noise * (now - self.updated)
+        self.updated = now
+
+    def _fuse(self, name: str, value: float, variance: float) -> bool:
+        """Kalman update with one measurement; returns False if gated out."""
+        if self.estimate is None:
+            self.estimate, self.variance = value, variance
+            return True
+        innovation = value - self.estimate
+        total = self.variance + variance
+        if abs(innovation) > self.gate * math.sqrt(total):
+            self.sources[name]['rejected'] += 1
+            return False
+        gain = self.variance / total
+        self.estimate += gain * innovation
+        self.variance *= 1 - gain
+        return True
+
+    def _learn_offset(self, name: str, value: float, reference: float):
+        source = self.sources[name]
+        source['offset'] += self.offset_alpha * ((value - reference) - source['offset'])
+
+    def _observe(self, name: str, value: float, ts: float, now: float, extra_variance: float = 0.0) -> bool:
+        """Fuse a secondary reading (offset-corrected, variance grown with age)."""
+        source = self.sources[name]
+        if source['fused'] is not None and ts <= source['fused']:
+            return False  # already used
+        source['fused'] = ts
+        age = max(now - ts, 0.0)
+        variance = self.noise[name] + self.process_noise * age + extra_variance
+        return self._fuse(name, value - source['offset'], variance)
+
+    def update(
+        self,
+        now: float,
+        shadow: Optional[float] = None,
+        sun: Optional[float] = None,
+        pws: Optional[Tuple[float, float]] = None,
+        sensor_temp: Optional[float] = None,
+        heater_pwm: Optional[int] = None,
+        is_daylight: Optional[bool] = None,
+    ) -> Dict:
+        """
+        Advance the estimate to now and fuse the readings of this cycle.
+
+        Args:
+            now: Current time (epoch seconds, device clock)
+            shadow: ESP shadow temperature of this cycle (None = fetch failed)
+            sun: ESP sun temperature of this cycle
+            pws: (temperature, epoch seconds of the PWS reading) or None
+            sensor_temp: Rain sensor NTC temperature
+            heater_pwm: Actual heater PWM (NTC is used while it is 0)
+            is_daylight: Debounced daylight flag (sun sensor trusted only at night)
+
+        Returns:
+            Summary {'ambient_temp_c', 'ambient_sigma_c', 'ambient_source'}
+        """
+        self._predict(now)
+        used = []
+
+        for name, value in (('shadow', shadow), ('sun', sun)):
+            if value is not None:
+                self.sources[name].update(value=value, ts=now)
+        if pws is not None:
+            self.sources['pws'].update(value=pws[0], ts=pws[1])
+
+        # NTC cooldown: residual heater excess at switch-off decays with tau
+        ntc_variance = None
+        if sensor_temp is not None and heater_pwm is not None:
+            if heater_pwm > 0:
+                self._heater_off_since = self._ntc_excess = None
+            else:
+                if self._heater_off_since is None:
+                    self._heater_off_since = now
+                    if self.estimate is not None:
+                        self._ntc_excess = sensor_temp - self.estimate
+                if self._ntc_excess is not None:
+                    residual = self._ntc_excess * math.exp(-(now - self._heater_off_since) / self.ntc_tau)
+                    ntc_variance = residual * residual
+                    self.sources['ntc'].update(value=sensor_temp, ts=now)
+
+        # Shadow sensor: reference reading, learn the offsets of the others
+        if shadow is not None:
+            self.sources['shadow']['fused'] = now
+            if self._fuse('shadow', shadow, self.noise['shadow']):
+                self._shadow_rejects = 0
+                used.append('shadow')
+            else:
+                self._shadow_rejects += 1
+                if self._shadow_rejects >= MAX_SHADOW_REJECTS:
+                    self.estimate, self.variance = shadow, self.noise['shadow']
+                    self._shadow_rejects = 0
+                    used.append('shadow')
+            if sun is not None and is_daylight is False:
+                self._learn_offset('sun', sun, shadow)
+            pws_source = self.sources['pws']
+            if pws_source['value'] is not None and now - pws_source['ts'] <= OFFSET_MAX_AGE:
+                self._learn_offset('pws', pws_source['value'], shadow)
+            if ntc_variance is not None and ntc_variance <= self.noise['ntc']:
+                self._learn_offset('ntc', sensor_temp, shadow)
+
+        if sun is not None:
+            extra = self.noise['sun_daylight'] if is_daylight is not False else 0.0
+            if self._observe('sun', sun, now, now, extra):
+                used.append('sun')
+        if pws is not None and now - pws[1] <= config.PWS_MAX_AGE:
+            if self._observe('pws', pws[0], pws[1], now):
+                used.append('pws')
+        if ntc_variance is not None:
+            if self._observe('ntc', sensor_temp, now, now, ntc_variance):
+                used.append('ntc')
+
+        self.used = tuple(used)
+        return self.summary
+
+    @property
+    def summary(self) -> Dict:
+        """Flat fields for the device snapshot."""
+        if self.estimate is None:
+            return {'ambient_temp_c': None, 'ambient_sigma_c': None, 'ambient_source': None}
+        if not self.used:
+            source = 'predicted'
+        elif self.used == ('shadow',):
+            source = 'shadow'
+        else:
+            source = 'fused'
+        return {
+            'ambient_temp_c': round(self.estimate, 2),
+            'ambient_sigma_c': round(self.sigma, 2),
+            'ambient_source': source,
+        }
+
+    def get_status(self) -> Dict:
+        """Return estimate and per-source state (/api/heater, /api/raw)."""
+        return {
+            **self.summary,
+            'valid': self.valid,
+            'used': list(self.used),
+            'max_sigma_c': self.max_sigma,
+            'sources': {
+                name: {
+                    'value': source['value'],
+                    'age_s': round(self.updated - source['ts'], 1)
+                    if source['ts'] is not None and self.updated is not None else None,
+                    'offset_c': round(source['offset'], 2),
+                    'rejected': source['rejected'],
+                }
+                for name, source in self.sources.items()
+            },
+        }
@@ -0,0 +1,155 @@
+"""
+CloudWatcher Adaptive Read Cadence
+Modified: 2026-10-19 - Initial creation
+
+Chooses the pause between two read cycles of a device from the weather
+state of the last cycle, instead of a fixed READ_INTERVAL:
+
+    fast    READ_INTERVAL_MIN  wet or raining, a flag transition pending
+                               (dwell running) or within CADENCE_HOLD of
+                               one (incl. rain onset), impulse heating,
+                               dew risk (wet / sensor margin predicted
+                               within CADENCE_DEW_LEAD minutes)
+    normal  READ_INTERVAL      clouds changing (outlook not 'steady'),
+                               dawn/dusk or a cloud class boundary within
+                               CADENCE_DEW_LEAD minutes, no trend yet
+    stable  up to READ_INTERVAL_MAX, growing by CADENCE_RELAX_FACTOR per
+                               cycle while nothing of the above applies
+
+Tightening takes effect at once, relaxing is gradual. While the heater
+is regulating (target PWM > 0) the interval never exceeds
+HEATER_MAX_CONTROL_INTERVAL, so the control loop keeps its minimum rate.
+A rain onset from the fast path also wakes the device loop immediately
+(see CloudWatcherDevice.on_rain_onset).
+
+The rain fast path (E! polling), diagnostics and heater refresh keep
+their own schedules. Trends, rollups, flag dwell times and staleness are
+time based and unaffected by the irregular cadence.
+"""
+
+from typing import Dict, Optional
+
+import config
+from records import HeaterStatus
+
+MODES = ('fast', 'normal', 'stable', 'fixed')
+
+_NO_HEATER = HeaterStatus()
+
+
+class CadenceController:
+    """Read interval of one device, derived from its last snapshot."""
+
+    def __init__(self):
+        self.configure()
+        self.interval = float(config.READ_INTERVAL)
+        self.mode = 'normal'
+        self.reason = 'startup'
+        self._hold_until: Optional[float] = None
+        # Statistics (reads compared to a fixed READ_INTERVAL)
+        self._started: Optional[float] = None
+        self._last: Optional[float] = None
+        self.cycles = 0
+        self.mode_cycles = {mode: 0 for mode in MODES}
+
+    def configure(self):
+        """(Re)load settings from config (live config reload)."""
+        self.enabled = config.CADENCE_ENABLED
+        self.base = config.READ_INTERVAL
+        self.minimum = config.READ_INTERVAL_MIN
+        self.maximum = config.READ_INTERVAL_MAX
+        self.relax_factor = config.CADENCE_RELAX_FACTOR
+        self.hold = config.CADENCE_HOLD
+        self.dew_lead = config.CADENCE_DEW_LEAD
+        self.heater_max = config.HEATER_MAX_CONTROL_INTERVAL
+
+    def note_event(self, now: float):
+        """Flag transition or rain onset: stay fast for CADENCE_HOLD seconds."""
+        self._hold_until = now + self.hold
+
+    @staticmethod
+    def _within(minutes: Optional[float], lead: float) -> bool:
+        return minutes is not None and minutes <= lead
+
+    def _classify(self, now: float, snapshot: Dict, flags_pending: bool, heater: HeaterStatus) -> tuple:
+        """Return (mode, reason) for the weather state of a snapshot."""
+        if snapshot.get('is_raining') or snapshot.get('is_wet'):
+            return 'fast', 'wet'
+        if flags_pending:
+            return 'fast', 'flag_pending'
+        if self._hold_until is not None and now < self._hold_until:
+            return 'fast', 'transition'
+        if heater.in_impulse:
+            return 'fast', 'impulse'
+        if (self._within(snapshot.get('wet_in_min'), self.dew_lead)
+                or self._within(snapshot.get('sensor_margin_in_min'), self.dew_lead)):
+            return 'fast', 'dew_risk'
+
+        if snapshot.get('cloud_outlook') is None:
+            return 'normal', 'no_trend'
+        if snapshot.get('cloud_outlook') != 'steady':
+            return 'normal', snapshot['cloud_outlook']
+        if (self._within(snapshot.get('cloud_change_in_min'), self.dew_lead)
+                or self._within(snapshot.get('daylight_in_min'), self.dew_lead)):
+            return 'normal', 'threshold_ahead'
+        return 'stable', 'stable'
+
+    def update(self, now: float, snapshot: Dict, flags_pending: bool = False,
+               heater: Optional[HeaterStatus] = None) -> float:
+        """
+        Choose the interval after a successful cycle.
+
+        Args:
+            now: Cycle time (epoch seconds, device clock)
+            snapshot: Device snapshot incl. trend summary
+            flags_pending: A debounced flag is waiting for its dwell time
+            heater: Heater controller status (None = heater disabled)
+
+        Returns:
+            Seconds until the next cycle
+        """
+        heater = heater or _NO_HEATER
+        if not self.enabled:
+            mode, reason, interval = 'fixed', 'disabled', float(self.base)
+        else:
+            mode, reason = self._classify(now, snapshot, flags_pending, heater)
+            if mode == 'fast':
+                interval = float(self.minimum)
+            elif mode == 'normal':
+                interval = float(self.base)
+            else:
+                interval = min(max(self.interval, self.base) * self.relax_factor, self.maximum)
+            if heater.pwm and interval > self.heater_max:
+                interval = float(self.heater_max)
+                reason += '+heater'
+        self._record(now, mode, reason, interval)
+        return self.interval
+
+    def fallback(self, now: float, reason: str) -> float:
+        """Interval after a failed cycle (no data): back to READ_INTERVAL."""
+        self._record(now, 'fixed', reason, float(self.base))
+        return self.interval
+
+    def _record(self, now: float, mode: str, reason: str, interval: float):
+        self.mode, self.reason, self.interval = mode, reason, round(interval, 1)
+        if self._started is None:
+            self._started = now
+        self._last = now
+        self.cycles += 1
+        self.mode_cycles[mode] += 1
+
+    def get_status(self) -> Dict:
+        """Return current interval and statistics (/api/raw 'cadence')."""
+        elapsed = (self._last - self._started) if self.cycles > 1 else 0.0
+        fixed_cycles = elapsed / self.base + 1 if elapsed else None
+        return {
+            'enabled': self.enabled,
+            'interval_s': self.interval,
+            'mode': self.mode,
+            'reason': self.reason,
+            'cycles': self.cycles,
+            'mode_cycles': self.mode_cycles,
+            'avg_interval_s': round(elapsed / (self.cycles - 1), 1) if elapsed else None,
+            'reads_saved_pct': round(100 * (1 - self.cycles / fixed_cycles), 1) if fixed_cycles else None,
+            'range_s': [self.minimum, self.base, self.maximum],
+        }
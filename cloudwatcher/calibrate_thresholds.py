@@ -0,0 +1,430 @@
+"""
+CloudWatcher Threshold Calibration
+Modified: 2026-10-19 - Initial creation
+Modified: 2026-10-19 - Load weather_readings from a pg_dump SQL file or an SQLite database
+
+Offline calibration of config.THRESHOLDS, RAIN_THRESHOLD and
+WET_THRESHOLD from user feedback collected by the Weather-Aggregator
+(weather_readings.feedback / feedback_correct_wmo).
+
+The feedback rows are loaded once into NumPy arrays and all candidate
+thresholds are evaluated in one vectorised pass:
+
+- Cloud cover: the true WMO code (feedback_correct_wmo for wrong
+  feedback, wmo_code for confirmed feedback) of cloud-cover rows
+  (WMO 0-3) is compared against the class delta_c falls into.
+  Accuracy of every (clear, mostly_clear, partly_cloudy) combination on
+  the grid is computed from cumulative per-class counts by broadcasting,
+  so no row is visited per candidate.
+- Rain / wet: precipitation is predicted as in wmo_derivation.php
+  (precip_rate_mm > 0 or rain_freq < RAIN_THRESHOLD). Wet is scored
+  against precipitation plus fog/mist codes (dew/condensation proxy).
+  All (RAIN_THRESHOLD, WET_THRESHOLD) pairs are scored at once.
+
+Both groups use disjoint labels, so their joint optimum is the
+combination of the two group optima. Among equally good candidates the
+one closest to the current configuration is chosen. 'mostly_cloudy' and
+'cloudy' have no WMO code of their own and are only lowered if needed
+to keep the thresholds ordered.
+
+Input (detected from the content):
+- CSV with header (e.g. psql: \\copy (SELECT * FROM weather_readings
+  WHERE feedback IS NOT NULL) TO 'feedback.csv' CSV HEADER)
+- JSON lines with the same column names
+- SQL dump of the weather_readings table (pg_dump, COPY blocks or
+  --inserts / --column-inserts statements)
+- SQLite database with a weather_readings table
+
+Usage:
+    python3 calibrate_thresholds.py feedback.csv
+    python3 calibrate_thresholds.py feedback.jsonl --step 0.5 --diff candidate.diff
+    python3 calibrate_thresholds.py weather.sql
+"""
+
+import argparse
+import csv
+import difflib
+import json
+import os
+import re
+import sqlite3
+import sys
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import config
+
+# WMO code groups (WMO 4677 subset used by wmo_derivation.php)
+CLOUD_CODES = (0, 1, 2, 3)
+FOG_MIST_CODES = (10, 11, 45, 48)
+
+# Cloud classes in config.THRESHOLDS that map to a distinct WMO code (0, 1, 2)
+CLOUD_KEYS = ('clear', 'mostly_clear', 'partly_cloudy')
+
+# Columns loaded from the dump
+COLUMNS = ('delta_c', 'rain_freq', 'precip_rate_mm', 'wmo_code', 'feedback', 'feedback_correct_wmo')
+
+# Source table in the aggregator database
+TABLE = 'weather_readings'
+SQLITE_MAGIC = b'SQLite format 3\x00'
+
+# Statements of a SQL dump (table name optionally schema-qualified and quoted)
+_TABLE_NAME = rf'(?:"?\w+"?\.)?"?{TABLE}"?'
+_COPY_RE = re.compile(rf'^COPY\s+{_TABLE_NAME}\s*\(([^)]*)\)\s+FROM\s+stdin;', re.I | re.M)
+_CREATE_RE = re.compile(rf'CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?{_TABLE_NAME}\s*\((.*?)\n\);', re.I | re.S)
+_INSERT_RE = re.compile(rf'INSERT\s+INTO\s+{_TABLE_NAME}\s*(?:\(([^)]*)\))?\s*VALUES\s*', re.I)
+# One value: string literal ('' escaped, optional E prefix) or bare word/number, optional ::cast
+_VALUE_RE = re.compile(r"\s*(E?'(?:[^']|'')*'|[^,()\s]+)(?:::[\w ]+)?\s*")
+_CONSTRAINTS = ('constraint', 'primary', 'unique', 'foreign', 'check', 'exclude')
+
+
+def _to_float(value) -> float:
+    if value is None or value == '' or value == '\\N':
+        return np.nan
+    if isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str) and value.lower() in ('t', 'true', 'f', 'false'):
+        return 1.0 if value.lower() in ('t', 'true') else 0.0
+    return float(value)
+
+
+def _columns(names: str) -> List[str]:
+    return [name.strip().strip('"') for name in names.split(',')]
+
+
+def _literal(token: str) -> Optional[str]:
+    if token.upper() == 'NULL':
+        return None
+    if token.endswith("'"):
+        return token[token.index("'") + 1:-1].replace("''", "'")
+    return token
+
+
+def _insert_rows(text: str, start: int, columns: List[str]) -> List[Dict]:
+    """Parse the value tuples of one INSERT statement starting at `start`."""
+    rows, pos = [], start
+    while True:
+        if text[pos] != '(':
+            raise ValueError(f"Unexpected SQL near: {text[pos:pos + 40]!r}")
+        pos += 1
+        values = []
+        while True:
+            match = _VALUE_RE.match(text, pos)
+            if not match:
+                raise ValueError(f"Unexpected SQL near: {text[pos:pos + 40]!r}")
+            values.append(_literal(match.group(1)))
+            pos = match.end()
+            if text[pos] == ')':
+                break
+            pos += 1  # ','
+        if len(values) != len(columns):
+            raise ValueError(f"{TABLE} INSERT has {len(values)} values for {len(columns)} columns")
+        rows.append(dict(zip(columns, values)))
+        pos += 1
+        while text[pos].isspace():
+            pos += 1
+        if text[pos] != ',':
+            return rows
+        pos += 1
+        while text[pos].isspace():
+            pos += 1
+
+
+def load_sql_dump(path: str) -> List[Dict]:
+    """
+    Return the weather_readings rows of a pg_dump SQL file as dicts (values as text).
+
+    COPY ... FROM stdin blocks (the pg_dump default, NULL = \\N, booleans
+    t/f) and INSERT statements are read; INSERTs without a column list
+    take the column order of the table's CREATE TABLE in the same dump.
+    """
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+
+    rows = []
+    for match in _COPY_RE.finditer(text):
+        columns = _columns(match.group(1))
+        pos = match.end() + 1
+        while True:
+            end = text.find('\n', pos)
+            line = text[pos:] if end < 0 else text[pos:end]
+            if line == '\\.' or end < 0:
+                break
+            rows.append(dict(zip(columns, line.split('\t'))))
+            pos = end + 1
+
+    table_columns = None
+    create = _CREATE_RE.search(text)
+    if create:
+        definitions = (re.sub(r'--.*', '', line).strip() for line in create.group(1).split('\n'))
+        table_columns = [
+            d.split()[0].strip('"') for d in definitions
+            if d and d.split()[0].lower() not in _CONSTRAINTS
+        ]
+    for match in _INSERT_RE.finditer(text):
+        columns = _columns(match.group(1)) if match.group(1) else table_columns
+        if columns is None:
+            raise ValueError(f"INSERT without column list and no CREATE TABLE {TABLE} in {path}")
+        rows.extend(_insert_rows(text, match.end(), columns))
+
+    if not rows and not create:
+        raise ValueError(f"No {TABLE} data in {path}")
+    return rows
+
+
+def load_sqlite(path: str) -> List[Dict]:
+    """Return the weather_readings rows with feedback of an SQLite database as dicts."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    try:
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({TABLE})")}
+        if not existing:
+            raise ValueError(f"No table {TABLE} in {path}")
+        missing = [c for c in COLUMNS if c not in existing]
+        if missing:
+            raise ValueError(f"Missing column(s) in {path}: {', '.join(missing)}")
+        return [dict(row) for row in conn.execute(
+            f"SELECT {', '.join(COLUMNS)} FROM {TABLE} WHERE feedback IS NOT NULL")]
+    finally:
+        conn.close()
+
+
+def load_feedback(path: str) -> Dict[str, np.ndarray]:
+    """
+    Load feedback rows (CSV with header, JSON lines, SQL dump or SQLite database) into float arrays.
+
+    Rows without feedback are skipped. NULL values become NaN.
+    """
+    with open(path, 'rb') as f:
+        head = f.read(4096)
+    first = head.decode('utf-8', 'replace').lstrip()
+    if head.startswith(SQLITE_MAGIC):
+        rows = load_sqlite(path)
+    elif path.endswith('.sql') or re.match(r'(--|/\*|SET |COPY |INSERT |CREATE |BEGIN)', first, re.I):
+        rows = load_sql_dump(path)
+    else:
+        with open(path, newline='', encoding='utf-8') as f:
+            if first.startswith('{'):
+                rows = [json.loads(line) for line in f if line.strip()]
+            else:
+                rows = list(csv.DictReader(f))
+
+    missing = [c for c in COLUMNS if rows and c not in rows[0]]
+    if missing:
+        raise ValueError(f"Missing column(s) in {path}: {', '.join(missing)}")
+
+    data = {c: np.array([_to_float(row.get(c)) for row in rows], dtype=np.float64) for c in COLUMNS}
+    keep = ~np.isnan(data['feedback'])
+    return {c: values[keep] for c, values in data.items()}
+
+
+def true_wmo(data: Dict[str, np.ndarray]) -> np.ndarray:
+    """Return the confirmed (or user-corrected) WMO code per row, NaN if unknown."""
+    return np.where(data['feedback'] == 1.0, data['wmo_code'], data['feedback_correct_wmo'])
+
+
+def _grid(values: np.ndarray, step: float, margin: float) -> np.ndarray:
+    """Candidate thresholds covering the observed values."""
+    values = values[~np.isnan(values)]
+    low = np.floor((values.min() - margin) / step) * step
+    high = np.ceil((values.max() + margin) / step) * step
+    return np.arange(low, high + step / 2, step)
+
+
+def _closest_best(score: np.ndarray, grids: Tuple[np.ndarray, ...], current: Tuple[float, ...]) -> Tuple:
+    """Index of the best score; ties resolved by L1 distance to current values."""
+    best = np.nanmax(score)
+    distance = sum(
+        np.abs(grid - value).reshape([-1 if i == axis else 1 for i in range(len(grids))])
+        for axis, (grid, value) in enumerate(zip(grids, current))
+    )
+    distance = np.where(score == best, distance, np.inf)
+    return np.unravel_index(np.argmin(distance), score.shape)
+
+
+def calibrate_clouds(data: Dict[str, np.ndarray], step: float = 0.5) -> Dict:
+    """
+    Grid-search the clear / mostly_clear / partly_cloudy delta thresholds.
+
+    Class k (WMO k) is predicted for t_k < delta <= t_(k-1); WMO 3 for
+    delta <= t_2. With G_k(t) = #{rows of class k with delta > t}:
+
+        correct = G_0(t0) + G_1(t1) - G_1(t0) + G_2(t2) - G_2(t1) + N_3 - G_3(t2)
+    """
+    wmo = true_wmo(data)
+    delta = data['delta_c']
+    mask = np.isin(wmo, CLOUD_CODES) & ~np.isnan(delta)
+    wmo, delta = wmo[mask], delta[mask]
+    n = len(delta)
+    current = tuple(float(config.THRESHOLDS[k]) for k in CLOUD_KEYS)
+
+    if n == 0:
+        return {'rows': 0, 'current': dict(zip(CLOUD_KEYS, current)), 'candidate': None}
+
+    grid = _grid(delta, step, margin=step)
+
+    # G[k, j] = number of class-k rows with delta > grid[j] (vectorised over rows and grid)
+    above = delta[None, :] > grid[:, None]                      # (grid, rows)
+    onehot = (wmo[None, :] == np.array(CLOUD_CODES)[:, None])  # (4, rows)
+    G = onehot.astype(np.int64) @ above.T.astype(np.int64)      # (4, grid)
+    n3 = onehot[3].sum()
+
+    t0 = G[0][:, None, None] - G[1][:, None, None]
+    t1 = G[1][None, :, None] - G[2][None, :, None]
+    t2 = G[2][None, None, :] - G[3][None, None, :]
+    correct = (t0 + t1 + t2 + n3).astype(np.float64)
+
+    # Only strictly ordered thresholds are valid: t0 > t1 > t2
+    i, j, k = np.ix_(np.arange(len(grid)), np.arange(len(grid)), np.arange(len(grid)))
+    correct[~((i > j) & (j > k))] = np.nan
+
+    best = _closest_best(correct, (grid, grid, grid), current)
+    candidate = tuple(float(grid[b]) for b in best)
+
+    def accuracy(t: Tuple[float, float, float]) -> float:
+        predicted = np.where(delta > t[0], 0, np.where(delta > t[1], 1, np.where(delta > t[2], 2, 3)))
+        return float(np.mean(predicted == wmo))
+
+    return {
+        'rows': n,
+        'current': dict(zip(CLOUD_KEYS, current)),
+        'current_accuracy': accuracy(current),
+        'candidate': dict(zip(CLOUD_KEYS, candidate)),
+        'candidate_accuracy': float(correct[best]) / n,
+    }
+
+
+def calibrate_rain(data: Dict[str, np.ndarray], step: float = 10.0) -> Dict:
+    """Grid-search RAIN_THRESHOLD and WET_THRESHOLD (WET > RAIN) jointly."""
+    wmo = true_wmo(data)
+    freq = data['rain_freq']
+    precip = np.nan_to_num(data['precip_rate_mm']) > 0
+    mask = ~np.isnan(wmo) & ~np.isnan(freq)
+    wmo, freq, precip = wmo[mask], freq[mask], precip[mask]
+    n = len(freq)
+    current = (float(config.RAIN_THRESHOLD), float(config.WET_THRESHOLD))
+
+    if n == 0:
+        return {'rows': 0, 'current': dict(zip(('rain', 'wet'), current)), 'candidate': None}
+
+    is_precip = ((wmo >= 50) & (wmo < 100))
+    is_wet = is_precip | np.isin(wmo, FOG_MIST_CODES)
+
+    grid = _grid(freq, step, margin=step)
+    below = freq[None, :] < grid[:, None]                        # (grid, rows)
+
+    # Rain: precipitation predicted if tipping bucket OR capacitive sensor
+    rain_correct = ((below | precip[None, :]) == is_precip[None, :]).sum(axis=1)
+    wet_correct = (below == is_wet[None, :]).sum(axis=1)
+
+    score = (rain_correct[:, None] + wet_correct[None, :]).astype(np.float64)
+    score[~(grid[:, None] < grid[None, :])] = np.nan             # WET_THRESHOLD > RAIN_THRESHOLD
+
+    best = _closest_best(score, (grid, grid), current)
+    candidate = (float(grid[best[0]]), float(grid[best[1]]))
+
+    def accuracy(rain_t: float, wet_t: float) -> Tuple[float, float]:
+        rain_ok = np.mean(((freq < rain_t) | precip) == is_precip)
+        wet_ok = np.mean((freq < wet_t) == is_wet)
+        return float(rain_ok), float(wet_ok)
+
+    cur_rain, cur_wet = accuracy(*current)
+    return {
+        'rows': n,
+        'current': {'rain': current[0], 'wet': current[1]},
+        'current_accuracy': {'rain': cur_rain, 'wet': cur_wet},
+        'candidate': {'rain': candidate[0], 'wet': candidate[1]},
+        'candidate_accuracy': {
+            'rain': float(rain_correct[best[0]]) / n,
+            'wet': float(wet_correct[best[1]]) / n,
+        },
+    }
+
+
+def _fmt(value: float) -> str:
+    return f"{value:g}"
+
+
+def config_diff(config_path: str, clouds: Dict, rain: Dict) -> str:
+    """Return a unified diff of config.py with the candidate thresholds applied."""
+    with open(config_path, encoding='utf-8') as f:
+        original = f.read()
+    text = original
+
+    if clouds.get('candidate'):
+        thresholds = dict(config.THRESHOLDS, **clouds['candidate'])
+        # mostly_cloudy / cloudy do not map to a WMO code of their own:
+        # only move them down if needed to keep the thresholds ordered
+        previous = thresholds['partly_cloudy']
+        for key in ('mostly_cloudy', 'cloudy'):
+            if key in thresholds:
+                thresholds[key] = min(thresholds[key], previous - 1)
+                previous = thresholds[key]
+        for key, value in thresholds.items():
+            text = re.sub(rf'("{key}":\s*)[-\d.]+(,\s*# delta > )[-\d.]+',
+                          rf'\g<1>{_fmt(value)}\g<2>{_fmt(value)}', text, count=1)
+
+    if rain.get('candidate'):
+        rain_t, wet_t = rain['candidate']['rain'], rain['candidate']['wet']
+        text = re.sub(r'^(RAIN_THRESHOLD\s*=\s*)[-\d.]+', rf'\g<1>{_fmt(rain_t)}', text, count=1, flags=re.M)
+        text = re.sub(r'^(WET_THRESHOLD\s*=\s*)[-\d.]+', rf'\g<1>{_fmt(wet_t)}', text, count=1, flags=re.M)
+        # Keep the hysteresis width of the exit thresholds
+        for name, enter_old, enter_new in (
+            ('RAIN_EXIT_THRESHOLD', config.RAIN_THRESHOLD, rain_t),
+            ('WET_EXIT_THRESHOLD', config.WET_THRESHOLD, wet_t),
+        ):
+            exit_new = getattr(config, name) - enter_old + enter_new
+            text = re.sub(rf'^({name}\s*=\s*)[-\d.]+', rf'\g<1>{_fmt(exit_new)}', text, count=1, flags=re.M)
+
+    return ''.join(difflib.unified_diff(
+        original.splitlines(keepends=True), text.splitlines(keepends=True),
+        fromfile='config.py', tofile='config.py (candidate)'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Calibrate CloudWatcher thresholds from user feedback')
+    parser.add_argument('input', help='Feedback dump (CSV with header, JSON lines, SQL dump or SQLite database)')
+    parser.add_argument('--config', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.py'),
+                        help='config.py to diff against')
+    parser.add_argument('--step', type=float, default=0.5, help='Grid step for delta thresholds (°C)')
+    parser.add_argument('--freq-step', type=float, default=10.0, help='Grid step for rain frequency thresholds')
+    parser.add_argument('--min-rows', type=int, default=20, help='Minimum feedback rows per group')
+    parser.add_argument('--diff', help='Write config diff to this file instead of stdout')
+    parser.add_argument('--json', action='store_true', help='Print metrics as JSON')
+    args = parser.parse_args()
+
+    data = load_feedback(args.input)
+    clouds = calibrate_clouds(data, args.step)
+    rain = calibrate_rain(data, args.freq_step)
+
+    for name, result in (('cloud', clouds), ('rain/wet', rain)):
+        if result['rows'] < args.min_rows:
+            print(f"Not enough {name} feedback ({result['rows']} < {args.min_rows} rows), keeping current values",
+                  file=sys.stderr)
+            result['candidate'] = None
+
+    if args.json:
+        print(json.dumps({'feedback_rows': int(len(data['feedback'])), 'clouds': clouds, 'rain': rain}, indent=2))
+    else:
+        print(f"Feedback rows: {len(data['feedback'])}")
+        for name, result in (('Cloud thresholds', clouds), ('Rain/wet thresholds', rain)):
+            print(f"\n{name} ({result['rows']} rows)")
+            print(f"  current:   {result['current']}  accuracy {result.get('current_accuracy')}")
+            if result['candidate']:
+                print(f"  candidate: {result['candidate']}  accuracy {result.get('candidate_accuracy')}")
+
+    diff = config_diff(args.config, clouds, rain)
+    if not diff:
+        print("\nNo changes suggested.", file=sys.stderr)
+    elif args.diff:
+        with open(args.diff, 'w', encoding='utf-8') as f:
+            f.write(diff)
+        print(f"\nCandidate config diff written to {args.diff}")
+    elif not args.json:
+        print()
+        print(diff, end='')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""
+CloudWatcher Change Tracker (Deadband Publishing)
+Modified: 2026-10-19 - Initial creation
+Modified: 2026-10-19 - Boot id in events, changes_since() resyncs clients of a previous run
+Modified: 2026-10-19 - Subscriber queues flag dropped events (overflowed) for a resync
+
+Per-field change detection for the service snapshot.
+
+A field counts as changed only when it moves beyond its deadband
+relative to the last *published* value:
+
+    |new - old| > max(abs, rel * |old|)
+
+Fields without a deadband (flags, strings) change on any difference.
+Each accepted change gets a monotonically increasing sequence number,
+so consumers can ask "what changed since sequence N" instead of
+fetching the full snapshot every time. Sequence numbers restart at 0
+with every tracker (service restart); the random boot id in each event
+tells consumers which run a sequence number belongs to.
+
+Listeners (stream subscribers, MQTT publisher) are only called when at
+least one field changed.
+"""
+
+import logging
+import queue
+import secrets
+import threading
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Queue size per stream subscriber (slow clients drop events, see subscribe())
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class ChangeTracker:
+    """Tracks snapshot fields and emits change events beyond per-field deadbands."""
+
+    def __init__(self, deadbands: Optional[Dict[str, Dict[str, float]]] = None):
+        """
+        Initialize tracker.
+
+        Args:
+            deadbands: Mapping field -> {'abs': tolerance, 'rel': fraction}
+                       (default: config.DEADBANDS)
+        """
+        self.deadbands = deadbands if deadbands is not None else config.DEADBANDS
+        self.seq = 0
+        # Identifies this run: seq of another boot id is meaningless here
+        self.boot = secrets.token_hex(4)
+
+        # field -> (published value, seq of last change, timestamp iso)
+        self._fields: Dict[str, tuple] = {}
+        self._listeners: List[Callable[[Dict], None]] = []
+        self._lock = threading.Lock()
+
+    def _exceeds_deadband(self, field: str, old, new) -> bool:
+        """Return True if new differs from old by more than the field's deadband."""
+        if old is None or new is None or isinstance(new, bool) or isinstance(old, bool):
+            return old != new
+
+        band = self.deadbands.get(field)
+        if not band or not isinstance(new, (int, float)):
+            return old != new
+
+        tolerance = max(band.get('abs', 0.0), band.get('rel', 0.0) * abs(old))
+        return abs(new - old) > tolerance
+
+    def update(self, snapshot: Dict, now: Optional[datetime] = None) -> Optional[Dict]:
+        """
+        Compare a snapshot against the published values.
+
+        Args:
+            snapshot: Flat dict field -> value
+            now: Timestamp of the snapshot (default: current UTC time)
+
+        Returns:
+            Change event {'boot', 'seq', 'timestamp', 'changes'} or None if nothing moved
+            beyond its deadband
+        """
+        now = now or datetime.now(timezone.utc)
+        timestamp = now.isoformat()
+        changes = {}
+
+        with self._lock:
+            for field, value in snapshot.items():
+                known = self._fields.get(field)
+                if known is not None and not self._exceeds_deadband(field, known[0], value):
+                    continue
+                changes[field] = value
+
+            if not changes:
+                return None
+
+            self.seq += 1
+            for field, value in changes.items():
+                self._fields[field] = (value, self.seq, timestamp)
+
+            event = {'boot': self.boot, 'seq': self.seq, 'timestamp': timestamp, 'changes': changes}
+            listeners = list(self._listeners)
+
+        logger.debug(f"Change #{event['seq']}: {sorted(changes)}")
+
+        for listener in listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                logger.warning(f"Change listener failed: {e}")
+
+        return event
+
+    def changes_since(self, since: int, boot: Optional[str] = None) -> Dict:
+        """
+        Return all fields changed after sequence number `since`.
+
+        For `since` 0, a `since` ahead of the current sequence or one of
+        another boot id (the service was restarted), the full snapshot is
+        returned with 'full': True. 'timestamp' is the time of the newest included
+        change (None without changes).
+        """
+        with self._lock:
+            full = since <= 0 or since > self.seq or (boot is not None and boot != self.boot)
+            included = {
+                field: known
+                for field, known in self._fields.items()
+                if full or known[1] > since
+            }
+            newest = max(included.values(), key=lambda known: known[1], default=None)
+            return {
+                'boot': self.boot,
+                'seq': self.seq,
+                'since': since,
+                'full': full,
+                'timestamp': newest[2] if newest else None,
+                'changes': {field: value for field, (value, _, _) in included.items()},
+            }
+
+    def get_snapshot(self) -> Dict:
+        """Return the currently published values of all fields."""
+        with self._lock:
+            return {field: value for field, (value, _, _) in self._fields.items()}
+
+    def add_listener(self, callback: Callable[[Dict], None]):
+        """Register a callback called with each change event."""
+        with self._lock:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[Dict], None]):
+        """Unregister a change callback."""
+        with self._lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def subscribe(self) -> queue.Queue:
+        """
+        Create a queue receiving all future change events (for streaming).
+
+        Events are dropped for a subscriber whose queue is full, so a stalled
+        client never blocks the reader loop; the queue's `overflowed` is then
+        set and the consumer must resync with changes_since(). Call
+        unsubscribe() when done.
+        """
+        q = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        q.overflowed = False
+
+        def _put(event: Dict, q=q):
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                q.overflowed = True
+
+        q.listener = _put
+        self.add_listener(_put)
+        return q
+
+    def unsubscribe(self, q: queue.Queue):
+        """Remove a subscriber queue created by subscribe()."""
+        listener = getattr(q, 'listener', None)
+        if listener:
+            self.remove_listener(listener)
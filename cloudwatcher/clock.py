@@ -0,0 +1,72 @@
+"""
+CloudWatcher Clock
+Modified: 2026-10-19 - Initial creation
+Modified: 2026-10-19 - wait() (interruptible sleep for the adaptive read cadence)
+
+Time source shared by a device, its HeatingController and its reader.
+
+- SystemClock: wall clock (normal operation)
+- VirtualClock: starts at a recorded timestamp and runs `speed` times
+  faster than real time (replay/load testing, see replay_reader.py).
+  sleep() is shortened accordingly, so READ_INTERVAL, impulse timing,
+  dwell times and staleness all scale together.
+"""
+
+import threading
+import time
+from datetime import datetime, timezone
+
+# Allowed replay speed range
+MIN_SPEED = 1.0
+MAX_SPEED = 1000.0
+
+
+class SystemClock:
+    """Wall clock."""
+
+    speed = 1.0
+
+    def time(self) -> float:
+        """Current UTC epoch seconds."""
+        return time.time()
+
+    def now(self) -> datetime:
+        """Current time as timezone-aware UTC datetime."""
+        return datetime.now(timezone.utc)
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds)
+
+    def wait(self, event: threading.Event, seconds: float) -> bool:
+        """Sleep until the event is set or the time has passed; True if woken by the event."""
+        return event.wait(seconds / self.speed)
+
+
+class VirtualClock(SystemClock):
+    """Clock starting at `start` and running `speed` times faster than real time."""
+
+    def __init__(self, start: float, speed: float = 1.0):
+        """
+        Initialize virtual clock.
+
+        Args:
+            start: Virtual UTC epoch seconds at creation
+            speed: Speed multiplier (MIN_SPEED .. MAX_SPEED)
+        """
+        if not MIN_SPEED <= speed <= MAX_SPEED:
+            raise ValueError(f"Speed {speed} outside {MIN_SPEED:g}..{MAX_SPEED:g}")
+        self.start = start
+        self.speed = speed
+        self._origin = time.monotonic()
+
+    def time(self) -> float:
+        return self.start + (time.monotonic() - self._origin) * self.speed
+
+    def now(self) -> datetime:
+        return datetime.fromtimestamp(self.time(), timezone.utc)
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds / self.speed)
+
+
+SYSTEM_CLOCK = SystemClock()
@@ -6,6 +6,14 @@ Modified: 2026-02-03 14:00 - Added heater PWM reading (Q! command) for rain dete
 Modified: 2026-02-04 19:15 - Added rain sensor temperature (Type 5) for heater control loop
 Modified: 2026-02-04 20:45 - Added set_pwm() method for heater control
 Modified: 2026-02-04 20:55 - Fixed set_pwm() response parsing (device responds with Q, not P)
+Modified: 2026-10-19 - Robust sample filters (filters.py) with outlier telemetry
+Modified: 2026-10-19 - Added read_errors() (D!), read_switch() (F!) and link statistics
+Modified: 2026-10-19 - Port-open delay configurable (SERIAL_OPEN_DELAY)
+Modified: 2026-10-19 - set_pwm() keeps the echoed value, Q! in read_all() only on request
+Modified: 2026-10-19 - Serial lock: commands from several threads (rain fast path) are serialized
+Modified: 2026-10-19 - read_all() returns a slotted Reading record (records.py)
+Modified: 2026-10-19 - close() retires the reader: no reconnect afterwards, read_all() raises WorkerRetired
+Modified: 2026-10-19 - set_pwm() timeout for the port lock (watchdog safe PWM)
 
 Handles serial communication with AAG CloudWatcher sensor.
 Protocol based on RS232_Comms_v100 through v140 documentation.
@@ -21,11 +29,17 @@ Ambient temperature must be obtained from external source (e.g., PWS).
 
 import serial
 import math
+import threading
 import time
 import logging
+from collections import deque
+from datetime import datetime, timezone
 from typing import Optional, Dict, List, Tuple
 
 import config
+from filters import apply_filter
+from records import Reading
+from watchdog import WorkerRetired
 
 logger = logging.getLogger(__name__)
 
@@ -46,6 +60,17 @@ ABS_ZERO = 273.15           # Absolute zero in Kelvin
 PWM_MIN = 0
 PWM_MAX = 1023
 
+# Internal error counters returned by D! (block type -> name)
+ERROR_COUNTERS = {
+    'E1': 'first_address_byte',
+    'E2': 'command_byte',
+    'E3': 'second_address_byte',
+    'E4': 'pec_byte',
+}
+
+# Number of incomplete-response events kept for diagnostics
+MAX_LINK_EVENTS = 200
+
 
 class CloudWatcherReader:
     """Handles RS232 communication with AAG CloudWatcher sensor."""
@@ -54,6 +79,24 @@ class CloudWatcherReader:
         self.port = port or config.SERIAL_PORT
         self.baudrate = baudrate or config.BAUDRATE
         self.serial: Optional[serial.Serial] = None
+
+        # Outlier telemetry per channel: {'samples': n, 'rejected': n} since start
+        self.filter_stats: Dict[str, Dict[str, int]] = {}
+        self._last_rejected: Dict[str, int] = {}
+
+        # Serial link statistics (for diagnostics.py)
+        self.link_stats: Dict[str, int] = {'commands': 0, 'incomplete': 0, 'serial_errors': 0}
+        self.link_events: deque = deque(maxlen=MAX_LINK_EVENTS)
+
+        # PWM value echoed by the device on the last acknowledged set_pwm()
+        self.last_pwm_ack: Optional[int] = None
+
+        # Serializes command/response pairs (device thread and rain fast path)
+        self._lock = threading.RLock()
+
+        # Set by close(): the reader was retired (watchdog restart) and must not reopen the port
+        self.closed = False
+
         self._connect()
 
     def _connect(self) -> bool:
@@ -68,7 +111,7 @@ class CloudWatcherReader:
                 timeout=2.0
             )
             # Wait after port open (recommended in v130 for pocketCW compatibility)
-            time.sleep(2)
+            time.sleep(config.SERIAL_OPEN_DELAY)
             logger.info(f"Connected to CloudWatcher on {self.port} @ {self.baudrate} baud")
             return True
         except serial.SerialException as e:
@@ -78,18 +121,43 @@ class CloudWatcherReader:
 
     def _reconnect(self) -> bool:
         """Attempt to reconnect after connection loss."""
-        self.close()
+        self._close_port()
         time.sleep(1)
         return self._connect()
 
     def close(self):
-        """Close serial connection."""
+        """
+        Close the serial connection for good.
+
+        Commands still running in another thread (a hung read_all() of a
+        replaced worker) fail instead of reopening the port, which the new
+        worker's reader owns.
+        """
+        self.closed = True
+        self._close_port()
+
+    def _close_port(self):
         if self.serial and self.serial.is_open:
             self.serial.close()
             logger.info("Serial connection closed")
 
-    def _send_command(self, cmd: str) -> Optional[bytes]:
-        """Send command and receive response."""
+    def _send_command(self, cmd: str, timeout: float = None) -> Optional[bytes]:
+        """
+        Send command and receive response (one command at a time across threads).
+
+        With a timeout, returns None if another thread holds the port longer.
+        """
+        if not self._lock.acquire(timeout=-1 if timeout is None else timeout):
+            logger.warning(f"Serial port busy, {cmd} not sent")
+            return None
+        try:
+            return self._send_command_locked(cmd)
+        finally:
+            self._lock.release()
+
+    def _send_command_locked(self, cmd: str) -> Optional[bytes]:
+        if self.closed:
+            return None
         if not self.serial or not self.serial.is_open:
             if not self._reconnect():
                 return None
@@ -109,17 +177,30 @@ class CloudWatcherReader:
 
             # Read response
             response = self.serial.read(expected_bytes)
+            self.link_stats['commands'] += 1
 
             if len(response) < expected_bytes:
                 logger.warning(f"Incomplete response for {cmd}: got {len(response)}/{expected_bytes} bytes")
+                self._record_link_event('incomplete', cmd, f"{len(response)}/{expected_bytes} bytes")
                 return None
 
             return response
 
         except serial.SerialException as e:
             logger.error(f"Serial error during command {cmd}: {e}")
+            self._record_link_event('serial_errors', cmd, str(e))
             return None
 
+    def _record_link_event(self, kind: str, cmd: str, detail: str):
+        """Count a failed command and remember it for diagnostics."""
+        self.link_stats[kind] += 1
+        self.link_events.append({
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'kind': kind,
+            'command': cmd,
+            'detail': detail,
+        })
+
     def _get_expected_blocks(self, cmd: str) -> int:
         """Return expected number of 15-byte blocks for a command."""
         # Handle Pxxxx! commands (PWM set)
@@ -170,26 +251,23 @@ class CloudWatcherReader:
 
         return result
 
-    def _filtered_average(self, values: List[float]) -> float:
-        """Calculate average excluding outliers (outside 1 std dev)."""
-        if not values:
-            return 0.0
-
-        avg = sum(values) / len(values)
-
-        if len(values) < 3:
-            return avg
-
-        std = (sum((x - avg) ** 2 for x in values) / len(values)) ** 0.5
+    def _filtered_average(self, values: List[float], channel: str = None) -> float:
+        """
+        Combine samples with the configured robust filter (config.FILTER_METHOD).
 
-        if std == 0:
-            return avg
+        Rejected samples are counted per channel in filter_stats.
+        """
+        result = apply_filter(values, config.FILTER_METHOD, config.FILTER_PARAM)
 
-        filtered = [x for x in values if avg - std <= x <= avg + std]
+        if channel and values:
+            stats = self.filter_stats.setdefault(channel, {'samples': 0, 'rejected': 0})
+            stats['samples'] += len(values)
+            stats['rejected'] += result.rejected
+            self._last_rejected[channel] = result.rejected
+            if result.rejected:
+                logger.debug(f"Filter {config.FILTER_METHOD}: rejected {result.rejected}/{len(values)} {channel} samples")
 
-        if filtered:
-            return sum(filtered) / len(filtered)
-        return avg
+        return result.value
 
     def _calc_mpsas(self, raw_period: int, ambient_temp_c: float = 10.0) -> Optional[float]:
         """
@@ -324,7 +402,7 @@ class CloudWatcherReader:
                 pass
         return None
 
-    def set_pwm(self, value: int) -> bool:
+    def set_pwm(self, value: int, timeout: float = None) -> bool:
         """
         Set heater PWM duty cycle.
 
@@ -333,6 +411,7 @@ class CloudWatcherReader:
 
         Args:
             value: PWM value 0-1023
+            timeout: Seconds to wait for a port held by another thread (default: no limit)
 
         Returns:
             True if command was acknowledged, False otherwise
@@ -343,7 +422,7 @@ class CloudWatcherReader:
         # Format command: Pxxxx! (4-digit zero-padded)
         cmd = f"P{value:04d}!"
 
-        response = self._send_command(cmd)
+        response = self._send_command(cmd, timeout)
         if not response:
             logger.error(f"No response to PWM command {cmd}")
             return False
@@ -354,6 +433,7 @@ class CloudWatcherReader:
         if 'Q' in parsed:
             try:
                 ack_value = int(parsed['Q'])
+                self.last_pwm_ack = ack_value
                 if ack_value == value:
                     logger.debug(f"PWM set to {value}")
                     return True
@@ -365,6 +445,50 @@ class CloudWatcherReader:
 
         return False
 
+    def read_errors(self) -> Optional[Dict[str, int]]:
+        """
+        Read internal communication error counters (D! command).
+
+        Response blocks use two-character types: !E1 .. !E4
+        (1st address byte, command byte, 2nd address byte, PEC byte errors).
+        The counters are cumulative since device power-up.
+        """
+        response = self._send_command('D!')
+        if not response:
+            return None
+
+        errors = {}
+        for i in range(len(response) // BLOCK_SIZE):
+            block = response[i * BLOCK_SIZE:(i + 1) * BLOCK_SIZE]
+            if block[0] != ord('!'):
+                continue
+            type_code = block[1:3].decode('ascii', errors='ignore')
+            if type_code in ERROR_COUNTERS:
+                try:
+                    errors[ERROR_COUNTERS[type_code]] = int(block[3:15].decode('ascii', errors='ignore').strip())
+                except ValueError:
+                    logger.warning(f"Invalid error counter {type_code}: {block!r}")
+
+        return errors if errors else None
+
+    def read_switch(self) -> Optional[str]:
+        """
+        Read switch status (F! command).
+
+        Returns:
+            'open' (!X), 'closed' (!Y) or None if unavailable
+        """
+        response = self._send_command('F!')
+        if not response:
+            return None
+
+        parsed = self._parse_response(response)
+        if 'X' in parsed:
+            return 'open'
+        if 'Y' in parsed:
+            return 'closed'
+        return None
+
     def read_device_info(self) -> Dict:
         """Read device name and firmware version."""
         info = {}
@@ -387,30 +511,42 @@ class CloudWatcherReader:
 
         return info
 
-    def read_all(self, num_samples: int = 5) -> Optional[Dict]:
+    def read_all(self, num_samples: int = None, include_pwm: bool = True) -> Optional[Reading]:
         """
         Read all sensor values with statistical filtering.
 
+        Args:
+            num_samples: Samples per channel (default: config.READ_SAMPLES)
+            include_pwm: Read heater PWM with Q! (once per call; the heater
+                actuator only requests it for verification)
+
         Returns:
+            Reading (fields not measured in this call are None), None without sky data:
             sky_temp_c: IR sky temperature in °C
             rain_freq: Rain sensor frequency (higher = drier)
             is_raining: True if rain_freq < RAIN_THRESHOLD
             is_wet: True if rain_freq < WET_THRESHOLD
-            heater_pwm: Heater duty cycle 0-1023
+            heater_pwm: Heater duty cycle 0-1023 (only if include_pwm)
             rain_sensor_temp_c: Rain sensor NTC temperature in °C (for heater control)
             light_sensor_raw: Raw period from new light sensor
             mpsas: Sky quality in mag/arcsec² (if light sensor present)
             is_daylight: True if light level indicates daylight
+            filter_stats: Rejected samples per channel in this read
 
         Note: ambient_temp_c is NOT included - must be obtained from PWS.
+
+        Raises:
+            WorkerRetired: The reader was closed during the read (worker replaced)
         """
         sky_temps = []
         rain_freqs = []
         light_raws = []
-        pwm_values = []
         rain_sensor_temps = []
+        self._last_rejected = {}
 
-        for _ in range(num_samples):
+        for _ in range(num_samples or config.READ_SAMPLES):
+            if self.closed:
+                raise WorkerRetired("Reader closed during read_all()")
             # Sky temperature
             sky = self.read_sky_temp()
             if sky is not None:
@@ -429,53 +565,52 @@ class CloudWatcherReader:
             if rain is not None:
                 rain_freqs.append(rain)
 
-            # Heater PWM
-            pwm = self.read_pwm()
-            if pwm is not None:
-                pwm_values.append(pwm)
-
             time.sleep(0.1)  # Small delay between samples
 
+        if self.closed:
+            raise WorkerRetired("Reader closed during read_all()")
+
         # Check if we got enough data
         if not sky_temps:
             logger.warning("No sky temperature data collected")
             return None
 
         # Calculate filtered averages
-        sky_temp = self._filtered_average(sky_temps)
+        sky_temp = self._filtered_average(sky_temps, 'sky_temp_c')
 
-        result = {
-            'sky_temp_c': round(sky_temp, 2),
-        }
+        result = Reading(sky_temp_c=round(sky_temp, 2))
 
         # Rain sensor (Type C thresholds: Dry > 2100, Wet = 1700-2100, Rain < 1700)
         if rain_freqs:
-            rain_freq = int(self._filtered_average(rain_freqs))
-            result['rain_freq'] = rain_freq
-            result['is_raining'] = rain_freq < config.RAIN_THRESHOLD
-            result['is_wet'] = rain_freq < config.WET_THRESHOLD
+            rain_freq = int(self._filtered_average(rain_freqs, 'rain_freq'))
+            result.rain_freq = rain_freq
+            result.is_raining = rain_freq < config.RAIN_THRESHOLD
+            result.is_wet = rain_freq < config.WET_THRESHOLD
 
-        # Heater PWM (0-1023 raw value)
-        if pwm_values:
-            result['heater_pwm'] = int(self._filtered_average(pwm_values))
+        # Heater PWM (0-1023 raw value) - a set point, one read is enough
+        if include_pwm:
+            pwm = self.read_pwm()
+            result.heater_pwm = pwm
 
         # Rain sensor temperature (for heater control feedback loop)
         if rain_sensor_temps:
-            result['rain_sensor_temp_c'] = round(self._filtered_average(rain_sensor_temps), 2)
+            result.rain_sensor_temp_c = round(self._filtered_average(rain_sensor_temps, 'rain_sensor_temp_c'), 2)
 
         # Light sensor (MPSAS)
         if light_raws:
-            light_raw = int(self._filtered_average(light_raws))
-            result['light_sensor_raw'] = light_raw
+            light_raw = int(self._filtered_average(light_raws, 'light_sensor_raw'))
+            result.light_sensor_raw = light_raw
 
             # Calculate MPSAS (use default temp since we don't have ambient)
             mpsas = self._calc_mpsas(light_raw)
             if mpsas is not None:
-                result['mpsas'] = mpsas
+                result.mpsas = mpsas
                 # Daylight detection based on MPSAS
                 # < 10 MPSAS = very bright (daylight)
                 # > 18 MPSAS = dark (night)
-                result['is_daylight'] = mpsas < config.MPSAS_DAYLIGHT_THRESHOLD
+                result.is_daylight = mpsas < config.MPSAS_DAYLIGHT_THRESHOLD
+
+        result.filter_stats = dict(self._last_rejected)
 
         return result
 
@@ -487,17 +622,20 @@ class DummyCloudWatcherReader:
     def __init__(self, port: str = None, baudrate: int = None):
         logger.info("Using DummyCloudWatcherReader (no hardware)")
         self._pwm = 0
+        self._rain_freq = 2800
+        self.last_pwm_ack: Optional[int] = None
 
     def close(self):
         pass
 
-    def set_pwm(self, value: int) -> bool:
+    def set_pwm(self, value: int, timeout: float = None) -> bool:
         """Simulate PWM setting."""
         self._pwm = max(0, min(1023, value))
+        self.last_pwm_ack = self._pwm
         logger.debug(f"Dummy: PWM set to {self._pwm}")
         return True
 
-    def read_all(self, num_samples: int = 5) -> Dict:
+    def read_all(self, num_samples: int = None, include_pwm: bool = True) -> Reading:
         """Return simulated data."""
         import random
 
@@ -507,17 +645,30 @@ class DummyCloudWatcherReader:
         # Rain sensor temp slightly above ambient (heated)
         rain_sensor_temp = random.uniform(10, 25)
 
-        return {
-            'sky_temp_c': round(sky, 2),
-            'rain_freq': rain_freq,
-            'is_raining': rain_freq < 1700,
-            'is_wet': rain_freq < 2100,
-            'heater_pwm': self._pwm,
-            'rain_sensor_temp_c': round(rain_sensor_temp, 2),
-            'light_sensor_raw': random.randint(10, 1000),
-            'mpsas': round(mpsas, 2),
-            'is_daylight': mpsas < 10,
-        }
+        return Reading(
+            sky_temp_c=round(sky, 2),
+            rain_freq=rain_freq,
+            is_raining=rain_freq < 1700,
+            is_wet=rain_freq < 2100,
+            heater_pwm=self._pwm if include_pwm else None,
+            rain_sensor_temp_c=round(rain_sensor_temp, 2),
+            light_sensor_raw=random.randint(10, 1000),
+            mpsas=round(mpsas, 2),
+            is_daylight=mpsas < 10,
+        )
+
+    def read_rain_freq(self) -> int:
+        """Simulate a slowly drifting dry rain sensor."""
+        import random
+
+        self._rain_freq = max(2200, min(3400, self._rain_freq + random.randint(-10, 10)))
+        return self._rain_freq
+
+    def read_errors(self) -> Dict[str, int]:
+        return {name: 0 for name in ERROR_COUNTERS.values()}
+
+    def read_switch(self) -> str:
+        return 'closed'
 
     def read_device_info(self) -> Dict:
         return {'name': 'DummyCloudWatcher', 'firmware': '0.0.0'}
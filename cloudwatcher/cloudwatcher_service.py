@@ -7,11 +7,57 @@ Modified: 2026-02-04 19:20 - Added rain_sensor_temp_c for heater control feedbac
 Modified: 2026-02-04 20:55 - Added heater control with ESP ambient temperature
 Modified: 2026-02-04 21:00 - BUGFIX: Impulse heating only when WET
 Modified: 2026-02-05 - Fetch both ESP sensors (shadow + sun)
+Modified: 2026-10-19 - Debounced rain/wet/daylight flags, /api/transitions
+Modified: 2026-10-19 - Deadband change detection, /api/changes and /api/stream
+Modified: 2026-10-19 - Native MQTT publisher with persistent connection
+Modified: 2026-10-19 - Device diagnostics poller (D!/F!), /api/diagnostics
+Modified: 2026-10-19 - Multi-device support (device.py), per-device routes, /api/devices
+Modified: 2026-10-19 - History store and downsampled /api/history
+Modified: 2026-10-19 - Fast startup: snapshot restore, no startup sleep, systemd READY=1
+Modified: 2026-10-19 - Live config reload, active config version in /api/raw
+Modified: 2026-10-19 - Rain-onset fast path events in /api/transitions
+Modified: 2026-10-19 - Streaming history export (Arrow/Parquet/CSV) at /api/export
+Modified: 2026-10-19 - Incremental rollup tiers, /api/rollups
+Modified: 2026-10-19 - Replay of recorded sessions (--replay FILE --speed N)
+Modified: 2026-10-19 - Trends and nowcast at /api/trends
+Modified: 2026-10-19 - Reader watchdog (stage budgets, safe heater PWM, worker restart, systemd WATCHDOG=1)
+Modified: 2026-10-19 - Cursor-based replication feed at /api/feed
+Modified: 2026-10-19 - MessagePack/CBOR content negotiation, schema header, cacheable /api/config
+Modified: 2026-10-19 - Dashboard reads typed Reading records
+Modified: 2026-10-19 - Sampling profiler at /debug/profile
+Modified: 2026-10-19 - Raw rollup tier derives sky_delta_c from the fused ambient like the stored tiers
+Modified: 2026-10-19 - Replay isolated from live data (in-memory history, no snapshot files, no MQTT)
+Modified: 2026-10-19 - /api/config ETag per negotiated wire format
+Modified: 2026-10-19 - Stream event ids carry the boot id, resume after a restart sends a full snapshot
+Modified: 2026-10-19 - Stream resyncs a client that fell behind (dropped events) with a catch-up frame
+Modified: 2026-10-19 - Default history/rollup/trend range ends at the device clock (replay)
 
 Flask web server providing:
 - HTML dashboard at /
 - JSON API at /api/data (for MagicMirror/Weather-Aggregator)
-- Raw debug data at /api/raw
+- Raw debug data at /api/raw, static device/threshold config at /api/config
+- MessagePack/CBOR instead of JSON via Accept or ?format= (wire_format.py)
+- Flag transition events at /api/transitions
+- Changed fields since sequence N at /api/changes, push stream at /api/stream
+- Device error counters and serial link statistics at /api/diagnostics
+- Downsampled history (LTTB / min-max) at /api/history
+- Bulk history export (Arrow IPC / Parquet / CSV, streamed) at /api/export
+- Replication feed with resumable cursors (catch-up after consumer outages) at /api/feed
+- Multi-resolution aggregates (1 min / 10 min / 1 h) at /api/rollups
+- Channel trends, time-to-threshold estimates and nowcast at /api/trends
+- MQTT publishing of changes and flag transitions (optional, MQTT_ENABLED)
+- Live reload of tuning values in config.py (CONFIG_RELOAD_ENABLED)
+- Watchdog for stalled device I/O (WATCHDOG_ENABLED, feeds systemd WatchdogSec)
+- On-demand sampling profiler at /debug/profile (PROFILE_ENABLED, collapsed stacks)
+
+Multiple CloudWatcher units (config.DEVICES) are served under
+/api/<device>/..., the legacy routes above serve the default device,
+/api/devices aggregates all units.
+
+Startup: the last snapshot of every device is restored before the web
+server binds, the serial ports are opened in the device threads. READY=1
+is sent to systemd as soon as the server socket is bound; devices report
+quality 'warming' until their first live reading.
 
 Heater control:
 - Fetches ambient temperature from ESP sensor (Temp2IoT)
@@ -19,18 +65,27 @@ Heater control:
 - Uses manufacturer/INDI default parameters
 """
 
-import threading
+import hashlib
+import hmac
 import time
 import logging
-import urllib.request
+import queue
 import json
+import signal
 from datetime import datetime, timezone
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple
 
-from flask import Flask, jsonify, render_template
+from flask import Flask, Response, abort, jsonify, render_template, request
+from werkzeug.serving import make_server
 
 import config
-from heating_controller import HeatingController
+from device import EMPTY_READING, CloudWatcherDevice, load_device_configs
+from config_reload import ConfigWatcher
+from history_store import HistoryStore
+from rollups import RollupStore, derive_values
+from watchdog import Watchdog
+import wire_format
+import systemd_notify
 
 # Configure logging
 logging.basicConfig(
@@ -42,169 +97,116 @@ logger = logging.getLogger(__name__)
 # Flask app
 app = Flask(__name__)
 
-# Global data cache (thread-safe via GIL for simple operations)
-data_cache: Dict = {
-    'timestamp': None,
-    'data': None,
-    'raw_samples': None,
-    'device_info': None,
-    'error': None,
-    'heater_status': None,
-    'esp_temp_shadow': None,  # ESP ambient temp (shadow sensor) - used for heater control
-    'esp_temp_sun': None,     # ESP ambient temp (sun sensor)
-}
 start_time = datetime.now(timezone.utc)
 
-# Reader instance (initialized in main)
-reader = None
-heater_controller = None
+# Device registry (initialized in main)
+devices: Dict[str, CloudWatcherDevice] = {}
+default_device: Optional[str] = None
+history_store: Optional[HistoryStore] = None
+rollup_store: Optional[RollupStore] = None
+mqtt_publisher = None
+config_watcher: Optional[ConfigWatcher] = None
+watchdog: Optional[Watchdog] = None
 USE_DUMMY = False  # Set to True for testing without hardware
 
 
-def fetch_esp_temps() -> tuple[Optional[float], Optional[float]]:
-    """
-    Fetch ambient temperatures from ESP sensor (Temp2IoT).
+def get_device(name: Optional[str] = None) -> CloudWatcherDevice:
+    """Return device by name (default device if None), 404 if unknown."""
+    device = devices.get(name or default_device)
+    if device is None:
+        abort(404, description=f"Unknown device '{name}'")
+    return device
 
-    Returns:
-        Tuple of (shadow_temp, sun_temp) in °C, or (None, None) if unavailable
-    """
-    try:
-        req = urllib.request.Request(config.ESP_URL)
-        with urllib.request.urlopen(req, timeout=config.ESP_TIMEOUT) as response:
-            data = json.loads(response.read().decode('utf-8'))
-
-        shadow_temp = None
-        sun_temp = None
-
-        # Find both sensors in the response
-        for sensor in data.get('sensors', []):
-            name = sensor.get('name')
-            if name == config.ESP_SENSOR_NAME_SHADOW:
-                shadow_temp = float(sensor.get('value'))
-            elif name == config.ESP_SENSOR_NAME_SUN:
-                sun_temp = float(sensor.get('value'))
-
-        if shadow_temp is None:
-            logger.warning(f"Sensor '{config.ESP_SENSOR_NAME_SHADOW}' not found in ESP response")
-        if sun_temp is None:
-            logger.warning(f"Sensor '{config.ESP_SENSOR_NAME_SUN}' not found in ESP response")
-
-        return shadow_temp, sun_temp
-
-    except urllib.error.URLError as e:
-        logger.warning(f"ESP fetch failed: {e}")
-        return None, None
-    except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
-        logger.warning(f"ESP parse error: {e}")
-        return None, None
 
+def get_uptime_s() -> int:
+    return int((datetime.now(timezone.utc) - start_time).total_seconds())
 
-def get_data_quality() -> str:
-    """Determine data quality based on age."""
-    if data_cache['error']:
-        return 'error'
-    if data_cache['timestamp'] is None:
-        return 'error'
 
-    age = (datetime.now(timezone.utc) - data_cache['timestamp']).total_seconds()
-    if age > config.STALE_THRESHOLD:
-        return 'stale'
-    return 'ok'
+def parse_time(value: Optional[str]) -> Optional[float]:
+    """Parse query time (epoch seconds or ISO 8601, naive = UTC) to epoch seconds."""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    ts = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
 
 
-def background_reader():
-    """Background thread that periodically reads sensor data and controls heater."""
-    global reader, heater_controller
+def get_time_range(now: Optional[float] = None) -> tuple[float, float]:
+    """Return (start, end) from ?start=&end= or ?hours= (default 24 h until now, e.g. the device clock)."""
+    end = parse_time(request.args.get('end')) or (time.time() if now is None else now)
+    start = parse_time(request.args.get('start'))
+    if start is None:
+        start = end - request.args.get('hours', 24, type=float) * 3600
+    return start, end
 
-    logger.info("Background reader thread started")
 
-    # Initialize reader
-    if USE_DUMMY:
-        from cloudwatcher_reader import DummyCloudWatcherReader
-        reader = DummyCloudWatcherReader()
-    else:
-        from cloudwatcher_reader import CloudWatcherReader
-        try:
-            reader = CloudWatcherReader()
-        except Exception as e:
-            logger.error(f"Failed to initialize reader: {e}")
-            logger.info("Falling back to dummy reader")
-            from cloudwatcher_reader import DummyCloudWatcherReader
-            reader = DummyCloudWatcherReader()
-
-    # Initialize heater controller if enabled
-    if config.HEATER_ENABLED:
-        heater_controller = HeatingController(
-            min_delta=config.HEATER_MIN_DELTA,
-            max_delta=config.HEATER_MAX_DELTA,
-            impulse_temp=config.HEATER_IMPULSE_TEMP,
-            impulse_duration=config.HEATER_IMPULSE_DURATION,
-            impulse_cycle=config.HEATER_IMPULSE_CYCLE,
-        )
-        logger.info("Heater controller initialized")
-    else:
-        logger.info("Heater control disabled in config")
+def respond(payload, schema: str, status: int = 200) -> Response:
+    """
+    Return payload in the negotiated format (?format= or Accept, see wire_format.py).
 
-    # Get device info once
+    Args:
+        payload: JSON-compatible payload
+        schema: Schema name for the X-CloudWatcher-Schema header
+        status: HTTP status
+    """
     try:
-        data_cache['device_info'] = reader.read_device_info()
-        logger.info(f"Device info: {data_cache['device_info']}")
-    except Exception as e:
-        logger.warning(f"Could not read device info: {e}")
+        fmt = wire_format.negotiate(request.headers.get('Accept'), request.args.get('format'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 406
+    media, headers = wire_format.schema_headers(schema, fmt)
+    if fmt == 'json':
+        response = jsonify(payload)
+        response.status_code = status
+    else:
+        response = Response(wire_format.encode(payload, fmt), status=status, mimetype=media)
+    response.headers.update(headers)
+    return response
+
+
+def static_config(dev: CloudWatcherDevice) -> Dict:
+    """Return the static device and threshold config (changes only on config reload)."""
+    return {
+        **dev.get_device_config(),
+        'read_interval': config.READ_INTERVAL,
+        'read_samples': config.READ_SAMPLES,
+        'filter_method': config.FILTER_METHOD,
+        'thresholds': config.THRESHOLDS,
+        'rain_threshold': config.RAIN_THRESHOLD,
+        'wet_threshold': config.WET_THRESHOLD,
+        'mpsas_daylight_threshold': config.MPSAS_DAYLIGHT_THRESHOLD,
+        'rain_exit_threshold': config.RAIN_EXIT_THRESHOLD,
+        'wet_exit_threshold': config.WET_EXIT_THRESHOLD,
+        'mpsas_daylight_exit_threshold': config.MPSAS_DAYLIGHT_EXIT_THRESHOLD,
+        'esp_sensor_shadow': config.ESP_SENSOR_NAME_SHADOW,
+        'esp_sensor_sun': config.ESP_SENSOR_NAME_SUN,
+    }
 
-    # Main reading and control loop
-    while True:
-        try:
-            # 1. Read all sensor data
-            data = reader.read_all()
-
-            if data:
-                data_cache['timestamp'] = datetime.now(timezone.utc)
-                data_cache['data'] = data
-                data_cache['error'] = None
-                logger.debug(f"Read data: sky={data.get('sky_temp_c')}°C, rain={data.get('rain_freq')}")
-
-                # 2. Heater control (if enabled and data available)
-                if heater_controller and 'rain_sensor_temp_c' in data:
-                    # Fetch ambient temperatures from ESP
-                    shadow_temp, sun_temp = fetch_esp_temps()
-                    data_cache['esp_temp_shadow'] = shadow_temp
-                    data_cache['esp_temp_sun'] = sun_temp
-
-                    if shadow_temp is not None:
-                        # Calculate and set PWM (using shadow sensor for heater control)
-                        pwm, reason = heater_controller.calculate_pwm(
-                            sensor_temp=data['rain_sensor_temp_c'],
-                            ambient_temp=shadow_temp,
-                            rain_freq=data.get('rain_freq'),
-                            wet_threshold=config.WET_THRESHOLD,
-                        )
-
-                        # Send PWM to device
-                        if reader.set_pwm(pwm):
-                            logger.debug(f"Heater PWM={pwm}, reason={reason}")
-                        else:
-                            logger.warning(f"Failed to set PWM to {pwm}")
-
-                        # Update cache with heater status
-                        data_cache['heater_status'] = heater_controller.get_status()
-                    else:
-                        logger.debug("No ESP shadow temp available, skipping heater control")
-            else:
-                data_cache['error'] = 'No data received'
-                logger.warning("No data received from sensor")
 
-        except Exception as e:
-            data_cache['error'] = str(e)
-            logger.error(f"Error in main loop: {e}")
+def config_etag(static: Dict, fmt: str = 'json') -> str:
+    """
+    Return the ETag of a static config block (content hash).
 
-        time.sleep(config.READ_INTERVAL)
+    MessagePack/CBOR bodies are different representations of the same
+    content, so their ETag carries the format ("<hash>-msgpack"); the JSON
+    ETag is the bare hash (config_etag in /api/raw).
+    """
+    content = json.dumps(static, sort_keys=True, default=str).encode('utf-8')
+    etag = hashlib.sha1(content).hexdigest()[:16]
+    return etag if fmt == 'json' else f"{etag}-{fmt}"
 
 
 @app.route('/')
-def dashboard():
+@app.route('/device/<device>')
+def dashboard(device=None):
     """Render HTML dashboard."""
-    data = data_cache['data'] or {}
+    dev = get_device(device)
+    data_cache = dev.data_cache
+    data = data_cache['data'] or EMPTY_READING
 
     # Format timestamp
     timestamp_str = ''
@@ -217,23 +219,30 @@ def dashboard():
 
     # Rain status
     rain_status = 'Unbekannt'
-    if 'is_raining' in data:
-        if data['is_raining']:
+    if data.is_raining is not None:
+        if data.is_raining:
             rain_status = 'Regen'
-        elif data.get('is_wet'):
+        elif data.is_wet:
             rain_status = 'Feucht'
         else:
             rain_status = 'Trocken'
 
     # Light status
     light_status = 'Unbekannt'
-    if 'is_daylight' in data:
-        light_status = 'Tag' if data['is_daylight'] else 'Nacht'
+    if data.is_daylight is not None:
+        light_status = 'Tag' if data.is_daylight else 'Nacht'
 
     # MPSAS display
     mpsas_str = '--'
-    if 'mpsas' in data:
-        mpsas_str = f"{data['mpsas']:.2f}"
+    if data.mpsas is not None:
+        mpsas_str = f"{data.mpsas:.2f}"
+
+    # Trend outlook
+    trends = dev.trends.summary
+    outlook = {'clouding_up': 'Zieht zu', 'clearing': 'Klart auf', 'steady': 'Stabil'}.get(
+        trends.get('cloud_outlook'), '--')
+    wet_in = trends.get('wet_in_min')
+    wet_in_str = f"~{wet_in:.0f} min" if wet_in is not None else '--'
 
     return render_template('dashboard.html',
         sky_temp=data.get('sky_temp_c', '--'),
@@ -246,16 +255,19 @@ def dashboard():
         ldr=mpsas_str,  # Using MPSAS instead of LDR
         ldr_label='MPSAS',  # Label for display
         light_status=light_status,
+        trend_outlook=outlook,
+        wet_in=wet_in_str,
         timestamp=timestamp_str,
         uptime=uptime_str,
-        quality=get_data_quality(),
-        device_name=data_cache.get('device_info', {}).get('name', 'Unknown'),
-        firmware=data_cache.get('device_info', {}).get('firmware', 'Unknown'),
+        quality=dev.get_data_quality(),
+        device_name=(data_cache.get('device_info') or {}).get('name', 'Unknown'),
+        firmware=(data_cache.get('device_info') or {}).get('firmware', 'Unknown'),
     )
 
 
 @app.route('/api/data')
-def api_data():
+@app.route('/api/<device>/data')
+def api_data(device=None):
     """
     Return JSON data for Weather-Aggregator integration.
 
@@ -263,104 +275,545 @@ def api_data():
     Cloud condition should be calculated in the aggregator using:
     delta = pws_ambient_temp - sky_temp_c
     """
-    data = data_cache['data'] or {}
-    heater = data_cache.get('heater_status') or {}
-
-    response = {
-        'timestamp': data_cache['timestamp'].isoformat() if data_cache['timestamp'] else None,
-        'sky_temp_c': data.get('sky_temp_c'),
-        'rain_freq': data.get('rain_freq'),
-        'is_raining': data.get('is_raining'),
-        'is_wet': data.get('is_wet'),
-        'heater_pwm': data.get('heater_pwm'),
-        'rain_sensor_temp_c': data.get('rain_sensor_temp_c'),
-        'light_sensor_raw': data.get('light_sensor_raw'),
-        'mpsas': data.get('mpsas'),
-        'is_daylight': data.get('is_daylight'),
-        'uptime_s': int((datetime.now(timezone.utc) - start_time).total_seconds()),
-        'quality': get_data_quality(),
-        # ESP ambient temperatures
-        'esp_temp_shadow_c': data_cache.get('esp_temp_shadow'),
-        'esp_temp_sun_c': data_cache.get('esp_temp_sun'),
-        # Heater control info
-        'heater_control': {
-            'enabled': config.HEATER_ENABLED,
-            'ambient_temp_c': data_cache.get('esp_temp_shadow'),  # Shadow sensor used for control
-            'target_pwm': heater.get('pwm'),
-            'reason': heater.get('reason'),
-        } if config.HEATER_ENABLED else None,
-    }
+    response = get_device(device).get_data()
+    response['uptime_s'] = get_uptime_s()
+    return respond(response, 'data')
+
 
-    return jsonify(response)
+@app.route('/api/devices')
+def api_devices():
+    """Return current data of all devices."""
+    return respond({
+        'default': default_device,
+        'uptime_s': get_uptime_s(),
+        'devices': {name: dev.get_data() for name, dev in devices.items()},
+    }, 'devices')
 
 
 @app.route('/api/raw')
-def api_raw():
+@app.route('/api/<device>/raw')
+def api_raw(device=None):
     """Return raw debug data."""
-    return jsonify({
-        'timestamp': data_cache['timestamp'].isoformat() if data_cache['timestamp'] else None,
-        'data': data_cache['data'],
-        'device_info': data_cache['device_info'],
-        'error': data_cache['error'],
-        'heater_status': data_cache.get('heater_status'),
-        'esp_temp_shadow': data_cache.get('esp_temp_shadow'),
-        'esp_temp_sun': data_cache.get('esp_temp_sun'),
-        'uptime_s': int((datetime.now(timezone.utc) - start_time).total_seconds()),
-        'config': {
-            'serial_port': config.SERIAL_PORT,
-            'baudrate': config.BAUDRATE,
-            'read_interval': config.READ_INTERVAL,
-            'thresholds': config.THRESHOLDS,
-            'rain_threshold': config.RAIN_THRESHOLD,
-            'wet_threshold': config.WET_THRESHOLD,
-            'mpsas_daylight_threshold': config.MPSAS_DAYLIGHT_THRESHOLD,
-            'heater_enabled': config.HEATER_ENABLED,
-            'esp_url': config.ESP_URL,
-            'esp_sensor_shadow': config.ESP_SENSOR_NAME_SHADOW,
-            'esp_sensor_sun': config.ESP_SENSOR_NAME_SUN,
-        }
+    dev = get_device(device)
+    response = dev.get_raw()
+    static = static_config(dev)
+    response.update({
+        'mqtt': mqtt_publisher.get_status() if mqtt_publisher else None,
+        'uptime_s': get_uptime_s(),
+        'config_version': config_watcher.get_status() if config_watcher else None,
+        'config_url': f"/api/{dev.name}/config",
+        'config_etag': config_etag(static),
     })
+    # Old inline shape for clients that do not fetch /api/config
+    if request.args.get('include') == 'config':
+        response['config'] = static
+    return respond(response, 'raw')
 
 
-@app.route('/api/health')
-def api_health():
-    """Health check endpoint."""
-    return jsonify({
-        'status': 'ok' if get_data_quality() != 'error' else 'degraded',
-        'quality': get_data_quality(),
-        'uptime_s': int((datetime.now(timezone.utc) - start_time).total_seconds()),
+@app.route('/api/config')
+@app.route('/api/<device>/config')
+def api_config(device=None):
+    """
+    Return the static device and threshold config.
+
+    Cacheable for CONFIG_CACHE_MAX_AGE seconds; clients revalidate with
+    If-None-Match (304) or when config_etag in /api/raw changes. The ETag
+    depends on the negotiated format (see config_etag()).
+    """
+    static = static_config(get_device(device))
+    try:
+        fmt = wire_format.negotiate(request.headers.get('Accept'), request.args.get('format'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 406
+    etag = config_etag(static, fmt)
+    if etag in request.if_none_match:
+        response = Response(status=304)
+        response.vary.add('Accept')
+    else:
+        response = respond(static, 'config')
+        if isinstance(response, tuple):
+            return response
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = config.CONFIG_CACHE_MAX_AGE
+    return response
+
+
+@app.route('/api/history')
+@app.route('/api/<device>/history')
+def api_history(device=None):
+    """
+    Return history of a device, optionally downsampled.
+
+    Query parameters:
+        hours / start / end: Time range (default: last 24 h)
+        channels: Comma-separated channel names (default: all)
+        max_points: Maximum points per channel (default: HISTORY_MAX_POINTS, 0 = all)
+        method: 'lttb' (default) or 'minmax'
+    """
+    from downsample import downsample
+
+    dev = get_device(device)
+    if history_store is None:
+        return jsonify({'error': 'History disabled in config'}), 503
+
+    try:
+        start, end = get_time_range(dev.clock.time())
+        channels = request.args.get('channels')
+        channels = HistoryStore.check_channels(channels.split(',') if channels else None)
+        max_points = request.args.get('max_points', config.HISTORY_MAX_POINTS, type=int)
+        method = request.args.get('method', 'lttb')
+
+        ts, values = history_store.query_arrays(dev.name, start, end, channels)
+        if max_points:
+            series = downsample(ts, values, max_points, method)
+        else:
+            series = {name: (ts, v) for name, v in values.items()}
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return respond({
+        'device': dev.name,
+        'start': start,
+        'end': end,
+        'method': method if max_points else None,
+        'max_points': max_points,
+        'raw_points': len(ts),
+        'channels': {
+            # NaN is not valid JSON -> null
+            name: {'t': t.tolist(), 'v': [None if v != v else v for v in y.tolist()]}
+            for name, (t, y) in series.items()
+        },
+    }, 'history')
+
+
+@app.route('/api/rollups')
+@app.route('/api/<device>/rollups')
+def api_rollups(device=None):
+    """
+    Return aggregated history (mean/min/max/count per bucket).
+
+    The coarsest tier whose bucket width is <= the requested resolution is
+    used; below the finest tier raw readings are returned in the same shape.
+
+    Query parameters:
+        hours / start / end: Time range (default: last 24 h)
+        channels: Comma-separated rollup channels (default: all)
+        resolution: Bucket width in seconds (default: range / max_points)
+        max_points: Target points per channel (default: HISTORY_MAX_POINTS)
+        tier: Force a tier ('raw', '1min', '10min', '1h')
+    """
+    dev = get_device(device)
+    if rollup_store is None:
+        return jsonify({'error': 'Rollups disabled in config'}), 503
+
+    try:
+        start, end = get_time_range(dev.clock.time())
+        channels = request.args.get('channels')
+        channels = RollupStore.check_channels(channels.split(',') if channels else None)
+        resolution = request.args.get('resolution', type=float)
+        if resolution is None:
+            max_points = request.args.get('max_points', config.HISTORY_MAX_POINTS, type=int) or 1
+            resolution = (end - start) / max_points
+        tier = request.args.get('tier') or rollup_store.pick_tier(resolution) or 'raw'
+
+        if tier == 'raw':
+            series = {name: {'t': [], 'mean': [], 'min': [], 'max': [], 'count': []} for name in channels}
+            derived_from = ('sky_temp_c', 'esp_temp_shadow_c', 'ambient_temp_c')
+            raw_channels = list(derived_from) + [
+                c for c in channels if c != 'sky_delta_c' and c not in derived_from]
+            for row in history_store.query(dev.name, start, end, raw_channels):
+                values = derive_values(dict(zip(raw_channels, row[1:])))
+                for name in channels:
+                    if values[name] is not None:
+                        for key in ('mean', 'min', 'max'):
+                            series[name][key].append(values[name])
+                        series[name]['t'].append(row[0])
+                        series[name]['count'].append(1)
+        else:
+            series = rollup_store.query(dev.name, tier, start, end, channels)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return respond({
+        'device': dev.name,
+        'start': start,
+        'end': end,
+        'resolution': resolution,
+        'tier': tier,
+        'width': rollup_store.tiers.get(tier),
+        'channels': series,
+    }, 'rollups')
+
+
+@app.route('/api/export')
+@app.route('/api/<device>/export')
+def api_export(device=None):
+    """
+    Stream the stored history of a device in columnar form.
+
+    Query parameters:
+        hours / start / end: Time range (default: last 24 h)
+        channels: Comma-separated channel names (default: all)
+        format: 'arrow' (default if pyarrow installed), 'parquet' or 'csv'
+    """
+    from export import MEDIA_TYPES, check_format, export_history
+
+    dev = get_device(device)
+    if history_store is None:
+        return jsonify({'error': 'History disabled in config'}), 503
+
+    try:
+        start, end = get_time_range(dev.clock.time())
+        channels = request.args.get('channels')
+        fmt = check_format(request.args.get('format'))
+        chunks = export_history(
+            history_store, dev.name, start, end,
+            channels=channels.split(',') if channels else None, fmt=fmt)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    media_type, extension = MEDIA_TYPES[fmt]
+    filename = f"cloudwatcher_{dev.name}_{int(start)}_{int(end)}.{extension}"
+    return Response(chunks, mimetype=media_type, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
     })
 
 
+@app.route('/api/feed')
+@app.route('/api/<device>/feed')
+def api_feed(device=None):
+    """
+    Return stored readings after a cursor, oldest first (see feed.py).
+
+    Query parameters:
+        after: Cursor of the last processed reading (default: oldest retained reading)
+        limit: Readings per page (default FEED_PAGE_SIZE, max FEED_MAX_LIMIT)
+        channels: Comma-separated channel names (default: all)
+        wait: Seconds to wait for new readings if none are available (long poll)
+    """
+    from feed import StaleCursor, read_feed
+
+    dev = get_device(device)
+    if history_store is None:
+        return jsonify({'error': 'History disabled in config'}), 503
+
+    channels = request.args.get('channels')
+    try:
+        page = read_feed(
+            history_store, dev.name,
+            after=request.args.get('after') or None,
+            limit=request.args.get('limit', type=int),
+            channels=channels.split(',') if channels else None,
+            wait=request.args.get('wait', 0, type=float),
+        )
+    except StaleCursor as e:
+        return jsonify({'error': str(e)}), 410
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return respond(page, 'feed')
+
+
+@app.route('/api/transitions')
+@app.route('/api/<device>/transitions')
+def api_transitions(device=None):
+    """Return recent debounced flag transitions (rain/wet/daylight) and rain onsets."""
+    dev = get_device(device)
+    flag_states = dev.flag_states
+    limit = request.args.get('limit', 20, type=int)
+    return respond({
+        'flags': flag_states.get_status(),
+        'transitions': flag_states.get_transitions(limit),
+        'rain_onsets': dev.rain_fast_path.get_events(limit) if dev.rain_fast_path else [],
+    }, 'transitions')
+
+
+@app.route('/api/changes')
+@app.route('/api/<device>/changes')
+def api_changes(device=None):
+    """
+    Return fields changed since sequence number `since`.
+
+    Poll with the returned 'seq' as next `since` and 'boot' as `boot`
+    (a different boot id returns the full snapshot). Only fields that moved
+    beyond their deadband are included.
+    """
+    since = request.args.get('since', 0, type=int)
+    boot = request.args.get('boot')
+    return respond(get_device(device).change_tracker.changes_since(since, boot), 'changes')
+
+
+def parse_event_id(value: Optional[str]) -> Tuple[Optional[str], Optional[int]]:
+    """Split a stream event id "<boot>:<seq>" (or a bare "<seq>") into (boot, seq)."""
+    if value is None:
+        return None, None
+    boot, _, seq = str(value).rpartition(':')
+    return boot or None, int(seq) if seq.isdigit() else None
+
+
+@app.route('/api/stream')
+@app.route('/api/<device>/stream')
+def api_stream(device=None):
+    """
+    Server-Sent Events stream of change events.
+
+    Resumes after Last-Event-ID header (or ?since=N) by first sending all
+    fields changed since that sequence number. Event ids are
+    "<boot>:<seq>"; an id of a previous run resumes with the full snapshot.
+    A client too slow for its queue gets a catch-up frame of everything
+    changed since the last event it received instead of the dropped ones. With a binary format
+    (Accept or ?format=msgpack/cbor) the stream is a sequence of encoded
+    change events, keep-alives are nil.
+    """
+    change_tracker = get_device(device).change_tracker
+    boot, since = parse_event_id(request.headers.get('Last-Event-ID', request.args.get('since')))
+    try:
+        fmt = wire_format.negotiate(request.headers.get('Accept'), request.args.get('format'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 406
+    media, headers = wire_format.schema_headers('change', fmt, stream=True)
+
+    if fmt == 'json':
+        def frame(event):
+            return f"id: {event['boot']}:{event['seq']}\nevent: change\ndata: {json.dumps(event)}\n\n"
+        keep_alive = ": keep-alive\n\n"
+    else:
+        def frame(event):
+            return wire_format.encode(event, fmt)
+        keep_alive = wire_format.encode(None, fmt)
+
+    def generate():
+        q = change_tracker.subscribe()
+        # Last seq the client has (queued events up to it are already covered)
+        sent = None
+        try:
+            if since is not None:
+                catchup = change_tracker.changes_since(since, boot)
+                sent = catchup['seq']
+                if catchup['changes']:
+                    yield frame(catchup)
+            while True:
+                if q.overflowed:
+                    # Events were dropped: send what changed since the last delivered one
+                    q.overflowed = False
+                    catchup = change_tracker.changes_since(0 if sent is None else sent)
+                    sent = catchup['seq']
+                    yield frame(catchup)
+                try:
+                    event = q.get(timeout=config.STREAM_KEEPALIVE)
+                except queue.Empty:
+                    yield keep_alive
+                    continue
+                if sent is not None and event['seq'] <= sent:
+                    continue
+                sent = event['seq']
+                yield frame(event)
+        finally:
+            change_tracker.unsubscribe(q)
+
+    return Response(generate(), mimetype=media,
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no', **headers})
+
+
+@app.route('/api/diagnostics')
+@app.route('/api/<device>/diagnostics')
+def api_diagnostics(device=None):
+    """Return device error counters, switch status and serial link statistics."""
+    diagnostics = get_device(device).diagnostics
+    if diagnostics is None:
+        return jsonify({'error': 'Reader not initialized'}), 503
+    limit = request.args.get('limit', type=int)
+    return respond(diagnostics.get_status(limit), 'diagnostics')
+
+
+@app.route('/api/health')
+@app.route('/api/<device>/health')
+def api_health(device=None):
+    """Health check endpoint (all devices must deliver data for status 'ok')."""
+    selected = devices if device is None else {device: get_device(device)}
+    qualities = {name: dev.get_data_quality() for name, dev in selected.items()}
+    stalled = {name: dev.monitor.stalled for name, dev in selected.items() if dev.monitor.stalled}
+    quality = qualities.get(default_device, next(iter(qualities.values()), 'error'))
+    if 'error' in qualities.values() or stalled:
+        status = 'degraded'
+    elif 'warming' in qualities.values():
+        status = 'warming'
+    else:
+        status = 'ok'
+    return respond({
+        'status': status,
+        'quality': quality,
+        'devices': qualities,
+        'stalled': stalled,
+        'uptime_s': get_uptime_s(),
+    }, 'health')
+
+
+@app.route('/api/trends')
+@app.route('/api/<device>/trends')
+def api_trends(device=None):
+    """Return channel trends, time-to-threshold estimates and nowcast."""
+    return respond(get_device(device).get_trends(), 'trends')
+
+
 @app.route('/api/heater')
-def api_heater():
+@app.route('/api/<device>/heater')
+def api_heater(device=None):
     """Return heater control status for monitoring."""
-    if not config.HEATER_ENABLED:
-        return jsonify({
-            'enabled': False,
-            'message': 'Heater control disabled in config',
-        })
-
-    heater = data_cache.get('heater_status') or {}
-    data = data_cache.get('data') or {}
-
-    return jsonify({
-        'enabled': True,
-        'timestamp': data_cache['timestamp'].isoformat() if data_cache['timestamp'] else None,
-        'esp_temp_shadow_c': data_cache.get('esp_temp_shadow'),
-        'esp_temp_sun_c': data_cache.get('esp_temp_sun'),
-        'sensor_temp_c': heater.get('sensor_temp'),
-        'delta_c': heater.get('delta'),
-        'target_pwm': heater.get('pwm'),
-        'actual_pwm': data.get('heater_pwm'),
-        'reason': heater.get('reason'),
-        'in_impulse': heater.get('in_impulse'),
-        'config': heater.get('config'),
-    })
+    return respond(get_device(device).get_heater(), 'heater')
+
+
+def profile_allowed() -> bool:
+    """PROFILE_TOKEN if set, otherwise local clients only."""
+    if config.PROFILE_TOKEN:
+        token = request.args.get('token') or request.headers.get('X-Profile-Token') or ''
+        return hmac.compare_digest(token.encode(), str(config.PROFILE_TOKEN).encode())
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+
+@app.route('/debug/profile')
+def debug_profile():
+    """
+    Sample all thread stacks for a while (see profiler.py).
+
+    Query parameters:
+        seconds: Sampling duration (default PROFILE_DEFAULT_SECONDS)
+        rate: Samples per second (default PROFILE_RATE)
+        output: 'collapsed' (default, flamegraph.pl/speedscope input) or 'summary'
+        idle: 1 = keep threads waiting in threading/queue/selectors
+    """
+    from profiler import PROFILER, ProfilerBusy
+
+    if not config.PROFILE_ENABLED:
+        abort(404)
+    if not profile_allowed():
+        return jsonify({'error': 'Profiler access denied'}), 403
+
+    output = request.args.get('output', 'collapsed')
+    if output not in ('collapsed', 'summary'):
+        return jsonify({'error': f"Unknown output '{output}' (collapsed, summary)"}), 400
+    try:
+        profile = PROFILER.run(
+            request.args.get('seconds', config.PROFILE_DEFAULT_SECONDS, type=float),
+            rate=request.args.get('rate', type=float),
+            devices=devices,
+            include_idle=request.args.get('idle', 0, type=int) == 1,
+        )
+    except ProfilerBusy as e:
+        return jsonify({'error': str(e)}), 409
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    logger.info(f"Profile: {profile.samples} samples in {profile.elapsed:.1f}s")
+    if output == 'summary':
+        return respond(profile.summary(), 'profile')
+    return Response(profile.collapsed(), mimetype='text/plain')
+
+
+def start_mqtt_publisher():
+    """Start MQTT publisher and subscribe it to the change events of all devices."""
+    global mqtt_publisher
+
+    from mqtt_publisher import MqttPublisher
+    try:
+        mqtt_publisher = MqttPublisher()
+        mqtt_publisher.start()
+    except Exception as e:
+        logger.error(f"MQTT publisher not started: {e}")
+        mqtt_publisher = None
+        return
+
+    for dev in devices.values():
+        dev.attach_publisher(mqtt_publisher)
+
+
+def replay_options(name: str, path: str, speed: float) -> Dict:
+    """
+    Return device arguments to replay a recording on a shared virtual clock.
+
+    A replayed session never touches the snapshot file of the live device.
+    """
+    from clock import VirtualClock
+    from replay_reader import Recording, ReplayReader
+
+    recording = Recording.load(path, name)
+    clock = VirtualClock(recording.start, speed)
+    return {
+        'clock': clock,
+        'reader_factory': lambda: ReplayReader(recording, clock),
+        'persist_snapshot': False,
+    }
+
+
+def init_devices(use_dummy: bool = False, replay: Optional[str] = None, speed: float = 1.0):
+    """
+    Create devices from config (single device 'default' if DEVICES is empty).
+
+    Args:
+        use_dummy: Use DummyCloudWatcherReader
+        replay: Recording (history database or CSV export) to play back instead of hardware
+        speed: Replay speed multiplier (1-1000)
+    """
+    global default_device, history_store, rollup_store
+
+    if config.HISTORY_ENABLED:
+        try:
+            if replay:
+                # Throwaway in-memory store: replayed readings must not mix into the live
+                # history (which may be the recording itself). Recorded timestamps are
+                # in the past, so nothing is pruned.
+                history_store = HistoryStore(':memory:', retention_days=float('inf'))
+                if config.ROLLUPS_ENABLED:
+                    rollup_store = RollupStore(
+                        history_store, retention_days={tier: float('inf') for tier in config.ROLLUP_TIERS})
+            else:
+                history_store = HistoryStore()
+                if config.ROLLUPS_ENABLED:
+                    rollup_store = RollupStore(history_store)
+        except Exception as e:
+            logger.error(f"History store not available: {e}")
+
+    device_configs = load_device_configs()
+    single = len(device_configs) == 1
+
+    for name, settings in device_configs.items():
+        if replay:
+            settings = {**settings, **replay_options(name, replay, speed)}
+        # Single unit keeps the MQTT topics directly below the base topic
+        devices[name] = CloudWatcherDevice(
+            name, use_dummy=use_dummy, topic_prefix='' if single else None,
+            history=history_store, rollups=rollup_store, **settings)
+
+    default_device = getattr(config, 'DEFAULT_DEVICE', None) or next(iter(devices))
+    logger.info(f"Devices: {', '.join(devices)} (default: {default_device})")
+
+    for dev in devices.values():
+        # Replayed devices neither restore nor save snapshots (persist_snapshot=False)
+        dev.restore_snapshot()
+        dev.on_ready = lambda _dev: systemd_notify.notify_status(device_status_line())
+
+
+def device_status_line() -> str:
+    """Short status for systemd (e.g. '1/2 devices live')."""
+    ready = sum(1 for dev in devices.values() if dev.state == 'ready')
+    return f"{ready}/{len(devices)} devices live"
+
+
+def shutdown(signum=None, frame=None):
+    """Persist snapshots and stop (SIGTERM/SIGINT)."""
+    logger.info("Shutting down")
+    systemd_notify.notify_stopping()
+    for dev in devices.values():
+        dev.save_snapshot()
+    if rollup_store is not None:
+        rollup_store.flush_all()
+    if mqtt_publisher is not None:
+        mqtt_publisher.stop()
+    raise SystemExit(0)
 
 
 def main():
-    global USE_DUMMY
+    global USE_DUMMY, config_watcher, watchdog
 
     import sys
 
@@ -369,16 +822,42 @@ def main():
         USE_DUMMY = True
         logger.info("Running in dummy mode (no hardware)")
 
-    # Start background reader thread
-    reader_thread = threading.Thread(target=background_reader, daemon=True)
-    reader_thread.start()
+    # Replay a recorded session: --replay FILE [--speed N]
+    replay = None
+    speed = 1.0
+    if '--replay' in sys.argv:
+        replay = sys.argv[sys.argv.index('--replay') + 1]
+        if '--speed' in sys.argv:
+            speed = float(sys.argv[sys.argv.index('--speed') + 1])
+        logger.info(f"Replaying {replay} at {speed:g}x (no hardware)")
+
+    init_devices(USE_DUMMY, replay, speed)
+
+    if config.MQTT_ENABLED and replay:
+        logger.info("MQTT disabled while replaying (live topics stay untouched)")
+    elif config.MQTT_ENABLED:
+        start_mqtt_publisher()
+
+    # Start one I/O thread per device
+    for dev in devices.values():
+        dev.start()
+
+    if config.CONFIG_RELOAD_ENABLED:
+        config_watcher = ConfigWatcher(devices)
+        config_watcher.start()
+
+    if config.WATCHDOG_ENABLED:
+        watchdog = Watchdog(devices)
+        watchdog.start()
 
-    # Give reader time to initialize
-    time.sleep(2)
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
 
-    # Start Flask server
+    # Start web server (restored snapshots are served while readers initialize)
     logger.info(f"Starting web server on {config.WEB_HOST}:{config.WEB_PORT}")
-    app.run(host=config.WEB_HOST, port=config.WEB_PORT, debug=False, threaded=True)
+    server = make_server(config.WEB_HOST, config.WEB_PORT, app, threaded=True)
+    systemd_notify.notify_ready(device_status_line())
+    server.serve_forever()
 
 
 if __name__ == '__main__':
@@ -4,18 +4,69 @@
 # Modified: 2026-02-03 14:00 - Adjusted WET_THRESHOLD from 2000 to 2100 (RTS2 calibration)
 # Modified: 2026-02-04 20:50 - Added heater control config, reduced READ_INTERVAL to 10s
 # Modified: 2026-02-05 - Added ESP_SENSOR_NAME_SUN for second ESP sensor
+# Modified: 2026-10-19 - Added exit thresholds and dwell times for debounced flags
+# Modified: 2026-10-19 - Added per-field deadbands for change detection
+# Modified: 2026-10-19 - Added MQTT publisher settings
+# Modified: 2026-10-19 - Added robust sample filter settings, READ_SAMPLES 5 -> 3
+# Modified: 2026-10-19 - Added device diagnostics settings
+# Modified: 2026-10-19 - Added DEVICES for multiple CloudWatcher units
+# Modified: 2026-10-19 - Added history store settings
+# Modified: 2026-10-19 - Added snapshot persistence and SERIAL_OPEN_DELAY for fast startup
+# Modified: 2026-10-19 - Added live config reload settings
+# Modified: 2026-10-19 - Added heater PWM write coalescing settings
+# Modified: 2026-10-19 - Added rain-onset fast path settings
+# Modified: 2026-10-19 - Added EXPORT_CHUNK_ROWS
+# Modified: 2026-10-19 - Added rollup tier settings
+# Modified: 2026-10-19 - Added trend/nowcast settings
+# Modified: 2026-10-19 - Added reader watchdog settings
+# Modified: 2026-10-19 - Added replication feed settings
+# Modified: 2026-10-19 - Added static config cache lifetime (/api/config)
+# Modified: 2026-10-19 - Added ambient temperature fusion and PWS source settings
+# Modified: 2026-10-19 - Added adaptive read cadence settings
+# Modified: 2026-10-19 - Added sampling profiler settings (/debug/profile)
+# Modified: 2026-10-19 - Added federation gateway settings
+# Modified: 2026-10-19 - WATCHDOG_LOCK_TIMEOUT also bounds the safe-PWM wait for the serial port
 
 # Serial port settings
 SERIAL_PORT = "/dev/ttyUSB0"
 BAUDRATE = 9600
+SERIAL_OPEN_DELAY = 2  # seconds to wait after opening the port (v130, pocketCW compatibility)
+
+# Multiple CloudWatcher units (see device.py)
+# Empty = single unit on SERIAL_PORT above (served on /api/data etc.)
+# Each unit gets its own serial port, heater controller and reader thread and is
+# served on /api/<name>/...; keys not given fall back to the global values.
+DEVICES = {}
+# DEVICES = {
+#     'north': {'serial_port': '/dev/ttyUSB0'},
+#     'south': {'serial_port': '/dev/ttyUSB1', 'heater_enabled': False, 'esp_url': 'http://172.23.56.151/api'},
+# }
+DEFAULT_DEVICE = None  # Unit served on the routes without device name (None = first in DEVICES)
 
 # Web server settings
 WEB_HOST = "0.0.0.0"
 WEB_PORT = 5000
 
 # Polling interval (seconds) - also used for heater control loop
+# With CADENCE_ENABLED this is the normal interval (see cadence.py)
 READ_INTERVAL = 10
 
+# Adaptive read cadence: fast while wet/transitions/dew risk, relaxed while stable
+CADENCE_ENABLED = True
+READ_INTERVAL_MIN = 5             # seconds - wet, rain onset, pending flag changes, dew risk
+READ_INTERVAL_MAX = 60            # seconds - stable dry day or night
+CADENCE_RELAX_FACTOR = 1.5        # interval growth per stable cycle
+CADENCE_HOLD = 300                # seconds fast after a flag transition or rain onset
+CADENCE_DEW_LEAD = 30             # minutes - predicted wet/sensor margin/threshold this close = not stable
+HEATER_MAX_CONTROL_INTERVAL = 30  # seconds - longest interval while the heater is regulating
+
+# Samples per channel and cycle, combined by a robust filter (see filters.py)
+# Methods: 'mad' (median +- k*MAD, default), 'median', 'trimmed', 'sigma' (legacy +-1σ), 'mean'
+# With MAD clipping 3 samples are as robust against single spikes as 5 with ±1σ
+READ_SAMPLES = 3
+FILTER_METHOD = "mad"
+FILTER_PARAM = None  # k for 'mad'/'sigma', fraction for 'trimmed' (None = filter default)
+
 # ESP Temperature Sensor (Temp2IoT)
 # Used for ambient temperature for heater control
 ESP_URL = "http://172.23.56.150/api"
@@ -23,6 +74,28 @@ ESP_SENSOR_NAME_SHADOW = "Schatten"  # Shaded sensor - used for heater control
 ESP_SENSOR_NAME_SUN = "Sonne"        # Sun-exposed sensor
 ESP_TIMEOUT = 5  # seconds
 
+# PWS temperature from the weather aggregator (additional ambient source, None = off)
+PWS_URL = None  # e.g. "http://172.23.56.157/weather-api/api.php?action=current"
+PWS_TEMP_FIELD = "temp_c"
+PWS_FETCH_INTERVAL = 120  # seconds between fetches
+PWS_MAX_AGE = 1800        # seconds - older PWS readings are ignored
+
+# Ambient temperature fusion for heater control (Kalman filter, see ambient_fusion.py)
+# Sources: ESP shadow/sun, PWS, rain sensor NTC while the heater is off
+AMBIENT_FUSION_ENABLED = True  # False = ESP shadow sensor only (control skipped without it)
+AMBIENT_PROCESS_NOISE = 0.0005  # °C²/s - assumed drift of the true ambient temperature
+AMBIENT_NOISE = {               # measurement variance per source (°C²)
+    'shadow': 0.05,
+    'sun': 0.5,
+    'sun_daylight': 9.0,        # added to 'sun' while it is daylight (solar heating)
+    'pws': 0.5,
+    'ntc': 0.3,
+}
+AMBIENT_MAX_SIGMA = 1.5     # °C - heater control pauses above this uncertainty (~1 h without sources)
+AMBIENT_GATE = 4.0          # sigmas - readings further from the estimate are rejected
+AMBIENT_OFFSET_ALPHA = 0.05  # learning rate of source offsets against the shadow sensor
+AMBIENT_NTC_TAU = 300       # seconds - cooldown time constant of the rain sensor after heater off
+
 # Heater control settings (INDI/manufacturer defaults)
 HEATER_ENABLED = True
 HEATER_MIN_DELTA = 4.0      # Minimum temp difference sensor-ambient (°C)
@@ -30,6 +103,9 @@ HEATER_MAX_DELTA = 8.0      # Maximum temp difference sensor-ambient (°C)
 HEATER_IMPULSE_TEMP = 10.0  # Below this ambient temp, use impulse heating (°C)
 HEATER_IMPULSE_DURATION = 60   # Impulse duration (seconds)
 HEATER_IMPULSE_CYCLE = 600     # Impulse cycle period (seconds)
+HEATER_PWM_MIN_STEP = 10          # Smaller PWM changes are not sent (0 and 1023 always are)
+HEATER_PWM_REFRESH = 300          # Resend unchanged PWM after this many seconds
+HEATER_PWM_VERIFY_INTERVAL = 600  # Read back PWM (Q!) after this many seconds
 
 # Cloud condition thresholds (delta = ambient - sky temperature)
 # Note: ambient_temp must come from external source (PWS), not from CloudWatcher
@@ -54,5 +130,149 @@ WET_THRESHOLD = 2100    # Below this = wet/damp (but not necessarily raining)
 # Typical values: 5-10 (daylight), 17-18 (city night), 21-22 (dark site)
 MPSAS_DAYLIGHT_THRESHOLD = 10  # Below this = daylight
 
+# Flag hysteresis (see flag_state.py)
+# A flag switches on below its threshold above and only switches off again
+# at/above its exit threshold. Values in between keep the current state.
+RAIN_EXIT_THRESHOLD = 1800           # is_raining off at/above this frequency
+WET_EXIT_THRESHOLD = 2200            # is_wet off at/above this frequency
+MPSAS_DAYLIGHT_EXIT_THRESHOLD = 11   # is_daylight off at/above this MPSAS
+# Condition must hold this long before a flag changes (seconds)
+FLAG_MIN_DWELL_ON = 20
+FLAG_MIN_DWELL_OFF = 60
+
+# Change detection deadbands (see change_tracker.py)
+# A field is only published again when it moved more than max(abs, rel * |old|)
+# since its last published value. Fields not listed change on any difference.
+DEADBANDS = {
+    'sky_temp_c': {'abs': 0.3},
+    'rain_freq': {'abs': 20, 'rel': 0.01},
+    'rain_sensor_temp_c': {'abs': 0.3},
+    'light_sensor_raw': {'rel': 0.05},
+    'mpsas': {'abs': 0.1},
+    'heater_pwm': {'abs': 10},
+    'heater_target_pwm': {'abs': 10},
+    'esp_temp_shadow_c': {'abs': 0.2},
+    'esp_temp_sun_c': {'abs': 0.2},
+    'sky_delta_trend': {'abs': 0.05},
+    'cloud_change_in_min': {'abs': 2},
+    'wet_in_min': {'abs': 2},
+    'sensor_margin_in_min': {'abs': 2},
+    'daylight_in_min': {'abs': 2},
+    'ambient_temp_c': {'abs': 0.2},
+    'ambient_sigma_c': {'abs': 0.2},
+}
+STREAM_KEEPALIVE = 15  # seconds between keep-alive comments on /api/stream
+
+# Static device/threshold config at /api/config (ETag, revalidated via
+# config_etag in /api/raw after a live reload)
+CONFIG_CACHE_MAX_AGE = 3600  # seconds
+
+# MQTT publisher (see mqtt_publisher.py, requires paho-mqtt)
+# Persistent connection, publishes snapshot/heater/transitions to retained topics
+MQTT_ENABLED = False
+MQTT_HOST = "172.23.56.157"
+MQTT_PORT = 1883
+MQTT_USERNAME = None
+MQTT_PASSWORD = None
+MQTT_CLIENT_ID = "cloudwatcher-service"
+MQTT_BASE_TOPIC = "cloudwatcher"
+MQTT_QOS = 0             # 0 = at most once, 1 = at least once, 2 = exactly once
+MQTT_RETAIN = True       # Retain state topics (snapshot, heater, transitions)
+MQTT_KEEPALIVE = 60      # seconds
+MQTT_QUEUE_SIZE = 500    # Max. non-retained messages kept while broker is offline
+
+# Device diagnostics (see diagnostics.py)
+# Reads internal error counters (D!) and switch status (F!) between read cycles
+DIAGNOSTICS_INTERVAL = 300  # seconds
+DIAGNOSTICS_HISTORY = 288   # Number of polls kept (288 x 5 min = 24 h)
+
+# History store (see history_store.py, SQLite file relative to working directory)
+# 10 s readings: ~8640 rows/day per device
+HISTORY_ENABLED = True
+HISTORY_DB = "cloudwatcher_history.db"
+HISTORY_RETENTION_DAYS = 90
+HISTORY_MAX_POINTS = 1000  # Default points per channel for /api/history (LTTB downsampling)
+EXPORT_CHUNK_ROWS = 50000  # Rows per chunk for /api/export and export.py (Arrow batch / Parquet row group)
+FEED_PAGE_SIZE = 500       # Default readings per /api/feed page
+FEED_MAX_LIMIT = 10000     # Largest allowed /api/feed limit (backfill pages)
+FEED_MAX_WAIT = 30         # seconds - longest /api/feed long poll (?wait=)
+
+# Rollups (mean/min/max/count per bucket, maintained incrementally in the history database)
+ROLLUPS_ENABLED = True
+ROLLUP_TIERS = {"1min": 60, "10min": 600, "1h": 3600}  # tier name -> bucket width (seconds)
+ROLLUP_RETENTION_DAYS = {"1min": 14, "10min": 180, "1h": 3650}
+
+# Rain-onset fast path (E! polled in its own thread, see rain_onset.py)
+RAIN_FAST_PATH_ENABLED = True
+RAIN_FAST_INTERVAL = 1.0         # seconds between E! polls
+RAIN_ONSET_MIN_DROP = 300        # Hz below dry baseline required for an onset
+RAIN_ONSET_CUSUM_K = 30          # Hz per sample tolerated as noise
+RAIN_ONSET_CUSUM_H = 600         # Hz - CUSUM alarm level
+RAIN_ONSET_SLOPE = -100          # Hz/s - slope alarm level
+RAIN_ONSET_WINDOW = 5            # seconds - slope regression window
+RAIN_ONSET_REARM = 600           # seconds - re-arm while the sensor stays wet
+RAIN_ONSET_BASELINE_ALPHA = 0.02 # EWMA factor of the dry baseline per poll
+
+# Trends and nowcast (sliding-window regressions per channel, see trends.py)
+TREND_WINDOW = 900           # seconds - regression window
+TREND_MIN_POINTS = 6         # samples in the window before a trend is reported
+TREND_HORIZON = 15           # minutes - nowcast horizon
+TREND_MAX_LEAD = 120         # minutes - longer time-to-threshold estimates are not reported
+TREND_MIN_R2 = 0.3           # noisier fits (r2 below) count as no trend
+TREND_STEADY_SLOPE = 0.05    # °C/min - smaller sky delta slopes count as 'steady'
+TREND_HEATER_LEAD = 5        # minutes - heater reacts to the sensor margin predicted this far ahead (0 = off)
+
+# Reader watchdog (per-stage latency budgets, see watchdog.py)
+WATCHDOG_ENABLED = True
+WATCHDOG_INTERVAL = 5            # seconds between checks (at most WatchdogSec/2 under systemd)
+WATCHDOG_BUDGETS = {             # seconds per cycle stage before the device counts as stalled
+    'serial': 30,                # read_all(), diagnostics, port open
+    'esp': 15,                   # ambient temperature fetch
+    'control': 10,               # PWM calculation and write
+    'publish': 10,               # change tracker, history, rollups, snapshot file
+}
+WATCHDOG_LOOP_GRACE = 30         # seconds beyond READ_INTERVAL without any stage
+WATCHDOG_SAFE_PWM = 0            # heater PWM while the control loop is stalled
+WATCHDOG_RESTART_INTERVAL = 60   # seconds between I/O worker restarts of one device
+WATCHDOG_MAX_STALL = 300         # seconds - stop feeding systemd (service restart) after this
+WATCHDOG_LOCK_TIMEOUT = 2        # seconds to wait for the heater lock and the serial port (safe PWM)
+
+# Federation gateway (federation_gateway.py, a separate process): follows
+# several CloudWatcher services over their /api/stream and /api/feed and
+# serves all sites from its own cache
+FEDERATION_SITES = {}  # name -> base URL or {'url': ..., 'device': ...}
+#   e.g. {'home': "http://172.23.56.60:5000", 'remote': {'url': "http://10.8.0.2:5000", 'device': 'east'}}
+FEDERATION_HOST = "0.0.0.0"
+FEDERATION_PORT = 5010
+FEDERATION_DB = "federation_history.db"
+FEDERATION_RETENTION_DAYS = 90
+FEDERATION_STALE_AFTER = 300      # seconds without a new reading before a site counts as stale
+FEDERATION_STREAM_TIMEOUT = 60    # seconds without a stream frame (incl. keep-alive) before reconnecting
+FEDERATION_FEED_LIMIT = 2000      # readings per feed page (backfill)
+FEDERATION_FEED_WAIT = 25         # seconds - feed long poll (at most FEED_MAX_WAIT of the sites)
+FEDERATION_HTTP_TIMEOUT = 15      # seconds on top of the long poll
+FEDERATION_RETRY_MIN = 5          # seconds - first reconnect delay (doubles per failure)
+FEDERATION_RETRY_MAX = 300        # seconds - longest reconnect delay
+
+# Sampling profiler at /debug/profile (see profiler.py). Off by default;
+# without PROFILE_TOKEN only local clients (127.0.0.1/::1) may use it,
+# with a token it must be sent as ?token= or X-Profile-Token header
+PROFILE_ENABLED = False
+PROFILE_TOKEN = None
+PROFILE_RATE = 100            # samples per second (default)
+PROFILE_MAX_RATE = 1000       # samples per second (upper limit)
+PROFILE_DEFAULT_SECONDS = 10  # sampling duration (default)
+PROFILE_MAX_SECONDS = 120     # sampling duration (upper limit)
+
+# Live config reload (this file is watched; serial, web, MQTT, history and
+# device settings still need a restart)
+CONFIG_RELOAD_ENABLED = True
+CONFIG_RELOAD_INTERVAL = 5  # seconds between file checks
+
+# Snapshot persistence (fast restart: last data is served until the first live reading)
+SNAPSHOT_PATH = "snapshot_{device}.json"  # relative to working directory
+SNAPSHOT_SAVE_INTERVAL = 60  # seconds
+SNAPSHOT_MAX_AGE = 3600      # seconds - older snapshots are not restored
+
 # Data quality settings
 STALE_THRESHOLD = 300  # seconds - data older than this is marked "stale"
@@ -0,0 +1,317 @@
+"""
+CloudWatcher Live Configuration Reload
+Modified: 2026-10-19 - Initial creation
+Modified: 2026-10-19 - Validate trend settings
+Modified: 2026-10-19 - Watchdog settings, bounded wait for the cycle locks of stalled devices
+Modified: 2026-10-19 - Validate feed page sizes
+Modified: 2026-10-19 - Validate config cache lifetime
+Modified: 2026-10-19 - Validate ambient fusion settings
+Modified: 2026-10-19 - Validate read cadence settings
+Modified: 2026-10-19 - Validate profiler limits
+Modified: 2026-10-19 - Federation gateway settings (gateway process, restart required)
+
+Watches config.py (mtime polling every CONFIG_RELOAD_INTERVAL seconds,
+stdlib only) and applies changed tuning values without a restart:
+
+1. The new file is executed into a separate module, the running config
+   is untouched if it fails to load.
+2. The candidate values are validated (types must match the running
+   values, thresholds must be consistent). Invalid files are rejected as
+   a whole and reported in the config status.
+3. All device cycle locks are taken, so the new values are applied
+   between read cycles of every device, then written to the config
+   module and pushed into objects that copied them at construction
+   (heater controller, flag state machine, change tracker, diagnostics).
+
+Values that only take effect at startup (serial port, web server, MQTT
+connection, history database, device list) are not applied; changes to
+them are listed as 'restart_required'.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+import types
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import config
+from ambient_fusion import NOISE_KEYS as AMBIENT_NOISE_KEYS
+from filters import FILTERS
+from watchdog import STAGES
+
+logger = logging.getLogger(__name__)
+
+# Settings that are only read at startup
+RESTART_REQUIRED = {
+    'SERIAL_PORT', 'BAUDRATE', 'SERIAL_OPEN_DELAY',
+    'DEVICES', 'DEFAULT_DEVICE', 'HEATER_ENABLED',
+    'WEB_HOST', 'WEB_PORT',
+    'HISTORY_ENABLED', 'HISTORY_DB', 'SNAPSHOT_PATH',
+    'CONFIG_RELOAD_ENABLED', 'CONFIG_RELOAD_INTERVAL',
+    'RAIN_FAST_PATH_ENABLED', 'WATCHDOG_ENABLED', 'WATCHDOG_INTERVAL',
+}
+RESTART_REQUIRED_PREFIXES = ('MQTT_', 'ROLLUP', 'FEDERATION_')
+
+# (lower, upper) pairs that must satisfy lower <= upper
+ORDERED_PAIRS = [
+    ('RAIN_THRESHOLD', 'RAIN_EXIT_THRESHOLD'),
+    ('WET_THRESHOLD', 'WET_EXIT_THRESHOLD'),
+    ('MPSAS_DAYLIGHT_THRESHOLD', 'MPSAS_DAYLIGHT_EXIT_THRESHOLD'),
+    ('HEATER_MIN_DELTA', 'HEATER_MAX_DELTA'),
+    ('HEATER_IMPULSE_DURATION', 'HEATER_IMPULSE_CYCLE'),
+    ('FEED_PAGE_SIZE', 'FEED_MAX_LIMIT'),
+    ('READ_INTERVAL_MIN', 'READ_INTERVAL'),
+    ('READ_INTERVAL', 'READ_INTERVAL_MAX'),
+    ('PROFILE_RATE', 'PROFILE_MAX_RATE'),
+    ('PROFILE_DEFAULT_SECONDS', 'PROFILE_MAX_SECONDS'),
+    ('FEDERATION_RETRY_MIN', 'FEDERATION_RETRY_MAX'),
+]
+
+# Settings that must be > 0
+POSITIVE = (
+    'READ_INTERVAL', 'READ_SAMPLES', 'STALE_THRESHOLD', 'DIAGNOSTICS_INTERVAL',
+    'HEATER_PWM_REFRESH', 'HEATER_PWM_VERIFY_INTERVAL',
+    'RAIN_FAST_INTERVAL', 'RAIN_ONSET_MIN_DROP', 'RAIN_ONSET_WINDOW', 'RAIN_ONSET_REARM',
+    'TREND_WINDOW', 'TREND_MIN_POINTS', 'TREND_HORIZON', 'TREND_MAX_LEAD', 'TREND_STEADY_SLOPE',
+    'WATCHDOG_LOOP_GRACE', 'WATCHDOG_RESTART_INTERVAL', 'WATCHDOG_MAX_STALL', 'WATCHDOG_LOCK_TIMEOUT',
+    'FEED_PAGE_SIZE', 'FEED_MAX_LIMIT', 'CONFIG_CACHE_MAX_AGE',
+    'PWS_FETCH_INTERVAL', 'PWS_MAX_AGE',
+    'AMBIENT_PROCESS_NOISE', 'AMBIENT_MAX_SIGMA', 'AMBIENT_GATE', 'AMBIENT_NTC_TAU',
+    'READ_INTERVAL_MIN', 'READ_INTERVAL_MAX', 'CADENCE_HOLD', 'CADENCE_DEW_LEAD',
+    'HEATER_MAX_CONTROL_INTERVAL',
+    'PROFILE_RATE', 'PROFILE_MAX_RATE', 'PROFILE_DEFAULT_SECONDS', 'PROFILE_MAX_SECONDS',
+    'FEDERATION_STALE_AFTER', 'FEDERATION_STREAM_TIMEOUT', 'FEDERATION_FEED_LIMIT', 'FEDERATION_FEED_WAIT',
+    'FEDERATION_HTTP_TIMEOUT', 'FEDERATION_RETRY_MIN', 'FEDERATION_RETRY_MAX',
+)
+
+
+def requires_restart(key: str) -> bool:
+    """Return True if a setting is only read at startup."""
+    return key in RESTART_REQUIRED or key.startswith(RESTART_REQUIRED_PREFIXES)
+
+
+def current_values() -> Dict:
+    """Return all settings (upper-case names) of the running config."""
+    return {key: value for key, value in vars(config).items() if key.isupper()}
+
+
+def load_values(path: str) -> Dict:
+    """
+    Execute a config file into a fresh module and return its settings.
+
+    Raises:
+        Exception: Whatever the file raises (SyntaxError, NameError, ...)
+    """
+    with open(path, encoding='utf-8') as f:
+        source = f.read()
+    module = types.ModuleType('config_candidate')
+    module.__file__ = path
+    exec(compile(source, path, 'exec'), module.__dict__)
+    return {key: value for key, value in vars(module).items() if key.isupper()}
+
+
+def _same_type(old, new) -> bool:
+    """Compare value types (int/float interchangeable, None matches anything)."""
+    if old is None or new is None:
+        return True
+    if isinstance(old, bool) or isinstance(new, bool):
+        return isinstance(old, bool) and isinstance(new, bool)
+    if isinstance(old, (int, float)) and isinstance(new, (int, float)):
+        return True
+    return type(old) is type(new)
+
+
+def validate(values: Dict, running: Dict = None) -> List[str]:
+    """
+    Validate candidate settings.
+
+    Args:
+        values: Candidate settings
+        running: Running settings to compare types against (default: current config)
+
+    Returns:
+        List of error messages (empty = valid)
+    """
+    running = current_values() if running is None else running
+    errors = []
+
+    for key, new in values.items():
+        if key in running and not _same_type(running[key], new):
+            errors.append(f"{key}: expected {type(running[key]).__name__}, got {type(new).__name__}")
+    if errors:
+        return errors
+
+    merged = {**running, **values}
+    for key in POSITIVE:
+        if key in merged and not merged[key] > 0:
+            errors.append(f"{key} must be > 0 (got {merged[key]})")
+    for lower, upper in ORDERED_PAIRS:
+        if lower in merged and upper in merged and merged[upper] < merged[lower]:
+            errors.append(f"{upper} ({merged[upper]}) must be >= {lower} ({merged[lower]})")
+    if merged.get('HEATER_MIN_DELTA', 0) < 0:
+        errors.append(f"HEATER_MIN_DELTA must be >= 0 (got {merged['HEATER_MIN_DELTA']})")
+    if not 0 <= merged.get('TREND_MIN_R2', 0) <= 1:
+        errors.append(f"TREND_MIN_R2 must be within 0..1 (got {merged['TREND_MIN_R2']})")
+    if merged.get('TREND_HEATER_LEAD', 0) < 0:
+        errors.append(f"TREND_HEATER_LEAD must be >= 0 (got {merged['TREND_HEATER_LEAD']})")
+    budgets = merged.get('WATCHDOG_BUDGETS', {})
+    for stage in STAGES:
+        if not budgets.get(stage, 0) > 0:
+            errors.append(f"WATCHDOG_BUDGETS['{stage}'] must be > 0 (got {budgets.get(stage)})")
+    if merged.get('CADENCE_RELAX_FACTOR', 1.5) < 1:
+        errors.append(f"CADENCE_RELAX_FACTOR must be >= 1 (got {merged['CADENCE_RELAX_FACTOR']})")
+    noise = merged.get('AMBIENT_NOISE', {})
+    for source in AMBIENT_NOISE_KEYS:
+        if not noise.get(source, 0) > 0:
+            errors.append(f"AMBIENT_NOISE['{source}'] must be > 0 (got {noise.get(source)})")
+    if not 0 < merged.get('AMBIENT_OFFSET_ALPHA', 0.05) <= 1:
+        errors.append(f"AMBIENT_OFFSET_ALPHA must be within 0..1 (got {merged['AMBIENT_OFFSET_ALPHA']})")
+    if merged.get('FILTER_METHOD') not in FILTERS:
+        errors.append(f"FILTER_METHOD '{merged.get('FILTER_METHOD')}' unknown (use one of {', '.join(FILTERS)})")
+
+    return errors
+
+
+class ConfigWatcher:
+    """Polls config.py and applies valid changes between device cycles."""
+
+    def __init__(self, devices: Dict, path: str = None, interval: float = None):
+        """
+        Initialize watcher.
+
+        Args:
+            devices: Mapping name -> CloudWatcherDevice (must provide cycle_lock, apply_config())
+            path: Config file (default: the loaded config module)
+            interval: Poll interval in seconds (default: config.CONFIG_RELOAD_INTERVAL)
+        """
+        self.devices = devices
+        self.path = path or config.__file__
+        self.interval = interval or config.CONFIG_RELOAD_INTERVAL
+        self.thread: Optional[threading.Thread] = None
+
+        self.version = 1
+        self.digest = self._digest()
+        self.loaded_at = datetime.now(timezone.utc)
+        self.last_error: Optional[str] = None
+        self.last_changes: List[str] = []
+        self.restart_required: List[str] = []
+        self._mtime = self._stat()
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def _digest(self) -> Optional[str]:
+        try:
+            with open(self.path, 'rb') as f:
+                return hashlib.sha1(f.read()).hexdigest()[:12]
+        except OSError:
+            return None
+
+    def start(self):
+        """Start the polling thread."""
+        self.thread = threading.Thread(target=self._run, name='config-watcher', daemon=True)
+        self.thread.start()
+        logger.info(f"Config watcher started: {self.path} (every {self.interval}s)")
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Config reload check failed: {e}")
+
+    def check(self) -> bool:
+        """
+        Reload the config file if it changed.
+
+        Returns:
+            True if a new configuration was applied
+        """
+        mtime = self._stat()
+        if mtime is None or mtime == self._mtime:
+            return False
+        self._mtime = mtime
+
+        digest = self._digest()
+        if digest == self.digest:
+            return False
+
+        try:
+            values = load_values(self.path)
+        except Exception as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+            logger.error(f"Config reload rejected, file does not load: {self.last_error}")
+            return False
+
+        errors = validate(values)
+        if errors:
+            self.last_error = '; '.join(errors)
+            logger.error(f"Config reload rejected: {self.last_error}")
+            return False
+
+        try:
+            self.apply(values, digest)
+        except TimeoutError as e:
+            self.last_error = str(e)
+            self._mtime = None  # retry on next check
+            logger.warning(f"Config reload postponed: {e}")
+            return False
+        return True
+
+    def apply(self, values: Dict, digest: str = None):
+        """
+        Apply validated settings to config and all devices (between cycles).
+
+        Args:
+            values: Validated settings
+            digest: Content hash of the new file
+        """
+        running = current_values()
+        changed = sorted(k for k, v in values.items() if k not in running or running[k] != v)
+        restart = [k for k in changed if requires_restart(k)]
+        apply_keys = [k for k in changed if not requires_restart(k)]
+
+        with ExitStack() as stack:
+            for dev in self.devices.values():
+                # A stalled device must not block the reload forever (watchdog restarts it);
+                # a healthy cycle ends within the sum of its stage budgets
+                lock = dev.cycle_lock
+                if not lock.acquire(timeout=sum(config.WATCHDOG_BUDGETS.values())):
+                    raise TimeoutError(f"device '{dev.name}' busy, retrying")
+                stack.callback(lock.release)
+            for key in apply_keys:
+                setattr(config, key, values[key])
+            for dev in self.devices.values():
+                dev.apply_config()
+
+        self.version += 1
+        self.digest = digest
+        self.loaded_at = datetime.now(timezone.utc)
+        self.last_error = None
+        self.last_changes = apply_keys
+        self.restart_required = sorted(set(self.restart_required) | set(restart))
+
+        logger.info(
+            f"Config v{self.version} applied: {', '.join(apply_keys) or 'no reloadable changes'}"
+            + (f" (restart required for {', '.join(restart)})" if restart else "")
+        )
+
+    def get_status(self) -> Dict:
+        """Return active config version for /api/raw."""
+        return {
+            'version': self.version,
+            'hash': self.digest,
+            'loaded_at': self.loaded_at.isoformat(),
+            'last_changes': self.last_changes,
+            'restart_required': self.restart_required,
+            'last_error': self.last_error,
+        }
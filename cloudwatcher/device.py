@@ -0,0 +1,808 @@
+"""
+CloudWatcher Device Runtime
+Modified: 2026-10-19 - Initial creation (moved per-unit state out of cloudwatcher_service.py)
+Modified: 2026-10-19 - Store every reading in the history store
+Modified: 2026-10-19 - Warming state, snapshot persistence for instant data after restart
+Modified: 2026-10-19 - cycle_lock and apply_config() for live config reload
+Modified: 2026-10-19 - Heater writes via HeaterActuator (coalesced, Q! only for verification)
+Modified: 2026-10-19 - Rain-onset fast path (immediate event, MQTT/stream push, heater impulse)
+Modified: 2026-10-19 - Feed every reading into the rollup tiers
+Modified: 2026-10-19 - Injectable clock and reader factory (replay of recorded sessions)
+Modified: 2026-10-19 - Trend/nowcast engine, summary in every snapshot, heater look-ahead
+Modified: 2026-10-19 - Stage monitor, fail-safe heater PWM and worker restart for the watchdog
+Modified: 2026-10-19 - Fail-safe PWM gives up on a reader held by the stalled worker
+Modified: 2026-10-19 - Q! readback ignored when the rain fast path wrote the PWM during the read
+Modified: 2026-10-19 - Diagnostics link deltas reset with a restarted worker's reader
+Modified: 2026-10-19 - Rain-onset change event stamped with the device clock
+Modified: 2026-10-19 - Fused ambient estimate (ESP, PWS, rain sensor NTC) for heater control
+Modified: 2026-10-19 - Adaptive read cadence (cadence.py), woken early by rain onsets
+Modified: 2026-10-19 - Reading/HeaterStatus records instead of dicts in the data cache
+Modified: 2026-10-19 - persist_snapshot=False for replayed sessions (no snapshot file reads/writes)
+
+One CloudWatcherDevice per physical sky unit. Each device owns:
+- its reader (own serial port) and heater controller
+- its ambient temperature fusion (ambient_fusion.py), so heater control
+  continues through short ESP outages
+- its data cache, debounced flags, change tracker and diagnostics
+- its own I/O thread, so a slow or hanging unit never delays the others;
+  the pause between cycles follows the weather (cadence.py)
+- a StageMonitor (watchdog.py): every cycle stage runs under a latency
+  budget; a stalled worker is replaced by restart_worker()
+
+Startup: the last snapshot is restored from disk before the I/O thread
+opens the serial port, so the API has data immediately. Until the first
+live reading the device is in state 'warming' (quality 'warming').
+
+The web service (cloudwatcher_service.py) only holds the device
+registry and serves the per-device and aggregate routes.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import urllib.request
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional
+
+import config
+from ambient_fusion import AmbientFusion
+from cadence import CadenceController
+from clock import SYSTEM_CLOCK
+from heating_controller import PWM_MAX, HeatingController
+from heater_actuator import HeaterActuator
+from flag_state import FlagStateMachine
+from change_tracker import ChangeTracker
+from diagnostics import DiagnosticsPoller
+from rain_onset import RainFastPath
+from records import HeaterStatus, Reading
+from trends import TrendEngine
+from watchdog import StageMonitor, WorkerRetired
+
+logger = logging.getLogger(__name__)
+
+# Reading fields tracked by the change tracker (plus ESP and heater target below)
+SNAPSHOT_FIELDS = (
+    'sky_temp_c', 'rain_freq', 'is_raining', 'is_wet', 'heater_pwm',
+    'rain_sensor_temp_c', 'light_sensor_raw', 'mpsas', 'is_daylight',
+)
+_snapshot_values = Reading.getter(SNAPSHOT_FIELDS)
+
+# Stand-ins before the first reading / heater decision (all fields None)
+EMPTY_READING = Reading()
+EMPTY_HEATER = HeaterStatus()
+
+
+def fetch_esp_temps(esp_url: str = None) -> tuple[Optional[float], Optional[float]]:
+    """
+    Fetch ambient temperatures from ESP sensor (Temp2IoT).
+
+    Args:
+        esp_url: ESP API URL (default: config.ESP_URL)
+
+    Returns:
+        Tuple of (shadow_temp, sun_temp) in °C, or (None, None) if unavailable
+    """
+    try:
+        req = urllib.request.Request(esp_url or config.ESP_URL)
+        with urllib.request.urlopen(req, timeout=config.ESP_TIMEOUT) as response:
+            data = json.loads(response.read().decode('utf-8'))
+
+        shadow_temp = None
+        sun_temp = None
+
+        # Find both sensors in the response
+        for sensor in data.get('sensors', []):
+            name = sensor.get('name')
+            if name == config.ESP_SENSOR_NAME_SHADOW:
+                shadow_temp = float(sensor.get('value'))
+            elif name == config.ESP_SENSOR_NAME_SUN:
+                sun_temp = float(sensor.get('value'))
+
+        if shadow_temp is None:
+            logger.warning(f"Sensor '{config.ESP_SENSOR_NAME_SHADOW}' not found in ESP response")
+        if sun_temp is None:
+            logger.warning(f"Sensor '{config.ESP_SENSOR_NAME_SUN}' not found in ESP response")
+
+        return shadow_temp, sun_temp
+
+    except OSError as e:  # URLError, timeouts, connection resets
+        logger.warning(f"ESP fetch failed: {e}")
+        return None, None
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+        logger.warning(f"ESP parse error: {e}")
+        return None, None
+
+
+def fetch_pws_temp(pws_url: str = None) -> Optional[tuple[float, float]]:
+    """
+    Fetch the PWS temperature from the weather aggregator (api.php?action=current).
+
+    Args:
+        pws_url: Aggregator API URL (default: config.PWS_URL)
+
+    Returns:
+        Tuple of (temperature in °C, epoch seconds of the reading), or None if unavailable
+    """
+    try:
+        req = urllib.request.Request(pws_url or config.PWS_URL)
+        with urllib.request.urlopen(req, timeout=config.ESP_TIMEOUT) as response:
+            data = json.loads(response.read().decode('utf-8'))
+        value = data.get(config.PWS_TEMP_FIELD)
+        if value is None:
+            return None
+        timestamp = datetime.fromisoformat(data['timestamp'])
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        return float(value), timestamp.timestamp()
+
+    except OSError as e:  # URLError, timeouts, connection resets
+        logger.warning(f"PWS fetch failed: {e}")
+        return None
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+        logger.warning(f"PWS parse error: {e}")
+        return None
+
+
+def load_device_configs() -> Dict[str, Dict]:
+    """
+    Return device settings from config.DEVICES.
+
+    Without DEVICES a single device 'default' on config.SERIAL_PORT is used.
+    Missing per-device keys fall back to the global config values.
+    """
+    devices = getattr(config, 'DEVICES', None) or {'default': {}}
+    result = {}
+    for name, settings in devices.items():
+        result[name] = {
+            'serial_port': settings.get('serial_port', config.SERIAL_PORT),
+            'baudrate': settings.get('baudrate', config.BAUDRATE),
+            'heater_enabled': settings.get('heater_enabled', config.HEATER_ENABLED),
+            'esp_url': settings.get('esp_url', config.ESP_URL),
+        }
+    return result
+
+
+class CloudWatcherDevice:
+    """Reader, heater control and cached state of one CloudWatcher unit."""
+
+    def __init__(
+        self,
+        name: str,
+        serial_port: str = None,
+        baudrate: int = None,
+        heater_enabled: bool = None,
+        esp_url: str = None,
+        use_dummy: bool = False,
+        topic_prefix: str = None,
+        history=None,
+        rollups=None,
+        clock=None,
+        reader_factory: Callable[[], object] = None,
+        persist_snapshot: bool = True,
+    ):
+        """
+        Initialize device (reader is created in the I/O thread, see start()).
+
+        Args:
+            name: Device name used in routes (/api/<name>/data) and MQTT topics
+            serial_port: Serial port (default: config.SERIAL_PORT)
+            baudrate: Baudrate (default: config.BAUDRATE)
+            heater_enabled: Run heater control (default: config.HEATER_ENABLED)
+            esp_url: ESP ambient sensor URL (default: config.ESP_URL)
+            use_dummy: Use DummyCloudWatcherReader (no hardware)
+            topic_prefix: MQTT sub-topic for this device ('' = directly below base topic)
+            history: Shared HistoryStore (None = no history)
+            rollups: Shared RollupStore (None = no rollups)
+            clock: Time source shared with reader and heater controller (default: system clock)
+            reader_factory: Creates the reader instead of serial/dummy (e.g. ReplayReader)
+            persist_snapshot: Restore/save SNAPSHOT_PATH (False for replayed sessions)
+        """
+        self.name = name
+        self.serial_port = serial_port or config.SERIAL_PORT
+        self.baudrate = baudrate or config.BAUDRATE
+        self.heater_enabled = config.HEATER_ENABLED if heater_enabled is None else heater_enabled
+        self.esp_url = esp_url or config.ESP_URL
+        self._esp_url_from_config = not esp_url
+        self.use_dummy = use_dummy
+        self.topic_prefix = name if topic_prefix is None else topic_prefix
+
+        # Data cache (thread-safe via GIL for simple operations)
+        self.data_cache: Dict = {
+            'timestamp': None,
+            'data': None,
+            'raw_samples': None,
+            'device_info': None,
+            'error': None,
+            'heater_status': None,
+            'esp_temp_shadow': None,  # ESP ambient temp (shadow sensor) - used for heater control
+            'esp_temp_sun': None,     # ESP ambient temp (sun sensor)
+            'ambient': None,          # Fused ambient estimate (ambient_fusion.py) - used for heater control
+        }
+
+        self.reader = None
+        self.heater_controller = None
+        self.heater_actuator: Optional[HeaterActuator] = None
+        # Heater calculation/writes happen in the device thread and the rain fast path
+        self.heater_lock = threading.Lock()
+        self.rain_fast_path: Optional[RainFastPath] = None
+        self.last_rain_onset: Optional[str] = None
+        self.diagnostics: Optional[DiagnosticsPoller] = None
+        self.flag_states = FlagStateMachine.from_config()
+        self.change_tracker = ChangeTracker()
+        self.trends = TrendEngine()
+        self.ambient = AmbientFusion()
+        self.cadence = CadenceController()
+        # Set to end the pause between cycles early (rain onset)
+        self._wake = threading.Event()
+        # Last PWS reading (temperature, epoch seconds) and time of the last fetch attempt
+        self._pws: Optional[tuple[float, float]] = None
+        self._pws_fetched = 0.0
+        self.publisher = None
+        self.history = history
+        self.rollups = rollups
+        self.clock = clock or SYSTEM_CLOCK
+        self.reader_factory = reader_factory
+        self.thread: Optional[threading.Thread] = None
+        # Held during run_cycle(); config reload applies new values between cycles
+        # (replaced on worker restart, a hung worker may still hold the old one)
+        self.cycle_lock = threading.Lock()
+        # Stage deadlines of the I/O worker (see watchdog.py)
+        self.monitor = StageMonitor()
+        self._worker = threading.local()
+
+        # 'warming' until the first live reading, then 'ready'
+        self.state = 'warming'
+        self.on_ready: Optional[Callable[['CloudWatcherDevice'], None]] = None
+        self.snapshot_path = config.SNAPSHOT_PATH.format(device=name) if persist_snapshot else None
+        self._last_snapshot_save = 0.0
+
+    def start(self):
+        """Start the device's I/O thread."""
+        self.thread = threading.Thread(
+            target=self.run, name=f"reader-{self.name}", daemon=True)
+        self.thread.start()
+
+    def attach_publisher(self, publisher):
+        """Publish this device's changes and flag transitions via MQTT."""
+        self.publisher = publisher
+        self.change_tracker.add_listener(lambda event: publisher.on_change(
+            event, self.change_tracker.get_snapshot(), self._heater_dict(),
+            prefix=self.topic_prefix))
+
+    def restore_snapshot(self) -> bool:
+        """
+        Load the last persisted snapshot into the data cache.
+
+        Snapshots older than SNAPSHOT_MAX_AGE are ignored.
+
+        Returns:
+            True if a snapshot was restored
+        """
+        if self.snapshot_path is None:
+            return False
+        try:
+            with open(self.snapshot_path, encoding='utf-8') as f:
+                saved = json.load(f)
+            timestamp = datetime.fromisoformat(saved['timestamp'])
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"[{self.name}] Could not restore snapshot {self.snapshot_path}: {e}")
+            return False
+
+        age = (datetime.now(timezone.utc) - timestamp).total_seconds()
+        if age > config.SNAPSHOT_MAX_AGE:
+            logger.info(f"[{self.name}] Snapshot too old ({age:.0f}s), not restored")
+            return False
+
+        for key in ('device_info', 'esp_temp_shadow', 'esp_temp_sun', 'ambient'):
+            self.data_cache[key] = saved.get(key)
+        self.data_cache['data'] = Reading.from_dict(saved.get('data'))
+        self.data_cache['heater_status'] = HeaterStatus.from_dict(saved.get('heater_status'))
+        self.data_cache['timestamp'] = timestamp
+        self.data_cache['restored'] = True
+
+        # Seed the change tracker so /api/changes and streams start with data
+        self.change_tracker.update(self.build_snapshot(), timestamp)
+        logger.info(f"[{self.name}] Restored snapshot from {timestamp.isoformat()} ({age:.0f}s old)")
+        return True
+
+    def save_snapshot(self):
+        """Persist the current data cache (atomic replace)."""
+        if self.snapshot_path is None or self.data_cache['timestamp'] is None or self.data_cache.get('restored'):
+            return
+
+        saved = {
+            'timestamp': self.data_cache['timestamp'].isoformat(),
+            'data': self.data_cache['data'].to_dict(),
+            'device_info': self.data_cache['device_info'],
+            'heater_status': self._heater_dict(),
+            'esp_temp_shadow': self.data_cache.get('esp_temp_shadow'),
+            'esp_temp_sun': self.data_cache.get('esp_temp_sun'),
+            'ambient': self.data_cache.get('ambient'),
+        }
+        tmp_path = self.snapshot_path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(saved, f)
+            os.replace(tmp_path, self.snapshot_path)
+            self._last_snapshot_save = time.time()
+        except OSError as e:
+            logger.warning(f"[{self.name}] Could not save snapshot: {e}")
+
+    def _init_reader(self, fallback_dummy: bool = True):
+        """Open the serial reader (falls back to dummy reader on failure unless disabled)."""
+        from cloudwatcher_reader import CloudWatcherReader, DummyCloudWatcherReader
+
+        if self.reader_factory:
+            self.reader = self.reader_factory()
+            return
+
+        if self.use_dummy:
+            self.reader = DummyCloudWatcherReader()
+            return
+
+        try:
+            self.reader = CloudWatcherReader(port=self.serial_port, baudrate=self.baudrate)
+        except Exception as e:
+            logger.error(f"[{self.name}] Failed to initialize reader: {e}")
+            if not fallback_dummy:
+                raise
+            logger.info(f"[{self.name}] Falling back to dummy reader")
+            self.reader = DummyCloudWatcherReader()
+
+    def _stage(self, name: str):
+        """Run a cycle stage under the watchdog budget (raises WorkerRetired in a replaced worker)."""
+        return self.monitor.stage(name, getattr(self._worker, 'generation', self.monitor.generation))
+
+    def _setup(self):
+        """Create controllers on first start, hand the current reader to them on restart."""
+        if self.heater_enabled and self.heater_controller is None:
+            self.heater_controller = HeatingController(
+                min_delta=config.HEATER_MIN_DELTA,
+                max_delta=config.HEATER_MAX_DELTA,
+                impulse_temp=config.HEATER_IMPULSE_TEMP,
+                impulse_duration=config.HEATER_IMPULSE_DURATION,
+                impulse_cycle=config.HEATER_IMPULSE_CYCLE,
+                clock=self.clock,
+            )
+            self.heater_actuator = HeaterActuator(self.reader)
+            logger.info(f"[{self.name}] Heater controller initialized")
+        elif not self.heater_enabled:
+            logger.info(f"[{self.name}] Heater control disabled in config")
+        if self.heater_actuator:
+            self.heater_actuator.reader = self.reader
+
+        if self.diagnostics is None:
+            self.diagnostics = DiagnosticsPoller(self.reader)
+        self.diagnostics.set_reader(self.reader)
+
+        if config.RAIN_FAST_PATH_ENABLED and self.rain_fast_path is None:
+            self.rain_fast_path = RainFastPath(self)
+            self.rain_fast_path.start()
+
+    def run(self, restart: bool = False):
+        """
+        I/O thread: periodically reads sensor data and controls heater.
+
+        Args:
+            restart: Replaces a stalled worker (no dummy fallback if the port does not open)
+        """
+        self._worker.generation = self.monitor.generation
+        logger.info(f"[{self.name}] Reader thread {'restarted' if restart else 'started'} ({self.serial_port})")
+
+        try:
+            with self._stage('serial'):
+                self._init_reader(fallback_dummy=not restart)
+            self._setup()
+
+            # Get device info once
+            if self.data_cache['device_info'] is None:
+                try:
+                    with self._stage('serial'):
+                        self.data_cache['device_info'] = self.reader.read_device_info()
+                    logger.info(f"[{self.name}] Device info: {self.data_cache['device_info']}")
+                except WorkerRetired:
+                    raise
+                except Exception as e:
+                    logger.warning(f"[{self.name}] Could not read device info: {e}")
+
+            # Main reading and control loop
+            while True:
+                with self.cycle_lock:
+                    self.run_cycle()
+                self.clock.wait(self._wake, self.cadence.interval)
+                self._wake.clear()
+        except WorkerRetired:
+            logger.warning(f"[{self.name}] Replaced I/O worker exited")
+        except Exception as e:
+            logger.error(f"[{self.name}] I/O worker failed: {e}")
+
+    def restart_worker(self):
+        """
+        Replace a stalled I/O thread (called by the watchdog).
+
+        The old thread cannot be stopped; it is retired and exits at its
+        next stage. Its reader is closed in a helper thread (close() may
+        block on a dead adapter), which usually ends a hanging read; a
+        closed reader never reconnects and its read_all() raises
+        WorkerRetired, so the old worker cannot reopen the port.
+        """
+        self.monitor.retire_worker()
+        old_reader = self.reader
+        self.cycle_lock = threading.Lock()
+        if old_reader is not None:
+            threading.Thread(
+                target=self._close_reader, args=(old_reader,), name=f"close-{self.name}", daemon=True).start()
+        self.thread = threading.Thread(
+            target=self.run, kwargs={'restart': True}, name=f"reader-{self.name}", daemon=True)
+        self.thread.start()
+
+    def _close_reader(self, reader):
+        try:
+            reader.close()
+        except Exception as e:
+            logger.warning(f"[{self.name}] Closing stalled reader failed: {e}")
+
+    def fail_safe(self, pwm: int, reason: str) -> bool:
+        """
+        Drive the heater to a safe PWM (watchdog, control loop stalled).
+
+        The stalled worker may hang in read_all() with the serial port
+        locked; the write waits at most WATCHDOG_LOCK_TIMEOUT for it, so
+        heater_lock is never held behind the stalled reader (the new
+        worker's control stage drives the heater after a restart).
+
+        Returns:
+            True if the device runs at the safe PWM
+        """
+        if self.heater_actuator is None:
+            return False
+        if not self.heater_lock.acquire(timeout=config.WATCHDOG_LOCK_TIMEOUT):
+            logger.warning(f"[{self.name}] Safe heater PWM not set, heater busy")
+            return False
+        try:
+            done = self.heater_actuator.write(
+                pwm, self.clock.time(), timeout=config.WATCHDOG_LOCK_TIMEOUT) or self.heater_actuator.current_pwm == pwm
+            self.data_cache['heater_status'] = (self.data_cache['heater_status'] or EMPTY_HEATER).replace(
+                pwm=pwm, reason=reason)
+        finally:
+            self.heater_lock.release()
+        if done:
+            logger.warning(f"[{self.name}] Heater at safe PWM {pwm} ({reason})")
+        return done
+
+    def apply_config(self):
+        """Push reloaded config values into objects that copied them (called between cycles)."""
+        if self.heater_controller:
+            self.heater_controller.configure(
+                min_delta=config.HEATER_MIN_DELTA,
+                max_delta=config.HEATER_MAX_DELTA,
+                impulse_temp=config.HEATER_IMPULSE_TEMP,
+                impulse_duration=config.HEATER_IMPULSE_DURATION,
+                impulse_cycle=config.HEATER_IMPULSE_CYCLE,
+            )
+        if self.heater_actuator:
+            self.heater_actuator.configure(
+                min_step=config.HEATER_PWM_MIN_STEP,
+                refresh_interval=config.HEATER_PWM_REFRESH,
+                verify_interval=config.HEATER_PWM_VERIFY_INTERVAL,
+            )
+        self.flag_states.reconfigure()
+        self.change_tracker.deadbands = config.DEADBANDS
+        if self.diagnostics:
+            self.diagnostics.interval = config.DIAGNOSTICS_INTERVAL
+        if self.rain_fast_path:
+            self.rain_fast_path.configure()
+        self.trends.configure()
+        self.ambient.configure()
+        self.cadence.configure()
+        if self._esp_url_from_config:
+            self.esp_url = config.ESP_URL
+
+    def run_cycle(self):
+        """Run one read/control/publish cycle."""
+        data_cache = self.data_cache
+
+        try:
+            # 1. Read all sensor data (Q! readback only when the actuator wants to verify)
+            actuator = self.heater_actuator
+            verify = actuator is None or actuator.needs_verification(self.clock.time())
+            writes = actuator.stats['writes'] if actuator else None
+            with self._stage('serial'):
+                data = self.reader.read_all(include_pwm=verify)
+            if data and actuator:
+                with self.heater_lock:
+                    # A write during the read (rain fast path) makes the readback stale
+                    if data.heater_pwm is not None and actuator.stats['writes'] == writes:
+                        actuator.verify(data.heater_pwm, self.clock.time())
+                    else:
+                        data.heater_pwm = actuator.current_pwm
+
+            if data:
+                now = self.clock.now()
+                # Replace raw threshold flags by debounced states
+                transitions = self.flag_states.apply(data, now)
+                if transitions:
+                    self.cadence.note_event(now.timestamp())
+                if self.publisher:
+                    for transition in transitions:
+                        self.publisher.on_transition(transition, prefix=self.topic_prefix)
+
+                data_cache['timestamp'] = now
+                data_cache['data'] = data
+                data_cache['error'] = None
+                data_cache['restored'] = False
+
+                if self.state == 'warming':
+                    self.state = 'ready'
+                    logger.info(f"[{self.name}] First live reading, device ready")
+                    if self.on_ready:
+                        self.on_ready(self)
+                logger.debug(f"[{self.name}] Read data: sky={data.sky_temp_c}°C, rain={data.rain_freq}")
+
+                # 2. Heater control (if enabled and data available)
+                if self.heater_controller and data.rain_sensor_temp_c is not None:
+                    self._control_heater(data)
+
+                # 3. Update trends, publish fields that moved beyond their deadband, store history
+                with self._stage('publish'):
+                    snapshot = self.build_snapshot()
+                    snapshot.update(self.trends.update(now.timestamp(), snapshot))
+                    self.change_tracker.update(snapshot, now)
+                    if self.history:
+                        self.history.append(self.name, now.timestamp(), snapshot)
+                    if self.rollups:
+                        self.rollups.add(self.name, now.timestamp(), snapshot)
+
+                # 4. Pause until the next cycle, from the weather state of this one
+                self.cadence.update(
+                    now.timestamp(), snapshot,
+                    flags_pending=self.flag_states.pending(),
+                    heater=data_cache['heater_status'],
+                )
+            else:
+                data_cache['error'] = 'No data received'
+                logger.warning(f"[{self.name}] No data received from sensor")
+                self.cadence.fallback(self.clock.time(), 'no_data')
+
+        except WorkerRetired:
+            raise
+        except Exception as e:
+            data_cache['error'] = str(e)
+            logger.error(f"[{self.name}] Error in main loop: {e}")
+            self.cadence.fallback(self.clock.time(), 'error')
+
+        # 5. Low-priority diagnostics (between cycles, every DIAGNOSTICS_INTERVAL)
+        if self.diagnostics.is_due(self.clock.now()):
+            try:
+                with self._stage('serial'):
+                    self.diagnostics.poll(self.clock.now())
+            except WorkerRetired:
+                raise
+            except Exception as e:
+                logger.warning(f"[{self.name}] Diagnostics poll failed: {e}")
+
+        # 6. Persist snapshot for fast restarts
+        if self.snapshot_path and time.time() - self._last_snapshot_save >= config.SNAPSHOT_SAVE_INTERVAL:
+            with self._stage('publish'):
+                self.save_snapshot()
+
+    def _control_heater(self, data: Reading):
+        """Fetch and fuse ambient temperature, calculate and send heater PWM."""
+        # Fetch ambient temperatures from ESP (replay readers provide recorded values)
+        read_ambient = getattr(self.reader, 'read_ambient', None)
+        with self._stage('esp'):
+            shadow_temp, sun_temp = read_ambient() if read_ambient else fetch_esp_temps(self.esp_url)
+            if config.PWS_URL and not read_ambient and time.time() - self._pws_fetched >= config.PWS_FETCH_INTERVAL:
+                self._pws_fetched = time.time()
+                self._pws = fetch_pws_temp() or self._pws
+        self.data_cache['esp_temp_shadow'] = shadow_temp
+        self.data_cache['esp_temp_sun'] = sun_temp
+
+        if config.AMBIENT_FUSION_ENABLED:
+            self.ambient.update(
+                self.clock.time(),
+                shadow=shadow_temp,
+                sun=sun_temp,
+                pws=self._pws,
+                sensor_temp=data.rain_sensor_temp_c,
+                heater_pwm=data.heater_pwm,
+                is_daylight=data.is_daylight,
+            )
+            self.data_cache['ambient'] = self.ambient.get_status()
+            ambient_temp = round(self.ambient.estimate, 2) if self.ambient.valid else None
+        else:
+            ambient_temp = shadow_temp
+
+        if ambient_temp is None:
+            logger.debug(f"[{self.name}] No ambient temperature available, skipping heater control")
+            return
+
+        # Sensor margin expected TREND_HEATER_LEAD minutes ahead (trend of previous cycles)
+        predicted_delta = None
+        if config.TREND_HEATER_LEAD:
+            predicted_delta = self.trends.predict(
+                'sensor_delta_c', config.TREND_HEATER_LEAD, min_r2=config.TREND_MIN_R2)
+
+        with self._stage('control'), self.heater_lock:
+            # Calculate and set PWM (fused ambient estimate, or shadow sensor if fusion is off)
+            pwm, reason = self.heater_controller.calculate_pwm(
+                sensor_temp=data.rain_sensor_temp_c,
+                ambient_temp=ambient_temp,
+                rain_freq=data.rain_freq,
+                wet_threshold=config.WET_THRESHOLD,
+                is_wet=data.is_wet,
+                predicted_delta=predicted_delta,
+            )
+
+            # Send PWM to device (skipped if unchanged within HEATER_PWM_MIN_STEP)
+            if self.heater_actuator.write(pwm, self.clock.time()):
+                logger.debug(f"[{self.name}] Heater PWM={pwm}, reason={reason}")
+            data.heater_pwm = self.heater_actuator.current_pwm
+
+            # Update cache with heater status
+            self.data_cache['heater_status'] = self.heater_controller.get_status()
+
+    def on_rain_onset(self, event: Dict):
+        """
+        Handle a rain onset from the fast path (rain_onset.py thread).
+
+        Publishes the event via MQTT and the change stream right away and
+        starts impulse heating without waiting for the next cycle.
+        """
+        self.last_rain_onset = event['timestamp']
+        # Read at the fast cadence right away
+        self.cadence.note_event(self.clock.time())
+        self._wake.set()
+
+        if self.publisher:
+            self.publisher.on_transition(event, prefix=self.topic_prefix)
+
+        snapshot = self.build_snapshot()
+        snapshot['rain_freq'] = event['value']
+        self.change_tracker.update(snapshot, self.clock.now())
+
+        if self.heater_controller and self.heater_actuator:
+            with self.heater_lock:
+                self.heater_controller.trigger_impulse()
+                self.heater_actuator.write(PWM_MAX, self.clock.time())
+                self.data_cache['heater_status'] = self.heater_controller.get_status()
+
+    def build_snapshot(self) -> Dict:
+        """Build flat snapshot of the current values for change detection."""
+        data = self.data_cache['data'] or EMPTY_READING
+        heater = self.data_cache['heater_status'] or EMPTY_HEATER
+
+        snapshot = dict(zip(SNAPSHOT_FIELDS, _snapshot_values(data)))
+        snapshot['esp_temp_shadow_c'] = self.data_cache.get('esp_temp_shadow')
+        snapshot['esp_temp_sun_c'] = self.data_cache.get('esp_temp_sun')
+        snapshot['heater_target_pwm'] = heater.pwm
+        ambient = self.data_cache.get('ambient') or {}
+        snapshot['ambient_temp_c'] = ambient.get('ambient_temp_c')
+        snapshot['ambient_sigma_c'] = ambient.get('ambient_sigma_c')
+        snapshot['rain_onset'] = self.last_rain_onset
+        snapshot.update(self.trends.summary)
+        return snapshot
+
+    def _heater_dict(self) -> Optional[Dict]:
+        heater = self.data_cache['heater_status']
+        return heater.to_dict() if heater else None
+
+    def get_data_quality(self) -> str:
+        """Determine data quality based on age ('warming' until first live reading)."""
+        if self.state == 'warming':
+            return 'warming'
+        if self.data_cache['error']:
+            return 'error'
+        if self.data_cache['timestamp'] is None:
+            return 'error'
+
+        age = (self.clock.now() - self.data_cache['timestamp']).total_seconds()
+        if age > config.STALE_THRESHOLD:
+            return 'stale'
+        return 'ok'
+
+    def _timestamp_iso(self) -> Optional[str]:
+        ts = self.data_cache['timestamp']
+        return ts.isoformat() if ts else None
+
+    def get_data(self) -> Dict:
+        """
+        Return data for Weather-Aggregator integration (/api/data).
+
+        Note: ambient_temp_c is NOT provided - must come from PWS.
+        """
+        data = self.data_cache['data'] or EMPTY_READING
+        heater = self.data_cache['heater_status'] or EMPTY_HEATER
+        ambient = self.data_cache.get('ambient') or {}
+
+        return {
+            'timestamp': self._timestamp_iso(),
+            **dict(zip(SNAPSHOT_FIELDS, _snapshot_values(data))),
+            'quality': self.get_data_quality(),
+            'restored': bool(self.data_cache.get('restored')),
+            'read_interval_s': self.cadence.interval,
+            # ESP ambient temperatures
+            'esp_temp_shadow_c': self.data_cache.get('esp_temp_shadow'),
+            'esp_temp_sun_c': self.data_cache.get('esp_temp_sun'),
+            # Trend summary (slope, outlook, time-to-threshold in minutes)
+            'trends': dict(self.trends.summary),
+            # Heater control info
+            'heater_control': {
+                'enabled': self.heater_enabled,
+                'ambient_temp_c': heater.ambient_temp,  # Value used for control (fused or shadow)
+                'ambient_sigma_c': ambient.get('ambient_sigma_c'),
+                'ambient_source': ambient.get('ambient_source'),
+                'target_pwm': heater.pwm,
+                'reason': heater.reason,
+            } if self.heater_enabled else None,
+        }
+
+    def get_raw(self) -> Dict:
+        """Return raw debug data (/api/raw, without service-wide config)."""
+        return {
+            'device': self.name,
+            'state': self.state,
+            'restored': bool(self.data_cache.get('restored')),
+            'timestamp': self._timestamp_iso(),
+            'data': self.data_cache['data'].to_dict() if self.data_cache['data'] else None,
+            'device_info': self.data_cache['device_info'],
+            'error': self.data_cache['error'],
+            'heater_status': self._heater_dict(),
+            'esp_temp_shadow': self.data_cache.get('esp_temp_shadow'),
+            'esp_temp_sun': self.data_cache.get('esp_temp_sun'),
+            'ambient': self.data_cache.get('ambient'),
+            'flag_states': self.flag_states.get_status(),
+            'filter_stats': getattr(self.reader, 'filter_stats', None),
+            'rain_fast_path': self.rain_fast_path.get_status() if self.rain_fast_path else None,
+            'watchdog': self.monitor.get_status(),
+            'cadence': self.cadence.get_status(),
+        }
+
+    def get_trends(self) -> Dict:
+        """Return trend detail and nowcast (/api/trends)."""
+        return {
+            'device': self.name,
+            'timestamp': self._timestamp_iso(),
+            **self.trends.get_status(),
+        }
+
+    def get_heater(self) -> Dict:
+        """Return heater control status (/api/heater)."""
+        if not self.heater_enabled:
+            return {
+                'enabled': False,
+                'message': 'Heater control disabled in config',
+            }
+
+        heater = self.data_cache['heater_status'] or EMPTY_HEATER
+        data = self.data_cache['data'] or EMPTY_READING
+
+        return {
+            'enabled': True,
+            'timestamp': self._timestamp_iso(),
+            'esp_temp_shadow_c': self.data_cache.get('esp_temp_shadow'),
+            'esp_temp_sun_c': self.data_cache.get('esp_temp_sun'),
+            'ambient_temp_c': heater.ambient_temp,
+            'ambient': self.data_cache.get('ambient'),
+            'sensor_temp_c': heater.sensor_temp,
+            'delta_c': heater.delta,
+            'target_pwm': heater.pwm,
+            'actual_pwm': data.heater_pwm,
+            'reason': heater.reason,
+            'in_impulse': heater.in_impulse,
+            'config': heater.config,
+            'actuator': self.heater_actuator.get_status() if self.heater_actuator else None,
+        }
+
+    def get_device_config(self) -> Dict:
+        """Return per-device settings for /api/raw."""
+        return {
+            'serial_port': self.serial_port,
+            'baudrate': self.baudrate,
+            'heater_enabled': self.heater_enabled,
+            'esp_url': self.esp_url,
+        }
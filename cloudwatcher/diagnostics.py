@@ -0,0 +1,154 @@
+"""
+CloudWatcher Device Diagnostics
+Modified: 2026-10-19 - Initial creation
+Modified: 2026-10-19 - set_reader(): link deltas start over with a replaced reader
+
+Low-priority poller for the device's internal error counters (D!) and
+switch status (F!).
+
+Every DIAGNOSTICS_INTERVAL seconds (between regular read cycles, so it
+never competes with sampling) the poller reads the counters and stores
+the deltas since the previous poll. The deltas are correlated with the
+incomplete responses / serial errors the reader saw in the same
+interval: device-side errors together with incomplete responses point
+to a bad serial link (cable, USB adapter), incomplete responses alone
+rather to timing or a busy device.
+"""
+
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class DiagnosticsPoller:
+    """Periodically reads D!/F! and keeps a history of error deltas."""
+
+    def __init__(self, reader, interval: float = None, history_size: int = None):
+        """
+        Initialize poller.
+
+        Args:
+            reader: CloudWatcherReader (or compatible)
+            interval: Poll interval in seconds (default: config.DIAGNOSTICS_INTERVAL)
+            history_size: Number of polls kept (default: config.DIAGNOSTICS_HISTORY)
+        """
+        self.reader = reader
+        self.interval = interval or config.DIAGNOSTICS_INTERVAL
+        self.history: deque = deque(maxlen=history_size or config.DIAGNOSTICS_HISTORY)
+
+        self.last_poll: Optional[datetime] = None
+        self.last_errors: Optional[Dict[str, int]] = None
+        self.last_switch: Optional[str] = None
+        self._last_link: Dict[str, int] = {}
+
+    def set_reader(self, reader):
+        """Use another reader (worker restart); its link statistics start at zero."""
+        if reader is not self.reader:
+            self.reader = reader
+            self._last_link = {}
+
+    def is_due(self, now: Optional[datetime] = None) -> bool:
+        """Return True if the next poll is due."""
+        if self.last_poll is None:
+            return True
+        now = now or datetime.now(timezone.utc)
+        return (now - self.last_poll).total_seconds() >= self.interval
+
+    def _link_delta(self) -> Dict[str, int]:
+        """Return reader link statistics since the previous poll."""
+        link = dict(getattr(self.reader, 'link_stats', {}))
+        delta = {key: value - self._last_link.get(key, 0) for key, value in link.items()}
+        self._last_link = link
+        return delta
+
+    def poll(self, now: Optional[datetime] = None) -> Optional[Dict]:
+        """
+        Read error counters and switch status once.
+
+        Returns:
+            History entry, or None if the device did not answer D!
+        """
+        now = now or datetime.now(timezone.utc)
+        self.last_poll = now
+
+        errors = self.reader.read_errors()
+        switch = self.reader.read_switch()
+        link = self._link_delta()
+
+        if errors is None:
+            logger.warning("Diagnostics: no response to D!")
+            return None
+
+        if self.last_errors is None:
+            # First poll: counters are cumulative since power-up, no delta yet
+            error_delta = None
+        else:
+            # Counter decreased -> device was reset, counters restarted at 0
+            error_delta = {
+                name: value - self.last_errors.get(name, 0) if value >= self.last_errors.get(name, 0) else value
+                for name, value in errors.items()
+            }
+
+        if switch != self.last_switch and self.last_switch is not None:
+            logger.info(f"Diagnostics: switch changed {self.last_switch} -> {switch}")
+
+        self.last_errors = errors
+        self.last_switch = switch
+
+        device_errors = sum(error_delta.values()) if error_delta else 0
+        link_failures = link.get('incomplete', 0) + link.get('serial_errors', 0)
+
+        entry = {
+            'timestamp': now.isoformat(),
+            'errors': errors,
+            'error_delta': error_delta,
+            'switch': switch,
+            'link_delta': link,
+            # Device counted errors while we saw failed responses: likely link problem
+            'correlated': device_errors > 0 and link_failures > 0,
+        }
+        self.history.append(entry)
+
+        if device_errors or link_failures:
+            logger.warning(
+                f"Diagnostics: {device_errors} device error(s), {link_failures} failed response(s) "
+                f"in last {self.interval}s"
+            )
+        return entry
+
+    def get_status(self, limit: int = None) -> Dict:
+        """Return summary and history for /api/diagnostics."""
+        history: List[Dict] = list(self.history)
+        if limit:
+            history = history[-limit:]
+
+        totals = {}
+        correlated = 0
+        for entry in self.history:
+            for name, value in (entry['error_delta'] or {}).items():
+                totals[name] = totals.get(name, 0) + value
+            correlated += entry['correlated']
+
+        link = getattr(self.reader, 'link_stats', {})
+        commands = link.get('commands', 0)
+        failures = link.get('incomplete', 0) + link.get('serial_errors', 0)
+
+        return {
+            'interval_s': self.interval,
+            'last_poll': self.last_poll.isoformat() if self.last_poll else None,
+            'switch': self.last_switch,
+            'errors': self.last_errors,
+            'error_delta_total': totals,
+            'correlated_intervals': correlated,
+            'link': {
+                **link,
+                'failure_rate': round(failures / commands, 4) if commands else None,
+                'recent_events': list(getattr(self.reader, 'link_events', []))[-20:],
+            },
+            'history': history,
+        }
@@ -0,0 +1,148 @@
+"""
+CloudWatcher History Downsampling
+Modified: 2026-10-19 - Initial creation
+Modified: 2026-10-19 - max_points below the method's minimum is rejected
+
+Shape-preserving reduction of time series to a maximum number of points,
+so chart payloads scale with screen width instead of time span.
+
+Methods:
+- 'lttb':   Largest-Triangle-Three-Buckets. Keeps first and last point and
+            per bucket the point forming the largest triangle with the
+            previously selected point and the average of the next bucket.
+            The bucket loop is sequential by definition, all work inside a
+            bucket is vectorised.
+- 'minmax': Per bucket the minimum and maximum (in time order). Fully
+            vectorised; preserves spikes exactly (e.g. rain onset drops).
+
+Requires NumPy. Missing values (NaN) are dropped per channel before
+downsampling.
+"""
+
+from typing import Dict, Tuple
+
+import numpy as np
+
+METHODS = ('lttb', 'minmax')
+# Smallest max_points a method can honour (LTTB keeps first and last point)
+MIN_POINTS = {'lttb': 3, 'minmax': 2}
+
+
+def _bucket_edges(n: int, buckets: int) -> np.ndarray:
+    """Return bucket start indices (length buckets + 1) over n points."""
+    return np.linspace(0, n, buckets + 1).astype(np.int64)
+
+
+def lttb(x: np.ndarray, y: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Select indices of at most max_points points using LTTB.
+
+    Args:
+        x: Sorted x values (timestamps)
+        y: y values (no NaN)
+        max_points: Target number of points (>= 3)
+
+    Returns:
+        Sorted index array
+    """
+    n = len(x)
+    if max_points >= n or max_points < 3:
+        return np.arange(n)
+
+    # Inner points 1 .. n-2 divided into max_points - 2 buckets
+    edges = _bucket_edges(n - 2, max_points - 2) + 1
+    starts, ends = edges[:-1], edges[1:]
+
+    # Average point of every bucket (for the "next bucket" corner), vectorised
+    counts = ends - starts
+    avg_x = np.add.reduceat(x[1:n - 1], starts - 1) / counts
+    avg_y = np.add.reduceat(y[1:n - 1], starts - 1) / counts
+    # Next-bucket average for the last bucket is the last point
+    next_x = np.append(avg_x[1:], x[-1])
+    next_y = np.append(avg_y[1:], y[-1])
+
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+
+    for i in range(max_points - 2):
+        s, e = starts[i], ends[i]
+        # Twice the triangle area for all candidates of the bucket at once
+        area = np.abs(
+            (x[a] - next_x[i]) * (y[s:e] - y[a])
+            - (x[a] - x[s:e]) * (next_y[i] - y[a])
+        )
+        a = s + int(np.argmax(area))
+        selected[i + 1] = a
+
+    return selected
+
+
+def minmax(x: np.ndarray, y: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Select per bucket the indices of minimum and maximum (max_points // 2 buckets).
+
+    Args:
+        x: Sorted x values (timestamps)
+        y: y values (no NaN)
+        max_points: Target number of points (>= 2)
+
+    Returns:
+        Sorted, unique index array
+    """
+    n = len(x)
+    buckets = max_points // 2
+    if max_points >= n or buckets < 1:
+        return np.arange(n)
+
+    edges = _bucket_edges(n, buckets)
+    starts = edges[:-1]
+    bucket_id = np.repeat(np.arange(buckets), np.diff(edges))
+
+    mins = np.minimum.reduceat(y, starts)
+    maxs = np.maximum.reduceat(y, starts)
+
+    # First occurrence of the bucket min/max (np.unique returns first index per bucket)
+    is_min = np.flatnonzero(y == mins[bucket_id])
+    is_max = np.flatnonzero(y == maxs[bucket_id])
+    _, first_min = np.unique(bucket_id[is_min], return_index=True)
+    _, first_max = np.unique(bucket_id[is_max], return_index=True)
+
+    return np.unique(np.concatenate((is_min[first_min], is_max[first_max])))
+
+
+def downsample(
+    ts: np.ndarray,
+    channels: Dict[str, np.ndarray],
+    max_points: int,
+    method: str = 'lttb',
+) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """
+    Downsample every channel to at most max_points points.
+
+    Args:
+        ts: Timestamps (sorted, epoch seconds)
+        channels: Mapping channel -> values (same length as ts, NaN = missing)
+        max_points: Maximum points per channel
+        method: 'lttb' or 'minmax'
+
+    Returns:
+        Mapping channel -> (timestamps, values)
+
+    Raises:
+        ValueError: Unknown method or max_points below MIN_POINTS of the method
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown downsampling method '{method}' (use one of {', '.join(METHODS)})")
+    if max_points < MIN_POINTS[method]:
+        raise ValueError(f"max_points must be 0 (all) or at least {MIN_POINTS[method]} for '{method}'")
+    select = lttb if method == 'lttb' else minmax
+
+    result = {}
+    for name, values in channels.items():
+        valid = ~np.isnan(values)
+        x, y = ts[valid], values[valid]
+        idx = select(x, y, max_points)
+        result[name] = (x[idx], y[idx])
+    return result
@@ -0,0 +1,238 @@
+"""
+CloudWatcher History Export
+Modified: 2026-10-19 - Initial creation
+
+Streams the stored history (history_store.py) in columnar form:
+
+- 'arrow':   Arrow IPC stream, one record batch per chunk (requires pyarrow)
+- 'parquet': Parquet, one row group per chunk (requires pyarrow)
+- 'csv':     CSV with header (stdlib, fallback if pyarrow is missing)
+
+Rows are read in chunks of EXPORT_CHUNK_ROWS with keyset pagination and
+every chunk is encoded and yielded before the next one is read, so
+memory stays flat regardless of the time range.
+
+Column 'ts' is the reading time: timestamp[ms, UTC] in Arrow/Parquet,
+epoch seconds in CSV. Flags (is_*) are booleans (0/1 in CSV).
+
+Usage (CLI, directly on the history database):
+    python3 export.py --hours 24 -o last_day.csv
+    python3 export.py --start 2026-01-01 --end 2027-01-01 --format parquet -o 2026.parquet
+    python3 export.py --channels sky_temp_c,rain_freq --format arrow -o sky.arrows
+
+    import pandas as pd
+    df = pd.read_parquet('2026.parquet')
+"""
+
+import argparse
+import csv
+import io
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Iterator, List, Optional, Sequence
+
+import config
+from history_store import CHANNELS, HistoryStore
+
+FORMATS = ('arrow', 'parquet', 'csv')
+
+# Content type and file extension per format
+MEDIA_TYPES = {
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'csv': ('text/csv', 'csv'),
+}
+
+
+def have_pyarrow() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def default_format() -> str:
+    """Arrow if pyarrow is installed, else CSV."""
+    return 'arrow' if have_pyarrow() else 'csv'
+
+
+def check_format(fmt: Optional[str]) -> str:
+    """Validate export format (None = default_format())."""
+    fmt = fmt or default_format()
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}' (use one of {', '.join(FORMATS)})")
+    if fmt != 'csv' and not have_pyarrow():
+        raise ValueError(f"Format '{fmt}' requires pyarrow (pip install pyarrow), use format=csv")
+    return fmt
+
+
+def _arrow_schema(channels: Sequence[str]):
+    import pyarrow as pa
+
+    types = {'REAL': pa.float64(), 'INTEGER': pa.int64()}
+    fields = [pa.field('ts', pa.timestamp('ms', tz='UTC'))]
+    for name in channels:
+        fields.append(pa.field(name, pa.bool_() if name.startswith('is_') else types[CHANNELS[name]]))
+    return pa.schema(fields)
+
+
+def _arrow_batch(schema, rows: List[tuple]):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    columns = list(zip(*rows))
+    ts_ms = pc.round(pc.multiply(pa.array(columns[0], type=pa.float64()), 1000))
+    arrays = [pc.cast(ts_ms, pa.int64()).cast(schema.field(0).type)]
+    for i, values in enumerate(columns[1:], start=1):
+        field_type = schema.field(i).type
+        if field_type == pa.bool_():
+            # Flags are stored as 0/1
+            arrays.append(pa.array(values, type=pa.int8()).cast(field_type))
+        else:
+            arrays.append(pa.array(values, type=field_type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class _Drain(io.RawIOBase):
+    """Write-only sink whose content is taken out after every chunk."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        return len(data)
+
+    def take(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def _export_arrow(chunks, channels) -> Iterator[bytes]:
+    import pyarrow as pa
+
+    schema = _arrow_schema(channels)
+    sink = _Drain()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        yield sink.take()
+        for rows in chunks:
+            writer.write_batch(_arrow_batch(schema, rows))
+            yield sink.take()
+    yield sink.take()
+
+
+def _export_parquet(chunks, channels) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema(channels)
+    sink = _Drain()
+    with pq.ParquetWriter(sink, schema, compression='zstd') as writer:
+        for rows in chunks:
+            writer.write_table(pa.Table.from_batches([_arrow_batch(schema, rows)]))
+            yield sink.take()
+    yield sink.take()
+
+
+def _export_csv(chunks, channels) -> Iterator[bytes]:
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(['ts', *channels])
+    for rows in chunks:
+        writer.writerows(rows)
+        yield out.getvalue().encode('utf-8')
+        out.seek(0)
+        out.truncate()
+    if out.tell():
+        yield out.getvalue().encode('utf-8')
+
+
+def export_history(
+    store: HistoryStore,
+    device: str,
+    start: float,
+    end: float,
+    channels: Optional[Sequence[str]] = None,
+    fmt: str = None,
+    chunk_rows: int = None,
+) -> Iterator[bytes]:
+    """
+    Lazily encode the history of a device.
+
+    Args:
+        store: History store
+        device: Device name
+        start: UTC epoch seconds (inclusive)
+        end: UTC epoch seconds (inclusive)
+        channels: Channel names (default: all)
+        fmt: 'arrow', 'parquet' or 'csv' (default: default_format())
+        chunk_rows: Rows per chunk (default: config.EXPORT_CHUNK_ROWS)
+
+    Returns:
+        Iterator of encoded byte chunks (concatenated = complete file)
+    """
+    fmt = check_format(fmt)
+    channels = store.check_channels(channels)
+    chunks = store.iter_rows(device, start, end, channels, chunk_rows or config.EXPORT_CHUNK_ROWS)
+    if fmt == 'csv':
+        return _export_csv(chunks, channels)
+    if fmt == 'parquet':
+        return _export_parquet(chunks, channels)
+    return _export_arrow(chunks, channels)
+
+
+def _parse_time(value: str) -> float:
+    """Epoch seconds or ISO 8601 (naive = UTC)."""
+    try:
+        return float(value)
+    except ValueError:
+        ts = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        return (ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)).timestamp()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export CloudWatcher history (Arrow/Parquet/CSV)')
+    parser.add_argument('--db', default=config.HISTORY_DB, help='History database')
+    parser.add_argument('--device', default='default', help='Device name')
+    parser.add_argument('--start', help='Start (epoch seconds or ISO 8601, default: end - hours)')
+    parser.add_argument('--end', help='End (epoch seconds or ISO 8601, default: now)')
+    parser.add_argument('--hours', type=float, default=24, help='Time range if --start is not given')
+    parser.add_argument('--channels', help='Comma-separated channels (default: all)')
+    parser.add_argument('--format', choices=FORMATS, help='Output format (default: arrow if pyarrow installed, else csv)')
+    parser.add_argument('--chunk-rows', type=int, help='Rows per chunk')
+    parser.add_argument('-o', '--output', help='Output file (default: stdout)')
+    args = parser.parse_args()
+
+    end = _parse_time(args.end) if args.end else time.time()
+    start = _parse_time(args.start) if args.start else end - args.hours * 3600
+
+    if not os.path.exists(args.db):
+        parser.error(f"History database not found: {args.db}")
+
+    try:
+        store = HistoryStore(args.db)
+        chunks = export_history(
+            store, args.device, start, end,
+            channels=args.channels.split(',') if args.channels else None,
+            fmt=args.format, chunk_rows=args.chunk_rows)
+    except ValueError as e:
+        parser.error(str(e))
+
+    out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,311 @@
+"""
+CloudWatcher Federation
+Modified: 2026-10-19 - Initial creation
+Modified: 2026-10-19 - Resync on a new upstream boot id, data age from the change timestamps
+Modified: 2026-10-19 - Resync when a change event does not continue the known sequence
+
+Merges several CloudWatcher services (observatory sites) into one view
+for the federation gateway (federation_gateway.py).
+
+Every site (FEDERATION_SITES) is followed over exactly two long-lived
+upstream connections, however many clients query the gateway:
+
+- change stream (/api/stream, Server-Sent Events): keeps the site's
+  snapshot current. Resumes with Last-Event-ID ("<boot>:<seq>") after a
+  reconnect; a restarted service (new boot id) answers with a full
+  snapshot, and a partial event of an unexpected boot id or one that
+  does not continue the known sequence forces a reconnect from scratch. The data age comes from the upstream change
+  timestamps and the replicated readings, never from the arrival time.
+- replication feed (/api/feed, long poll): copies the site's readings
+  into the gateway's own history database (FEDERATION_DB, same schema as
+  history_store.py, one "device" per site). The feed cursor is stored in
+  the same transaction as the rows, so the gateway resumes exactly where
+  it stopped after a restart or an outage of either side.
+
+Latest values of all sites, per-site history and health are served from
+this cache; the Pis only see the gateway's two connections per site.
+
+Per-site health:
+    live     stream connected, newest reading within FEDERATION_STALE_AFTER
+    stale    connected, but no new reading for FEDERATION_STALE_AFTER
+    offline  stream disconnected (retried with backoff up to FEDERATION_RETRY_MAX)
+"""
+
+import json
+import logging
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import config
+from history_store import HistoryStore
+
+logger = logging.getLogger(__name__)
+
+# Flags indexed across sites (latest(): 'index')
+INDEXED_FLAGS = ('is_raining', 'is_wet', 'is_daylight')
+
+CURSOR_KEY = 'feed_cursor:{site}'
+
+
+def load_site_configs() -> Dict[str, Dict]:
+    """
+    Return site name -> {'url', 'device'} from config.FEDERATION_SITES.
+
+    A site is either a base URL or a dict with 'url' and optional 'device'
+    (device name on a multi-device service, default: its default device).
+    """
+    sites = {}
+    for name, site in getattr(config, 'FEDERATION_SITES', {}).items():
+        if isinstance(site, str):
+            site = {'url': site}
+        if not site.get('url'):
+            raise ValueError(f"Federation site '{name}' has no url")
+        sites[name] = {'url': site['url'].rstrip('/'), 'device': site.get('device')}
+    return sites
+
+
+def _epoch(timestamp: Optional[str]) -> Optional[float]:
+    try:
+        return datetime.fromisoformat(timestamp).timestamp() if timestamp else None
+    except ValueError:
+        return None
+
+
+class Site:
+    """Cached state of one upstream CloudWatcher service."""
+
+    def __init__(self, name: str, url: str, device: Optional[str] = None):
+        self.name = name
+        self.url = url
+        self.device = device
+        self.snapshot: Dict = {}
+        self.seq: Optional[int] = None      # upstream change sequence (Last-Event-ID)
+        self.boot: Optional[str] = None     # upstream boot id the sequence belongs to
+        self.version = 0                    # gateway version of the last change
+        self.data_ts: Optional[float] = None  # newest reading or upstream change (epoch)
+        # Stream state
+        self.connected = False
+        self.last_seen: Optional[float] = None  # any frame incl. keep-alive
+        self.reconnects = 0
+        self.last_error: Optional[str] = None
+        # Feed state
+        self.cursor: Optional[str] = None
+        self.synced_rows = 0
+        self.backfilling = True
+        self.gaps = 0
+
+    def endpoint(self, name: str, **params) -> str:
+        path = f"/api/{urllib.parse.quote(self.device)}/{name}" if self.device else f"/api/{name}"
+        query = urllib.parse.urlencode({k: v for k, v in params.items() if v is not None})
+        return f"{self.url}{path}" + (f"?{query}" if query else '')
+
+    def health(self, now: float) -> Dict:
+        age = now - self.data_ts if self.data_ts else None
+        if not self.connected:
+            status = 'offline'
+        elif age is None or age > config.FEDERATION_STALE_AFTER:
+            status = 'stale'
+        else:
+            status = 'live'
+        return {
+            'status': status,
+            'data_age_s': round(age, 1) if age is not None else None,
+            'connected': self.connected,
+            'last_seen_s': round(now - self.last_seen, 1) if self.last_seen else None,
+            'reconnects': self.reconnects,
+            'last_error': self.last_error,
+            'backfilling': self.backfilling,
+            'synced_rows': self.synced_rows,
+            'gaps': self.gaps,
+        }
+
+
+class Federation:
+    """Sites, their subscriber threads and the merged view."""
+
+    def __init__(self, sites: Dict[str, Dict], store: Optional[HistoryStore] = None):
+        """
+        Initialize federation.
+
+        Args:
+            sites: name -> {'url', 'device'} (see load_site_configs())
+            store: History database for the replicated readings (default: FEDERATION_DB)
+        """
+        self.store = store or HistoryStore(config.FEDERATION_DB, config.FEDERATION_RETENTION_DAYS)
+        self.sites = {name: Site(name, **site) for name, site in sites.items()}
+        self.version = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        for site in self.sites.values():
+            site.cursor = self.store.get_meta(CURSOR_KEY.format(site=site.name))
+
+    def start(self):
+        for site in self.sites.values():
+            for target, kind in ((self._follow_stream, 'stream'), (self._follow_feed, 'feed')):
+                threading.Thread(
+                    target=self._retry, args=(site, target, kind),
+                    name=f"federation-{kind}-{site.name}", daemon=True).start()
+        logger.info(f"Federation: following {len(self.sites)} site(s): {', '.join(self.sites)}")
+
+    def stop(self):
+        self._stop.set()
+
+    def _retry(self, site: Site, target, kind: str):
+        """Run a follower until stopped, reconnecting with exponential backoff."""
+        delay = config.FEDERATION_RETRY_MIN
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                target(site)
+            except (OSError, ValueError, KeyError) as e:  # URLError, timeouts, resets, bad payloads
+                site.last_error = f"{kind}: {e}"
+                logger.warning(f"[{site.name}] Federation {kind} failed: {e}")
+            finally:
+                if kind == 'stream':
+                    site.connected = False
+            # A connection that stayed up for a while starts over with a short delay
+            if time.monotonic() - started > config.FEDERATION_RETRY_MAX:
+                delay = config.FEDERATION_RETRY_MIN
+            self._stop.wait(delay)
+            delay = min(delay * 2, config.FEDERATION_RETRY_MAX)
+            if kind == 'stream':
+                site.reconnects += 1
+
+    def _follow_stream(self, site: Site):
+        """Read the site's change stream until it ends or times out."""
+        headers = {'Accept': 'text/event-stream'}
+        if site.seq is not None:
+            headers['Last-Event-ID'] = f"{site.boot}:{site.seq}" if site.boot else str(site.seq)
+        # First connection: since=0 returns the full snapshot
+        url = site.endpoint('stream', since=0 if site.seq is None else None)
+        request = urllib.request.Request(url, headers=headers)
+        with urllib.request.urlopen(request, timeout=config.FEDERATION_STREAM_TIMEOUT) as response:
+            site.connected = True
+            site.last_error = None
+            logger.info(f"[{site.name}] Federation stream connected ({site.url})")
+            data = []
+            for raw in response:
+                if self._stop.is_set():
+                    return
+                site.last_seen = time.time()
+                line = raw.decode('utf-8').rstrip('\r\n')
+                if line.startswith('data:'):
+                    data.append(line[5:].lstrip())
+                elif not line and data:
+                    self._apply(site, json.loads('\n'.join(data)))
+                    data = []
+                # 'id:', 'event:' and ': keep-alive' lines need no handling
+        raise OSError("stream closed by server")
+
+    def _apply(self, site: Site, event: Dict):
+        """Merge a change event into the site's snapshot."""
+        with self._lock:
+            if event.get('full'):
+                site.snapshot = dict(event['changes'])
+            elif event.get('boot') != site.boot:
+                # Diff against another run's sequence: start over with a full snapshot
+                site.seq = site.boot = None
+                raise ValueError(f"upstream restarted (boot {event.get('boot')}), resyncing")
+            elif event.get('since', event['seq'] - 1) != site.seq:
+                # Catch-up frames cover since..seq, live events exactly one step
+                expected = site.seq
+                site.seq = site.boot = None
+                raise ValueError(f"change sequence gap (after {expected}, got {event['seq']}), resyncing")
+            else:
+                site.snapshot.update(event['changes'])
+            site.seq = event['seq']
+            site.boot = event.get('boot')
+            changed = _epoch(event.get('timestamp'))
+            if changed is not None:
+                site.data_ts = max(site.data_ts or 0, changed)
+            self.version += 1
+            site.version = self.version
+
+    def _follow_feed(self, site: Site):
+        """Copy the site's readings into the local store (long poll, resumes at the stored cursor)."""
+        key = CURSOR_KEY.format(site=site.name)
+        while not self._stop.is_set():
+            url = site.endpoint('feed', after=site.cursor, limit=config.FEDERATION_FEED_LIMIT,
+                                wait=config.FEDERATION_FEED_WAIT)
+            try:
+                with urllib.request.urlopen(
+                        url, timeout=config.FEDERATION_FEED_WAIT + config.FEDERATION_HTTP_TIMEOUT) as response:
+                    page = json.loads(response.read().decode('utf-8'))
+            except urllib.error.HTTPError as e:
+                if e.code != 410:
+                    raise
+                # Upstream database replaced: start over at its oldest reading
+                logger.warning(f"[{site.name}] Federation feed cursor stale, restarting")
+                site.cursor = None
+                self.store.delete_meta(key)
+                continue
+
+            items = page['items']
+            if page.get('gap'):
+                site.gaps += 1
+                logger.warning(f"[{site.name}] Federation feed gap (readings pruned upstream)")
+            if items:
+                self.store.append_many(
+                    site.name, ((item['ts'], item) for item in items), meta={key: page['next_cursor']})
+                site.synced_rows += len(items)
+                with self._lock:
+                    site.data_ts = max(site.data_ts or 0, items[-1]['ts'])
+            site.cursor = page['next_cursor']
+            site.backfilling = page['has_more']
+
+    def get_site(self, name: str) -> Optional[Site]:
+        return self.sites.get(name)
+
+    def site_view(self, site: Site, now: float) -> Dict:
+        return {
+            'url': site.url,
+            'device': site.device,
+            'version': site.version,
+            'timestamp': datetime.fromtimestamp(site.data_ts, timezone.utc).isoformat() if site.data_ts else None,
+            'data': dict(site.snapshot),
+            'health': site.health(now),
+        }
+
+    def latest(self, since: int = 0) -> Dict:
+        """
+        Return the merged view of all sites.
+
+        Args:
+            since: Gateway version of the previous call; only sites changed after it are included
+
+        Returns:
+            {'version', 'since', 'sites': {name: view}, 'index': {flag/status: [site names]}}
+        """
+        now = time.time()
+        with self._lock:
+            views = {name: self.site_view(site, now) for name, site in self.sites.items()}
+            version = self.version
+
+        index: Dict[str, List[str]] = {flag: [] for flag in INDEXED_FLAGS}
+        index.update(live=[], stale=[], offline=[])
+        for name, view in views.items():
+            index[view['health']['status']].append(name)
+            for flag in INDEXED_FLAGS:
+                if view['data'].get(flag):
+                    index[flag].append(name)
+
+        return {
+            'version': version,
+            'since': since,
+            'sites': {name: view for name, view in views.items() if view['version'] > since},
+            'index': index,
+        }
+
+    def get_health(self) -> Dict:
+        """Return per-site health and counts per status."""
+        now = time.time()
+        sites = {name: site.health(now) for name, site in self.sites.items()}
+        counts = {status: 0 for status in ('live', 'stale', 'offline')}
+        for health in sites.values():
+            counts[health['status']] += 1
+        return {'sites': sites, 'counts': counts}
@@ -0,0 +1,158 @@
+"""
+CloudWatcher Federation Gateway
+Modified: 2026-10-19 - Initial creation
+
+Single endpoint for several CloudWatcher services (FEDERATION_SITES, see
+federation.py). Weather aggregator, MagicMirror and dashboards query the
+gateway instead of one hardcoded Pi; every site is followed over one
+change stream and one feed long poll, independent of the number of
+clients.
+
+- All sites (latest values, per-site health, flag index) at /api/sites
+  (?since=<version> returns only sites changed since a previous call)
+- One site at /api/sites/<site>
+- Replicated history of a site at /api/sites/<site>/history
+- Health summary at /api/sites/health (HTTP 503 when no site is live)
+
+Usage:
+    python3 federation_gateway.py
+"""
+
+import logging
+import signal
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from flask import Flask, abort, jsonify, request
+from werkzeug.serving import make_server
+
+import config
+from federation import Federation, load_site_configs
+from history_store import HistoryStore
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+app = Flask(__name__)
+
+federation: Optional[Federation] = None
+
+
+def parse_time(value: Optional[str]) -> Optional[float]:
+    """Parse query time (epoch seconds or ISO 8601, naive = UTC) to epoch seconds."""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    ts = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
+
+
+def get_site(name: str):
+    site = federation.get_site(name)
+    if site is None:
+        abort(404, description=f"Unknown site '{name}'")
+    return site
+
+
+@app.route('/api/sites')
+def api_sites():
+    """Return latest values and health of all sites (?since=<version>: changed sites only)."""
+    return jsonify(federation.latest(request.args.get('since', 0, type=int)))
+
+
+@app.route('/api/sites/health')
+def api_sites_health():
+    """Return per-site health; 503 if no site is live."""
+    health = federation.get_health()
+    return jsonify(health), 200 if health['counts']['live'] else 503
+
+
+@app.route('/api/sites/<site>')
+def api_site(site):
+    """Return latest values and health of one site."""
+    return jsonify({'site': site, **federation.site_view(get_site(site), time.time())})
+
+
+@app.route('/api/sites/<site>/history')
+def api_site_history(site):
+    """
+    Return the replicated history of a site, optionally downsampled.
+
+    Query parameters as /api/history of the service:
+        hours / start / end: Time range (default: last 24 h)
+        channels: Comma-separated channel names (default: all)
+        max_points: Maximum points per channel (default: HISTORY_MAX_POINTS, 0 = all)
+        method: 'lttb' (default) or 'minmax'
+    """
+    from downsample import downsample
+
+    site = get_site(site)
+    try:
+        end = parse_time(request.args.get('end')) or time.time()
+        start = parse_time(request.args.get('start'))
+        if start is None:
+            start = end - request.args.get('hours', 24, type=float) * 3600
+        channels = request.args.get('channels')
+        channels = HistoryStore.check_channels(channels.split(',') if channels else None)
+        max_points = request.args.get('max_points', config.HISTORY_MAX_POINTS, type=int)
+        method = request.args.get('method', 'lttb')
+
+        ts, values = federation.store.query_arrays(site.name, start, end, channels)
+        if max_points:
+            series = downsample(ts, values, max_points, method)
+        else:
+            series = {name: (ts, v) for name, v in values.items()}
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({
+        'site': site.name,
+        'start': start,
+        'end': end,
+        'method': method if max_points else None,
+        'max_points': max_points,
+        'raw_points': len(ts),
+        'backfilling': site.backfilling,
+        'channels': {
+            # NaN is not valid JSON -> null
+            name: {'t': t.tolist(), 'v': [None if v != v else v for v in y.tolist()]}
+            for name, (t, y) in series.items()
+        },
+    })
+
+
+def shutdown(signum=None, frame=None):
+    logger.info("Shutting down")
+    if federation is not None:
+        federation.stop()
+    raise SystemExit(0)
+
+
+def main():
+    global federation
+
+    sites = load_site_configs()
+    if not sites:
+        raise SystemExit("No sites configured (config.FEDERATION_SITES)")
+    federation = Federation(sites)
+    federation.start()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    logger.info(f"Starting federation gateway on {config.FEDERATION_HOST}:{config.FEDERATION_PORT}")
+    server = make_server(config.FEDERATION_HOST, config.FEDERATION_PORT, app, threaded=True)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+CloudWatcher Replication Feed
+Modified: 2026-10-19 - Initial creation
+
+Catch-up feed over the history store (history_store.py) for downstream
+consumers (aggregator, MagicMirror host):
+
+    GET /api/feed?after=<cursor>&limit=500&wait=20
+
+returns the readings of a device stored after the cursor, oldest first,
+plus the cursor to continue with. A consumer keeps the last cursor it
+processed and resumes there after an outage, paging through the backlog
+with large limits; with `wait` the request blocks until new readings
+arrive (long poll) instead of polling at high frequency.
+
+Cursors are opaque strings (base64 of store id and row id). Row ids are
+never reused and the store id changes when the database is recreated,
+so a cursor is valid as long as its database exists:
+
+- cursor of another database (deleted/replaced): StaleCursor, HTTP 410,
+  consumer restarts without `after`
+- the cursor's reading was pruned (HISTORY_RETENTION_DAYS): the feed
+  continues at the oldest retained row and reports 'gap': true
+"""
+
+import base64
+import binascii
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Sequence
+
+import config
+from history_store import HistoryStore
+
+CURSOR_VERSION = 'v1'
+
+
+class StaleCursor(ValueError):
+    """Cursor from another (replaced) history database."""
+
+
+def encode_cursor(store_id: str, row_id: int) -> str:
+    raw = f"{CURSOR_VERSION}:{store_id}:{row_id}".encode('ascii')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, store_id: str) -> int:
+    """
+    Return the row id of a cursor.
+
+    Raises:
+        ValueError: Malformed cursor
+        StaleCursor: Cursor of another database
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('ascii')
+        version, cursor_store, row_id = raw.split(':')
+        row_id = int(row_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError(f"Invalid cursor '{cursor}'")
+    if version != CURSOR_VERSION or row_id < 0:
+        raise ValueError(f"Invalid cursor '{cursor}'")
+    if cursor_store != store_id:
+        raise StaleCursor("Cursor belongs to a previous history database, restart without 'after'")
+    return row_id
+
+
+def read_feed(
+    store: HistoryStore,
+    device: str,
+    after: Optional[str] = None,
+    limit: int = None,
+    channels: Optional[Sequence[str]] = None,
+    wait: float = 0,
+) -> Dict:
+    """
+    Return one feed page.
+
+    Args:
+        store: History store
+        device: Device name
+        after: Cursor of the last processed reading (None = from the oldest retained row)
+        limit: Maximum readings (default FEED_PAGE_SIZE, at most FEED_MAX_LIMIT)
+        channels: Channel names (default: all)
+        wait: Seconds to wait for new readings if there are none (at most FEED_MAX_WAIT)
+
+    Returns:
+        {'device', 'items': [{'cursor', 'ts', 'timestamp', channels...}], 'next_cursor',
+         'has_more', 'gap'}
+    """
+    limit = config.FEED_PAGE_SIZE if limit is None else limit
+    if not 1 <= limit <= config.FEED_MAX_LIMIT:
+        raise ValueError(f"limit must be within 1..{config.FEED_MAX_LIMIT}")
+    channels = store.check_channels(channels)
+    after_id = decode_cursor(after, store.store_id) if after else 0
+
+    deadline = time.monotonic() + min(max(wait, 0), config.FEED_MAX_WAIT)
+    rows = store.rows_after(device, after_id, limit + 1, channels)
+    while not rows and time.monotonic() < deadline:
+        store.wait_for_append(deadline - time.monotonic())
+        rows = store.rows_after(device, after_id, limit + 1, channels)
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    # The cursor's reading itself was pruned: readings after it may be missing too
+    gap = False
+    if after_id:
+        oldest, _ = store.id_range(device)
+        gap = oldest is not None and oldest > after_id
+
+    items = []
+    for row in rows:
+        item = {
+            'cursor': encode_cursor(store.store_id, row[0]),
+            'ts': row[1],
+            'timestamp': datetime.fromtimestamp(row[1], timezone.utc).isoformat(),
+        }
+        for name, value in zip(channels, row[2:]):
+            item[name] = bool(value) if name.startswith('is_') and value is not None else value
+        items.append(item)
+
+    return {
+        'device': device,
+        'items': items,
+        'next_cursor': items[-1]['cursor'] if items else after,
+        'has_more': has_more,
+        'gap': gap,
+    }
@@ -0,0 +1,150 @@
+"""
+CloudWatcher Sample Filters
+Modified: 2026-10-19 - Initial creation
+Modified: 2026-10-19 - median/trimmed report MAD-band outliers as rejected, not every unused sample
+
+Robust estimators for combining the per-cycle samples of a channel.
+
+Available methods (config.FILTER_METHOD):
+- 'mean':    plain average, nothing rejected
+- 'sigma':   legacy filter - drop samples outside mean +- k * stdev
+             (k=1 rejects about a third of good Gaussian samples)
+- 'median':  median
+- 'mad':     drop samples outside median +- k * 1.4826 * MAD, average the rest
+- 'trimmed': drop the lowest/highest fraction, average the rest
+
+Every filter returns a FilterResult with the estimate, the number of
+samples it is based on and the number of rejected outliers, so outlier
+rates can be reported per channel. 'rejected' means the same for every
+robust method: samples outside median +- OUTLIER_K * 1.4826 * MAD (the
+mad filter with its own k). Samples median/trimmed merely leave out of
+the estimate are not outliers, clean data reports 0.
+"""
+
+from typing import Callable, Dict, List, NamedTuple
+
+# Scale factor so that MAD estimates the standard deviation for Gaussian data
+MAD_SCALE = 1.4826
+
+# k of the MAD band that counts outliers for median/trimmed (as the mad default)
+OUTLIER_K = 3.0
+
+
+class FilterResult(NamedTuple):
+    value: float
+    used: int
+    rejected: int
+
+
+def _median(values: List[float]) -> float:
+    ordered = sorted(values)
+    n = len(ordered)
+    mid = n // 2
+    if n % 2:
+        return ordered[mid]
+    return (ordered[mid - 1] + ordered[mid]) / 2.0
+
+
+def _outliers(values: List[float], med: float, k: float) -> int:
+    """Count samples outside median +- k * scaled MAD (MAD 0: all samples differing from the median)."""
+    if len(values) < 3:
+        return 0
+    mad = _median([abs(x - med) for x in values]) * MAD_SCALE
+    if mad == 0:
+        return sum(1 for x in values if x != med)
+    return sum(1 for x in values if abs(x - med) > k * mad)
+
+
+def filter_mean(values: List[float], param: float = 0.0) -> FilterResult:
+    """Plain average."""
+    return FilterResult(sum(values) / len(values), len(values), 0)
+
+
+def filter_sigma(values: List[float], param: float = 1.0) -> FilterResult:
+    """Average of samples within mean +- param * population stdev."""
+    avg = sum(values) / len(values)
+    if len(values) < 3:
+        return FilterResult(avg, len(values), 0)
+
+    std = (sum((x - avg) ** 2 for x in values) / len(values)) ** 0.5
+    if std == 0:
+        return FilterResult(avg, len(values), 0)
+
+    kept = [x for x in values if avg - param * std <= x <= avg + param * std]
+    if not kept:
+        return FilterResult(avg, len(values), 0)
+    return FilterResult(sum(kept) / len(kept), len(kept), len(values) - len(kept))
+
+
+def filter_median(values: List[float], param: float = 0.0) -> FilterResult:
+    """Median (one or two middle samples used, MAD-band outliers counted as rejected)."""
+    med = _median(values)
+    used = 1 if len(values) % 2 else 2
+    return FilterResult(med, used, _outliers(values, med, OUTLIER_K))
+
+
+def filter_mad(values: List[float], param: float = 3.0) -> FilterResult:
+    """Average of samples within median +- param * scaled MAD."""
+    med = _median(values)
+    if len(values) < 3:
+        return FilterResult(sum(values) / len(values), len(values), 0)
+
+    mad = _median([abs(x - med) for x in values]) * MAD_SCALE
+    if mad == 0:
+        # More than half the samples identical: keep exactly those
+        kept = [x for x in values if x == med]
+    else:
+        kept = [x for x in values if abs(x - med) <= param * mad]
+
+    if not kept:
+        return FilterResult(med, 1, len(values) - 1)
+    return FilterResult(sum(kept) / len(kept), len(kept), len(values) - len(kept))
+
+
+def filter_trimmed(values: List[float], param: float = 0.2) -> FilterResult:
+    """Average after dropping fraction `param` of samples at each end."""
+    n = len(values)
+    cut = int(n * param)
+    if n - 2 * cut < 1:
+        cut = (n - 1) // 2
+    kept = sorted(values)[cut:n - cut]
+    return FilterResult(sum(kept) / len(kept), len(kept), _outliers(values, _median(values), OUTLIER_K))
+
+
+FILTERS: Dict[str, Callable[[List[float], float], FilterResult]] = {
+    'mean': filter_mean,
+    'sigma': filter_sigma,
+    'median': filter_median,
+    'mad': filter_mad,
+    'trimmed': filter_trimmed,
+}
+
+# Default parameter per method (k for sigma/mad, fraction for trimmed)
+DEFAULT_PARAMS = {
+    'mean': 0.0,
+    'sigma': 1.0,
+    'median': 0.0,
+    'mad': 3.0,
+    'trimmed': 0.2,
+}
+
+
+def apply_filter(values: List[float], method: str = 'mad', param: float = None) -> FilterResult:
+    """
+    Combine samples with the given method.
+
+    Args:
+        values: Samples (may be empty)
+        method: One of FILTERS
+        param: Method parameter (default: DEFAULT_PARAMS[method])
+
+    Returns:
+        FilterResult (value 0.0 for empty input)
+    """
+    if method not in FILTERS:
+        raise ValueError(f"Unknown filter method '{method}' (use one of {', '.join(FILTERS)})")
+    if not values:
+        return FilterResult(0.0, 0, 0)
+    if param is None:
+        param = DEFAULT_PARAMS[method]
+    return FILTERS[method](values, param)
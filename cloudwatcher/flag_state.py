@@ -0,0 +1,230 @@
+"""
+CloudWatcher Debounced Flag State Machine
+Modified: 2026-10-19 - Initial creation
+Modified: 2026-10-19 - reconfigure() for live config reload (keeps flag states)
+Modified: 2026-10-19 - pending() (dwell running, read cadence stays fast)
+Modified: 2026-10-19 - apply() works on Reading records
+
+Turns noisy threshold comparisons (is_raining, is_wet, is_daylight) into
+stable boolean states.
+
+Each flag has:
+- an enter threshold (value below it switches the flag on)
+- an exit threshold (value at/above it switches the flag off again)
+- minimum dwell times: the condition must hold that long before the
+  state actually changes
+
+Values between enter and exit threshold keep the current state
+(hysteresis band). Every real state change is recorded as a
+timestamped transition event, so downstream consumers only react to
+genuine changes instead of single-cycle flapping.
+"""
+
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import config
+from records import Reading
+
+logger = logging.getLogger(__name__)
+
+# Number of transition events kept for the API
+MAX_TRANSITIONS = 100
+
+
+class DebouncedFlag:
+    """Single boolean flag with enter/exit thresholds and dwell times."""
+
+    def __init__(
+        self,
+        name: str,
+        enter_below: float,
+        exit_above: float,
+        min_on_s: float = 0.0,
+        min_off_s: float = 0.0,
+    ):
+        """
+        Initialize flag.
+
+        Args:
+            name: Flag name (e.g. 'is_raining')
+            enter_below: Value below this switches the flag on
+            exit_above: Value at/above this switches the flag off (>= enter_below)
+            min_on_s: Condition must hold this long before switching on (seconds)
+            min_off_s: Condition must hold this long before switching off (seconds)
+        """
+        if exit_above < enter_below:
+            raise ValueError(f"{name}: exit threshold {exit_above} below enter threshold {enter_below}")
+
+        self.name = name
+        self.enter_below = enter_below
+        self.exit_above = exit_above
+        self.min_on_s = min_on_s
+        self.min_off_s = min_off_s
+
+        self.state: Optional[bool] = None
+        self.since: Optional[datetime] = None
+        self._pending_since: Optional[datetime] = None
+
+    def update(self, value: float, now: datetime) -> Optional[Dict]:
+        """
+        Feed a new value into the state machine.
+
+        Args:
+            value: Current measured value
+            now: Timestamp of the measurement
+
+        Returns:
+            Transition event dict if the state changed, otherwise None
+        """
+        # First value: adopt raw state immediately (no dwell on startup)
+        if self.state is None:
+            self.state = value < self.enter_below
+            self.since = now
+            return None
+
+        if self.state:
+            wants_change = value >= self.exit_above
+            dwell = self.min_off_s
+        else:
+            wants_change = value < self.enter_below
+            dwell = self.min_on_s
+
+        if not wants_change:
+            self._pending_since = None
+            return None
+
+        if self._pending_since is None:
+            self._pending_since = now
+
+        if (now - self._pending_since).total_seconds() < dwell:
+            return None
+
+        self.state = not self.state
+        self.since = now
+        self._pending_since = None
+
+        return {
+            'flag': self.name,
+            'state': self.state,
+            'value': value,
+            'threshold': self.enter_below if self.state else self.exit_above,
+            'timestamp': now.isoformat(),
+        }
+
+    @property
+    def pending(self) -> bool:
+        """True while a state change waits for its dwell time."""
+        return self._pending_since is not None
+
+    def configure(self, enter_below: float, exit_above: float, min_on_s: float, min_off_s: float):
+        """Update thresholds and dwell times (current state is kept)."""
+        if exit_above < enter_below:
+            raise ValueError(f"{self.name}: exit threshold {exit_above} below enter threshold {enter_below}")
+        self.enter_below = enter_below
+        self.exit_above = exit_above
+        self.min_on_s = min_on_s
+        self.min_off_s = min_off_s
+
+    def get_status(self) -> Dict:
+        """Return current flag status for API/debugging."""
+        return {
+            'state': self.state,
+            'since': self.since.isoformat() if self.since else None,
+            'pending': self.pending,
+            'enter_below': self.enter_below,
+            'exit_above': self.exit_above,
+            'min_on_s': self.min_on_s,
+            'min_off_s': self.min_off_s,
+        }
+
+
+class FlagStateMachine:
+    """
+    Debounces the rain, wet and daylight flags of a reading.
+
+    Source fields:
+        is_raining  <- rain_freq
+        is_wet      <- rain_freq
+        is_daylight <- mpsas
+    """
+
+    def __init__(self, flags: Dict[str, tuple]):
+        """
+        Initialize state machine.
+
+        Args:
+            flags: Mapping flag name -> (source field, DebouncedFlag)
+        """
+        self.flags = flags
+        self.transitions: deque = deque(maxlen=MAX_TRANSITIONS)
+
+    @staticmethod
+    def _config_thresholds() -> Dict[str, tuple]:
+        """Return flag name -> (source field, enter, exit) from config.py."""
+        return {
+            'is_raining': ('rain_freq', config.RAIN_THRESHOLD, config.RAIN_EXIT_THRESHOLD),
+            'is_wet': ('rain_freq', config.WET_THRESHOLD, config.WET_EXIT_THRESHOLD),
+            'is_daylight': ('mpsas', config.MPSAS_DAYLIGHT_THRESHOLD, config.MPSAS_DAYLIGHT_EXIT_THRESHOLD),
+        }
+
+    @classmethod
+    def from_config(cls) -> 'FlagStateMachine':
+        """Create state machine from config.py thresholds."""
+        on_s = config.FLAG_MIN_DWELL_ON
+        off_s = config.FLAG_MIN_DWELL_OFF
+        return cls({
+            name: (field, DebouncedFlag(name, enter, exit_, on_s, off_s))
+            for name, (field, enter, exit_) in cls._config_thresholds().items()
+        })
+
+    def reconfigure(self):
+        """Apply current config.py thresholds to the existing flags (states are kept)."""
+        for name, (_, enter, exit_) in self._config_thresholds().items():
+            if name in self.flags:
+                self.flags[name][1].configure(enter, exit_, config.FLAG_MIN_DWELL_ON, config.FLAG_MIN_DWELL_OFF)
+
+    def apply(self, data: Reading, now: Optional[datetime] = None) -> List[Dict]:
+        """
+        Update all flags from a reading and overwrite its raw flags.
+
+        Flags whose source field is missing (None) in the reading are left untouched.
+
+        Args:
+            data: Reading from read_all() (modified in place)
+            now: Timestamp of the reading (default: current UTC time)
+
+        Returns:
+            List of transition events (empty if nothing changed)
+        """
+        now = now or datetime.now(timezone.utc)
+        events = []
+
+        for flag_name, (field, flag) in self.flags.items():
+            value = getattr(data, field)
+            if value is None:
+                continue
+
+            event = flag.update(value, now)
+            if event:
+                events.append(event)
+                self.transitions.append(event)
+                logger.info(f"Flag {flag_name} -> {event['state']} ({field}={value})")
+
+            setattr(data, flag_name, flag.state)
+
+        return events
+
+    def pending(self) -> bool:
+        """True if any flag waits for its dwell time."""
+        return any(flag.pending for _, flag in self.flags.values())
+
+    def get_status(self) -> Dict:
+        """Return status of all flags."""
+        return {name: flag.get_status() for name, (_, flag) in self.flags.items()}
+
+    def get_transitions(self, limit: int = MAX_TRANSITIONS) -> List[Dict]:
+        """Return the most recent transition events (oldest first)."""
+        return list(self.transitions)[-limit:]
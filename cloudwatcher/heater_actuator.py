@@ -0,0 +1,151 @@
+"""
+CloudWatcher Heater Actuator
+Modified: 2026-10-19 - Initial creation
+Modified: 2026-10-19 - write() timeout for a busy reader (watchdog safe PWM)
+
+Sits between HeatingController and the reader and decides when a
+Pxxxx! command is actually sent:
+
+- only if the target differs from the current PWM by at least
+  HEATER_PWM_MIN_STEP, or reaches 0 / full power exactly,
+- or if HEATER_PWM_REFRESH seconds passed since the last write (keeps
+  the device in sync after a power cycle).
+
+The echo of set_pwm() (device answers !Q with the set value) is trusted
+as the current PWM. Q! is only read when verification is due (at start,
+after a failed write and every HEATER_PWM_VERIFY_INTERVAL seconds);
+read_all() skips the Q! query otherwise.
+"""
+
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+import config
+from heating_controller import PWM_MAX, PWM_MIN
+
+logger = logging.getLogger(__name__)
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat() if ts is not None else None
+
+
+class HeaterActuator:
+    """Coalesces PWM writes and tracks the device PWM from write echoes."""
+
+    def __init__(
+        self,
+        reader,
+        min_step: int = None,
+        refresh_interval: float = None,
+        verify_interval: float = None,
+    ):
+        """
+        Initialize actuator.
+
+        Args:
+            reader: CloudWatcherReader (or compatible, set_pwm() and last_pwm_ack)
+            min_step: Minimum PWM change that is sent (default: config.HEATER_PWM_MIN_STEP)
+            refresh_interval: Resend unchanged PWM after this many seconds (default: config.HEATER_PWM_REFRESH)
+            verify_interval: Read back PWM with Q! after this many seconds (default: config.HEATER_PWM_VERIFY_INTERVAL)
+        """
+        self.reader = reader
+        self.min_step = config.HEATER_PWM_MIN_STEP if min_step is None else min_step
+        self.refresh_interval = refresh_interval or config.HEATER_PWM_REFRESH
+        self.verify_interval = verify_interval or config.HEATER_PWM_VERIFY_INTERVAL
+
+        # Current device PWM (from write echo or Q! verification), None = unknown
+        self.current_pwm: Optional[int] = None
+        self.last_write: Optional[float] = None
+        self.last_verify: Optional[float] = None
+        self._verify_pending = True
+
+        self.stats = {'writes': 0, 'skipped': 0, 'failed': 0, 'verifications': 0, 'mismatches': 0}
+
+    def configure(self, min_step: int, refresh_interval: float, verify_interval: float):
+        """Update coalescing parameters (live config reload)."""
+        self.min_step = min_step
+        self.refresh_interval = refresh_interval
+        self.verify_interval = verify_interval
+
+    def needs_write(self, target: int, now: float = None) -> bool:
+        """Return True if target should be sent to the device."""
+        now = time.time() if now is None else now
+        if self.current_pwm is None or self.last_write is None:
+            return True
+        if target == self.current_pwm:
+            return now - self.last_write >= self.refresh_interval
+        # Off and full power are always applied exactly
+        if target in (PWM_MIN, PWM_MAX):
+            return True
+        return abs(target - self.current_pwm) >= self.min_step or now - self.last_write >= self.refresh_interval
+
+    def write(self, target: int, now: float = None, timeout: float = None) -> bool:
+        """
+        Send target PWM if needed.
+
+        Args:
+            target: Requested PWM 0-1023
+            now: Epoch seconds (default: time.time())
+            timeout: Give up if the reader is busy for longer (default: wait)
+
+        Returns:
+            True if a command was sent and acknowledged
+        """
+        now = time.time() if now is None else now
+        target = max(PWM_MIN, min(PWM_MAX, int(target)))
+
+        if not self.needs_write(target, now):
+            self.stats['skipped'] += 1
+            return False
+
+        if not self.reader.set_pwm(target, timeout=timeout):
+            self.stats['failed'] += 1
+            self._verify_pending = True
+            logger.warning(f"Failed to set PWM to {target}")
+            return False
+
+        self.stats['writes'] += 1
+        self.last_write = now
+        echo = getattr(self.reader, 'last_pwm_ack', None)
+        self.current_pwm = target if echo is None else echo
+        logger.debug(f"Heater PWM={self.current_pwm} (target {target})")
+        return True
+
+    def needs_verification(self, now: float = None) -> bool:
+        """Return True if the next read should include a Q! readback."""
+        now = time.time() if now is None else now
+        if self._verify_pending or self.last_verify is None:
+            return True
+        return now - self.last_verify >= self.verify_interval
+
+    def verify(self, measured_pwm: int, now: float = None):
+        """
+        Compare a Q! readback with the tracked PWM.
+
+        A mismatch (e.g. device power cycle) replaces the tracked value,
+        so the next write() resends the target.
+        """
+        self.stats['verifications'] += 1
+        self.last_verify = time.time() if now is None else now
+        self._verify_pending = False
+
+        if self.current_pwm is not None and measured_pwm != self.current_pwm:
+            self.stats['mismatches'] += 1
+            logger.warning(f"Heater PWM mismatch: expected {self.current_pwm}, device reports {measured_pwm}")
+            self.last_write = None
+        self.current_pwm = measured_pwm
+
+    def get_status(self) -> Dict:
+        """Return actuator status for API/debugging."""
+        return {
+            'current_pwm': self.current_pwm,
+            'last_write': _iso(self.last_write),
+            'last_verify': _iso(self.last_verify),
+            'min_step': self.min_step,
+            'refresh_interval': self.refresh_interval,
+            'verify_interval': self.verify_interval,
+            'stats': dict(self.stats),
+        }
@@ -2,6 +2,12 @@
 CloudWatcher Rain Sensor Heating Controller
 Modified: 2026-02-04 20:40 - Initial creation
 Modified: 2026-02-04 21:00 - BUGFIX: Impulse heating only when WET, not just cold
+Modified: 2026-10-19 - Accept debounced is_wet flag in calculate_pwm()
+Modified: 2026-10-19 - configure() for live config reload (keeps impulse state)
+Modified: 2026-10-19 - trigger_impulse() for the rain-onset fast path
+Modified: 2026-10-19 - Injectable clock (virtual time for replay)
+Modified: 2026-10-19 - Optional predicted delta (trend look-ahead) in calculate_pwm()
+Modified: 2026-10-19 - get_status() returns a HeaterStatus record, config block built on configure only
 
 Implements the AAG CloudWatcher rain sensor heater control algorithm.
 Based on INDI driver implementation and manufacturer Variations table.
@@ -19,7 +25,10 @@ Control strategy:
 
 import logging
 from typing import Optional, Tuple
-from datetime import datetime, timezone
+from datetime import datetime, timedelta
+
+from clock import SYSTEM_CLOCK
+from records import HeaterStatus
 
 logger = logging.getLogger(__name__)
 
@@ -79,6 +88,7 @@ class HeatingController:
         impulse_temp: float = DEFAULT_IMPULSE_TEMP,
         impulse_duration: int = DEFAULT_IMPULSE_DURATION,
         impulse_cycle: int = DEFAULT_IMPULSE_CYCLE,
+        clock=None,
     ):
         """
         Initialize heater controller.
@@ -89,16 +99,21 @@ class HeatingController:
             impulse_temp: Ambient temp threshold for impulse heating (°C)
             impulse_duration: Duration of impulse heating (seconds)
             impulse_cycle: Period of impulse heating cycle (seconds)
+            clock: Time source (default: system clock, VirtualClock for replay)
         """
+        self.clock = clock or SYSTEM_CLOCK
         self.min_delta = min_delta
         self.max_delta = max_delta
         self.impulse_temp = impulse_temp
         self.impulse_duration = impulse_duration
         self.impulse_cycle = impulse_cycle
+        self._config_status = self._build_config_status()
 
         # State for impulse timing
         self._last_impulse_start: Optional[datetime] = None
         self._in_impulse = False
+        # Impulse started by trigger_impulse() runs to the end even if not (yet) wet
+        self._forced_impulse_until: Optional[datetime] = None
 
         # Last calculated values (for API/debugging)
         self.last_ambient: Optional[float] = None
@@ -112,6 +127,32 @@ class HeatingController:
             f"impulse_temp={impulse_temp}°C, impulse={impulse_duration}s/{impulse_cycle}s"
         )
 
+    def configure(
+        self,
+        min_delta: float,
+        max_delta: float,
+        impulse_temp: float,
+        impulse_duration: int,
+        impulse_cycle: int,
+    ):
+        """Update control parameters (impulse timing state is kept)."""
+        self.min_delta = min_delta
+        self.max_delta = max_delta
+        self.impulse_temp = impulse_temp
+        self.impulse_duration = impulse_duration
+        self.impulse_cycle = impulse_cycle
+        self._config_status = self._build_config_status()
+
+    def _build_config_status(self) -> dict:
+        """Config block of get_status() (rebuilt only when parameters change)."""
+        return {
+            'min_delta': self.min_delta,
+            'max_delta': self.max_delta,
+            'impulse_temp': self.impulse_temp,
+            'impulse_duration': self.impulse_duration,
+            'impulse_cycle': self.impulse_cycle,
+        }
+
     def _lookup_base_pwm(self, ambient_temp: float) -> int:
         """
         Look up base PWM value from Variations table.
@@ -144,14 +185,17 @@ class HeatingController:
         Returns:
             True if impulse heating should be active
         """
-        # Only use impulse heating when sensor is WET
+        now = self.clock.now()
+
+        # Only use impulse heating when sensor is WET (or a rain onset forced it)
         if not is_wet:
+            if self._forced_impulse_until and now < self._forced_impulse_until:
+                self._in_impulse = True
+                return True
             self._in_impulse = False
             self._last_impulse_start = None  # Reset cycle when dry
             return False
 
-        now = datetime.now(timezone.utc)
-
         # First impulse when becoming wet
         if self._last_impulse_start is None:
             self._last_impulse_start = now
@@ -183,6 +227,8 @@ class HeatingController:
         ambient_temp: float,
         rain_freq: Optional[int] = None,
         wet_threshold: int = 2100,
+        is_wet: Optional[bool] = None,
+        predicted_delta: Optional[float] = None,
     ) -> Tuple[int, str]:
         """
         Calculate heater PWM value based on current conditions.
@@ -194,11 +240,17 @@ class HeatingController:
         4. If delta < min_delta: use base PWM from Variations table
         5. If min_delta <= delta < max_delta: proportional control
 
+        If a predicted delta (trend, see trends.py) is given and smaller than
+        the current delta, steps 3-5 use it, so heating starts before the
+        sensor margin has actually dropped.
+
         Args:
             sensor_temp: Current rain sensor temperature (°C)
             ambient_temp: Current ambient temperature from ESP (°C)
             rain_freq: Rain sensor frequency (Hz), used for wet detection
             wet_threshold: Frequency below which sensor is considered wet
+            is_wet: Debounced wet flag (overrides the rain_freq comparison if given)
+            predicted_delta: Delta expected a few minutes ahead (None = no look-ahead)
 
         Returns:
             Tuple of (pwm_value, reason_string)
@@ -211,8 +263,9 @@ class HeatingController:
         delta = sensor_temp - ambient_temp
         self.last_delta = delta
 
-        # Determine if sensor is wet
-        is_wet = rain_freq is not None and rain_freq < wet_threshold
+        # Determine if sensor is wet (prefer debounced flag to avoid impulse resets)
+        if is_wet is None:
+            is_wet = rain_freq is not None and rain_freq < wet_threshold
 
         # Check impulse heating first (only when WET - to dry the sensor)
         if self._check_impulse(is_wet):
@@ -223,8 +276,15 @@ class HeatingController:
             logger.debug(f"Heater: {reason}, PWM={pwm}")
             return (pwm, reason)
 
+        # Trend look-ahead: act on the predicted delta if the margin is shrinking
+        control_delta = delta
+        lookahead = ''
+        if predicted_delta is not None and predicted_delta < delta:
+            control_delta = predicted_delta
+            lookahead = f", predicted from {delta:.1f}°C"
+
         # Sensor already warm enough
-        if delta >= self.max_delta:
+        if control_delta >= self.max_delta:
             pwm = PWM_MIN
             reason = f"sensor_warm (delta={delta:.1f}°C >= {self.max_delta}°C)"
             self.last_pwm = pwm
@@ -236,9 +296,9 @@ class HeatingController:
         base_pwm = self._lookup_base_pwm(ambient_temp)
 
         # Sensor too cold - full base heating
-        if delta < self.min_delta:
+        if control_delta < self.min_delta:
             pwm = base_pwm
-            reason = f"sensor_cold (delta={delta:.1f}°C < {self.min_delta}°C)"
+            reason = f"sensor_cold (delta={control_delta:.1f}°C < {self.min_delta}°C{lookahead})"
             self.last_pwm = pwm
             self.last_reason = reason
             logger.debug(f"Heater: {reason}, PWM={pwm}")
@@ -249,30 +309,42 @@ class HeatingController:
         # delta = min_delta -> pwm = base_pwm
         # delta = max_delta -> pwm = 0
         range_delta = self.max_delta - self.min_delta
-        factor = (self.max_delta - delta) / range_delta
+        factor = (self.max_delta - control_delta) / range_delta
         pwm = int(base_pwm * factor)
         pwm = max(PWM_MIN, min(PWM_MAX, pwm))
 
-        reason = f"proportional (delta={delta:.1f}°C, factor={factor:.2f})"
+        reason = f"proportional (delta={control_delta:.1f}°C, factor={factor:.2f}{lookahead})"
         self.last_pwm = pwm
         self.last_reason = reason
         logger.debug(f"Heater: {reason}, PWM={pwm}")
         return (pwm, reason)
 
-    def get_status(self) -> dict:
+    def trigger_impulse(self):
+        """
+        Start impulse heating now (rain onset detected before the wet flag).
+
+        The impulse runs for impulse_duration even if the debounced wet
+        flag is not set yet; if the sensor becomes wet, the normal impulse
+        cycle continues from this start.
+        """
+        now = self.clock.now()
+        if self._in_impulse:
+            return
+        self._last_impulse_start = now
+        self._forced_impulse_until = now + timedelta(seconds=self.impulse_duration)
+        self._in_impulse = True
+        self.last_pwm = PWM_MAX
+        self.last_reason = "impulse_rain_onset"
+        logger.info("Rain onset - starting impulse heating")
+
+    def get_status(self) -> HeaterStatus:
         """Return current controller status for API/debugging."""
-        return {
-            'ambient_temp': self.last_ambient,
-            'sensor_temp': self.last_sensor_temp,
-            'delta': self.last_delta,
-            'pwm': self.last_pwm,
-            'reason': self.last_reason,
-            'in_impulse': self._in_impulse,
-            'config': {
-                'min_delta': self.min_delta,
-                'max_delta': self.max_delta,
-                'impulse_temp': self.impulse_temp,
-                'impulse_duration': self.impulse_duration,
-                'impulse_cycle': self.impulse_cycle,
-            }
-        }
+        return HeaterStatus(
+            ambient_temp=self.last_ambient,
+            sensor_temp=self.last_sensor_temp,
+            delta=self.last_delta,
+            pwm=self.last_pwm,
+            reason=self.last_reason,
+            in_impulse=self._in_impulse,
+            config=self._config_status,
+        )
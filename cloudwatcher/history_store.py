@@ -0,0 +1,329 @@
+"""
+CloudWatcher History Store
+Modified: 2026-10-19 - Initial creation
+Modified: 2026-10-19 - iter_rows() for chunked export
+Modified: 2026-10-19 - Store id, rows after a row id and append notification for the replication feed
+Modified: 2026-10-19 - append_many() with meta values in the same transaction (federation gateway)
+Modified: 2026-10-19 - ambient_temp_c channel (fused ambient), missing channel columns added on open
+Modified: 2026-10-19 - prune() per device on the (device, ts) index instead of a table scan
+
+Durable local history of all readings (SQLite, stdlib only).
+
+One row per read cycle and device. Timestamps are stored as UTC epoch
+seconds (REAL) so range queries and downsampling work on plain numbers.
+Rows older than HISTORY_RETENTION_DAYS are pruned periodically.
+
+The store is shared by all device threads; one connection is used with
+a lock (SQLite in WAL mode, so readers do not block the writer for long).
+
+Row ids (AUTOINCREMENT) are never reused, so together with the random
+store id (table meta) they identify a reading durably (feed cursors).
+"""
+
+import logging
+import secrets
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Stored channels and their SQL types (order = column order)
+CHANNELS = {
+    'sky_temp_c': 'REAL',
+    'rain_freq': 'INTEGER',
+    'rain_sensor_temp_c': 'REAL',
+    'light_sensor_raw': 'INTEGER',
+    'mpsas': 'REAL',
+    'heater_pwm': 'INTEGER',
+    'heater_target_pwm': 'INTEGER',
+    'esp_temp_shadow_c': 'REAL',
+    'esp_temp_sun_c': 'REAL',
+    'ambient_temp_c': 'REAL',
+    'is_raining': 'INTEGER',
+    'is_wet': 'INTEGER',
+    'is_daylight': 'INTEGER',
+}
+
+INSERT_SQL = (
+    f"INSERT INTO readings (device, ts, {', '.join(CHANNELS)}) "
+    f"VALUES ({', '.join('?' * (len(CHANNELS) + 2))})"
+)
+
+# Distinct devices by jumping through idx_readings_device (one lookup per device)
+DEVICES_SQL = (
+    "WITH RECURSIVE d(device) AS ("
+    "SELECT MIN(device) FROM readings UNION ALL "
+    "SELECT (SELECT MIN(device) FROM readings WHERE device > d.device) FROM d WHERE d.device IS NOT NULL"
+    ") SELECT device FROM d WHERE device IS NOT NULL"
+)
+
+# Seconds between retention prune runs
+PRUNE_INTERVAL = 3600
+
+
+class HistoryStore:
+    """SQLite-backed reading history for one or more devices."""
+
+    def __init__(self, path: str = None, retention_days: float = None):
+        """
+        Open (and create) the history database.
+
+        Args:
+            path: SQLite file (default: config.HISTORY_DB, ':memory:' for tests)
+            retention_days: Keep rows this long (default: config.HISTORY_RETENTION_DAYS)
+        """
+        self.path = path or config.HISTORY_DB
+        self.retention_days = retention_days or config.HISTORY_RETENTION_DAYS
+        self._lock = threading.Lock()
+        self._appended = threading.Condition()
+        self._last_prune = 0.0
+
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        if self.path != ':memory:':
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+        self._create_schema()
+        self.store_id = self._load_store_id()
+        logger.info(f"History store opened: {self.path} (retention {self.retention_days} days)")
+
+    def _create_schema(self):
+        columns = ', '.join(f"{name} {sql_type}" for name, sql_type in CHANNELS.items())
+        with self.conn:
+            self.conn.execute(
+                f"CREATE TABLE IF NOT EXISTS readings ("
+                f"id INTEGER PRIMARY KEY AUTOINCREMENT, device TEXT NOT NULL, ts REAL NOT NULL, {columns})"
+            )
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_readings_device_ts ON readings(device, ts)')
+            # (device, rowid) order for the feed
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_readings_device ON readings(device)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            # Databases of older versions lack newer channels
+            existing = {row[1] for row in self.conn.execute('PRAGMA table_info(readings)')}
+            for name, sql_type in CHANNELS.items():
+                if name not in existing:
+                    self.conn.execute(f"ALTER TABLE readings ADD COLUMN {name} {sql_type}")
+                    logger.info(f"History store: added channel column {name}")
+
+    def _load_store_id(self) -> str:
+        """Random id of this database, created once (a new database gets a new id)."""
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO meta (key, value) VALUES ('store_id', ?)", (secrets.token_hex(4),))
+            return self.conn.execute("SELECT value FROM meta WHERE key = 'store_id'").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def append(self, device: str, ts: float, values: Dict) -> int:
+        """
+        Store one reading.
+
+        Args:
+            device: Device name
+            ts: UTC epoch seconds
+            values: Mapping channel -> value (unknown keys ignored, missing = NULL)
+
+        Returns:
+            Row id of the stored reading
+        """
+        with self._lock, self.conn:
+            row_id = self.conn.execute(INSERT_SQL, self._row(device, ts, values)).lastrowid
+        self._appended_rows()
+        return row_id
+
+    def append_many(self, device: str, rows: Iterable[tuple], meta: Optional[Dict[str, str]] = None) -> int:
+        """
+        Store several readings and meta values in one transaction.
+
+        Args:
+            device: Device name
+            rows: (ts, values) pairs, see append()
+            meta: key -> value stored with the rows (e.g. a replication cursor)
+
+        Returns:
+            Number of stored readings
+        """
+        rows = [self._row(device, ts, values) for ts, values in rows]
+        with self._lock, self.conn:
+            self.conn.executemany(INSERT_SQL, rows)
+            for key, value in (meta or {}).items():
+                self.conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+        if rows:
+            self._appended_rows()
+        return len(rows)
+
+    @staticmethod
+    def _row(device: str, ts: float, values: Dict) -> list:
+        return [device, ts] + [
+            int(v) if isinstance(v, bool) else v
+            for v in (values.get(name) for name in CHANNELS)
+        ]
+
+    def _appended_rows(self):
+        with self._appended:
+            self._appended.notify_all()
+        if time.time() - self._last_prune > PRUNE_INTERVAL:
+            self.prune()
+
+    def get_meta(self, key: str) -> Optional[str]:
+        """Return a meta value (None if not set)."""
+        with self._lock:
+            row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def delete_meta(self, key: str):
+        with self._lock, self.conn:
+            self.conn.execute('DELETE FROM meta WHERE key = ?', (key,))
+
+    def devices(self) -> List[str]:
+        """Return the names of all devices with rows (index skip-scan, no table scan)."""
+        with self._lock:
+            return [row[0] for row in self.conn.execute(DEVICES_SQL)]
+
+    def prune(self) -> int:
+        """Delete rows older than the retention period. Returns number of rows deleted."""
+        self._last_prune = time.time()
+        cutoff = self._last_prune - self.retention_days * 86400
+        devices = self.devices()
+        deleted = 0
+        with self._lock, self.conn:
+            # Per device, so the delete is a range on idx_readings_device_ts
+            for device in devices:
+                deleted += self.conn.execute(
+                    'DELETE FROM readings WHERE device = ? AND ts < ?', (device, cutoff)).rowcount
+        if deleted:
+            logger.info(f"History: pruned {deleted} row(s) older than {self.retention_days} days")
+        return deleted
+
+    @staticmethod
+    def check_channels(channels: Optional[Iterable[str]]) -> List[str]:
+        """Validate channel names (None = all channels)."""
+        if not channels:
+            return list(CHANNELS)
+        unknown = [c for c in channels if c not in CHANNELS]
+        if unknown:
+            raise ValueError(f"Unknown channel(s): {', '.join(unknown)}")
+        return list(channels)
+
+    def query(
+        self,
+        device: str,
+        start: float,
+        end: float,
+        channels: Optional[Sequence[str]] = None,
+    ) -> List[tuple]:
+        """
+        Return rows (ts, *channels) of a device in [start, end], oldest first.
+
+        Args:
+            device: Device name
+            start: UTC epoch seconds (inclusive)
+            end: UTC epoch seconds (inclusive)
+            channels: Channel names (default: all)
+        """
+        channels = self.check_channels(channels)
+        with self._lock:
+            return self.conn.execute(
+                f"SELECT ts, {', '.join(channels)} FROM readings "
+                f"WHERE device = ? AND ts BETWEEN ? AND ? ORDER BY ts",
+                (device, start, end),
+            ).fetchall()
+
+    def iter_rows(
+        self,
+        device: str,
+        start: float,
+        end: float,
+        channels: Optional[Sequence[str]] = None,
+        chunk_size: int = 50000,
+    ) -> Iterator[List[tuple]]:
+        """
+        Yield rows (ts, *channels) of a device in [start, end] in chunks, oldest first.
+
+        Uses keyset pagination on (ts, id) (the rowid is part of the
+        (device, ts) index), so every chunk is an index seek and the lock is only held per chunk (writers are not blocked
+        for the whole export).
+        """
+        channels = self.check_channels(channels)
+        sql = (
+            f"SELECT id, ts, {', '.join(channels)} FROM readings "
+            f"WHERE device = ? AND ts <= ? AND (ts, id) > (?, ?) "
+            f"ORDER BY ts, id LIMIT ?"
+        )
+        # id -1 includes rows at start itself
+        params = (device, end, start, -1, chunk_size)
+        while True:
+            with self._lock:
+                rows = self.conn.execute(sql, params).fetchall()
+            if not rows:
+                return
+            last_id, last_ts = rows[-1][0], rows[-1][1]
+            yield [row[1:] for row in rows]
+            if len(rows) < chunk_size:
+                return
+            params = (device, end, last_ts, last_id, chunk_size)
+
+    def rows_after(
+        self,
+        device: str,
+        after_id: int,
+        limit: int,
+        channels: Optional[Sequence[str]] = None,
+    ) -> List[tuple]:
+        """
+        Return rows (id, ts, *channels) of a device with id > after_id, in id order.
+
+        Args:
+            device: Device name
+            after_id: Last row id already seen (0 = from the oldest row)
+            limit: Maximum number of rows
+            channels: Channel names (default: all)
+        """
+        channels = self.check_channels(channels)
+        with self._lock:
+            return self.conn.execute(
+                f"SELECT id, ts, {', '.join(channels)} FROM readings "
+                f"WHERE device = ? AND id > ? ORDER BY id LIMIT ?",
+                (device, after_id, limit),
+            ).fetchall()
+
+    def id_range(self, device: str) -> tuple[Optional[int], Optional[int]]:
+        """Return (oldest, newest) row id of a device, (None, None) without rows."""
+        with self._lock:
+            return self.conn.execute(
+                'SELECT MIN(id), MAX(id) FROM readings WHERE device = ?', (device,)).fetchone()
+
+    def wait_for_append(self, timeout: float) -> bool:
+        """Block until the next reading is stored or timeout. Returns True if one was stored."""
+        with self._appended:
+            return self._appended.wait(timeout)
+
+    def query_arrays(
+        self,
+        device: str,
+        start: float,
+        end: float,
+        channels: Optional[Sequence[str]] = None,
+    ):
+        """
+        Return history as NumPy arrays.
+
+        Returns:
+            Tuple (ts, values): ts float64 array, values dict channel -> float64
+            array (NULL = NaN)
+        """
+        import numpy as np
+
+        channels = self.check_channels(channels)
+        rows = self.query(device, start, end, channels)
+        if not rows:
+            return np.empty(0), {name: np.empty(0) for name in channels}
+
+        # dtype float converts NULL (None) to NaN
+        data = np.array(rows, dtype=np.float64)
+        return data[:, 0], {name: data[:, i + 1] for i, name in enumerate(channels)}
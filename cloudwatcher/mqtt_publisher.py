@@ -0,0 +1,230 @@
+"""
+CloudWatcher MQTT Publisher
+Modified: 2026-10-19 - Initial creation
+Modified: 2026-10-19 - Per-device topic prefix for multi-device setups
+Modified: 2026-10-19 - Queued messages go out before newer ones (flush and publish share the lock)
+
+Keeps one persistent MQTT connection (paho-mqtt network thread) and
+publishes to retained topics below MQTT_BASE_TOPIC:
+
+    <base>/status              online/offline (retained, last will)
+    <base>/snapshot            full tracked snapshot after every change
+    <base>/changes             change event (only changed fields, not retained)
+    <base>/heater              heater decision when the target PWM changed
+    <base>/transitions/<flag>  last debounced flag transition
+
+With several devices the topics are published below <base>/<device>/.
+
+Messages published while the broker is unreachable are kept in an
+offline queue and flushed on reconnect. For retained topics only the
+newest message per topic is kept (older ones are obsolete anyway).
+
+Requires paho-mqtt (pip install paho-mqtt). A client factory can be
+injected to run against a local broker stand-in.
+"""
+
+import json
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Callable, Dict, Optional
+
+try:
+    import paho.mqtt.client as mqtt
+except ImportError:  # Optional dependency
+    mqtt = None
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+def _default_client_factory(client_id: str):
+    """Create a paho client (supports paho-mqtt 1.x and 2.x)."""
+    if mqtt is None:
+        raise RuntimeError("paho-mqtt not installed (pip install paho-mqtt)")
+    if hasattr(mqtt, 'CallbackAPIVersion'):
+        return mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id)
+    return mqtt.Client(client_id=client_id)
+
+
+class MqttPublisher:
+    """Persistent MQTT publisher with offline queue."""
+
+    def __init__(
+        self,
+        host: str = None,
+        port: int = None,
+        base_topic: str = None,
+        qos: int = None,
+        retain: bool = None,
+        client_id: str = None,
+        queue_size: int = None,
+        client_factory: Optional[Callable] = None,
+    ):
+        """
+        Initialize publisher (does not connect yet, see start()).
+
+        Args:
+            host: Broker host (default: config.MQTT_HOST)
+            port: Broker port (default: config.MQTT_PORT)
+            base_topic: Topic prefix (default: config.MQTT_BASE_TOPIC)
+            qos: QoS level 0-2 (default: config.MQTT_QOS)
+            retain: Retain state topics (default: config.MQTT_RETAIN)
+            client_id: MQTT client id (default: config.MQTT_CLIENT_ID)
+            queue_size: Max. non-retained messages kept while offline
+            client_factory: Callable(client_id) -> paho-compatible client
+        """
+        self.host = host or config.MQTT_HOST
+        self.port = port or config.MQTT_PORT
+        self.base_topic = (base_topic or config.MQTT_BASE_TOPIC).rstrip('/')
+        self.qos = config.MQTT_QOS if qos is None else qos
+        self.retain = config.MQTT_RETAIN if retain is None else retain
+        self.client_id = client_id or config.MQTT_CLIENT_ID
+        self.client_factory = client_factory or _default_client_factory
+
+        self.client = None
+        self.connected = False
+        self.published = 0
+        self.dropped = 0
+
+        # Offline queue: latest message per retained topic + FIFO for the rest
+        self._retained_queue: OrderedDict = OrderedDict()
+        self._queue: deque = deque(maxlen=queue_size or config.MQTT_QUEUE_SIZE)
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Create client, register last will and connect in the background."""
+        self.client = self.client_factory(self.client_id)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+
+        if config.MQTT_USERNAME:
+            self.client.username_pw_set(config.MQTT_USERNAME, config.MQTT_PASSWORD)
+
+        self.client.will_set(self._topic('status'), 'offline', qos=self.qos, retain=True)
+        self.client.reconnect_delay_set(min_delay=1, max_delay=60)
+
+        # connect_async + loop_start: network thread keeps reconnecting on its own
+        self.client.connect_async(self.host, self.port, keepalive=config.MQTT_KEEPALIVE)
+        self.client.loop_start()
+        logger.info(f"MQTT publisher started: {self.host}:{self.port}, base topic '{self.base_topic}'")
+
+    def stop(self):
+        """Publish offline status and disconnect."""
+        if not self.client:
+            return
+        if self.connected:
+            self.client.publish(self._topic('status'), 'offline', qos=self.qos, retain=True)
+        self.client.disconnect()
+        self.client.loop_stop()
+        self.connected = False
+
+    def _topic(self, subtopic: str, prefix: str = '') -> str:
+        if prefix:
+            return f"{self.base_topic}/{prefix}/{subtopic}"
+        return f"{self.base_topic}/{subtopic}"
+
+    def _on_connect(self, client, userdata, flags, rc, *args):
+        # paho 2.x passes a ReasonCode, 1.x an int (0 = success)
+        if getattr(rc, 'is_failure', rc != 0):
+            logger.warning(f"MQTT connect failed: {rc}")
+            return
+
+        logger.info(f"MQTT connected to {self.host}:{self.port}")
+        client.publish(self._topic('status'), 'online', qos=self.qos, retain=True)
+        self._flush_queue()
+
+    def _on_disconnect(self, client, userdata, *args):
+        if self.connected:
+            logger.warning("MQTT connection lost, queueing messages")
+        self.connected = False
+
+    def _flush_queue(self):
+        """
+        Send all messages queued while offline, then go online.
+
+        Runs under the lock that publish() takes, and connected is only set
+        afterwards: a fresh retained payload published meanwhile is queued
+        behind the flush instead of being overwritten by an older queued one.
+        """
+        with self._lock:
+            pending = list(self._retained_queue.values()) + list(self._queue)
+            self._retained_queue.clear()
+            self._queue.clear()
+            if pending:
+                logger.info(f"MQTT flushing {len(pending)} queued message(s)")
+            for topic, payload, retain in pending:
+                self._send(topic, payload, retain)
+            self.connected = True
+
+    def _send(self, topic: str, payload: str, retain: bool) -> bool:
+        info = self.client.publish(topic, payload, qos=self.qos, retain=retain)
+        if info.rc != 0:
+            return False
+        self.published += 1
+        return True
+
+    def publish(self, subtopic: str, payload, retain: Optional[bool] = None, prefix: str = '') -> bool:
+        """
+        Publish a message (dicts are JSON-encoded).
+
+        Args:
+            subtopic: Topic below base topic (and device prefix)
+            payload: String or JSON-serializable object
+            retain: Retain flag (default: MQTT_RETAIN)
+            prefix: Device sub-topic ('' = directly below base topic)
+
+        Returns:
+            True if handed to the client, False if queued for later
+        """
+        retain = self.retain if retain is None else retain
+        topic = self._topic(subtopic, prefix)
+        if not isinstance(payload, str):
+            payload = json.dumps(payload)
+
+        with self._lock:
+            if self.client and self.connected and self._send(topic, payload, retain):
+                return True
+            if retain:
+                self._retained_queue[topic] = (topic, payload, retain)
+                self._retained_queue.move_to_end(topic)
+            else:
+                if len(self._queue) == self._queue.maxlen:
+                    self.dropped += 1
+                self._queue.append((topic, payload, retain))
+        return False
+
+    def on_change(self, event: Dict, snapshot: Dict, heater_status: Optional[Dict] = None, prefix: str = ''):
+        """
+        Publish a change event from the ChangeTracker.
+
+        Args:
+            event: Change event {'seq', 'timestamp', 'changes'}
+            snapshot: Full currently published snapshot
+            heater_status: Heater controller status (published if target PWM changed)
+            prefix: Device sub-topic ('' = directly below base topic)
+        """
+        self.publish('changes', event, retain=False, prefix=prefix)
+        self.publish('snapshot', {'seq': event['seq'], 'timestamp': event['timestamp'], **snapshot}, prefix=prefix)
+
+        if heater_status is not None and 'heater_target_pwm' in event['changes']:
+            self.publish('heater', {'timestamp': event['timestamp'], **heater_status}, prefix=prefix)
+
+    def on_transition(self, transition: Dict, prefix: str = ''):
+        """Publish a debounced flag transition event."""
+        self.publish(f"transitions/{transition['flag']}", transition, prefix=prefix)
+
+    def get_status(self) -> Dict:
+        """Return publisher status for API/debugging."""
+        with self._lock:
+            queued = len(self._retained_queue) + len(self._queue)
+        return {
+            'broker': f"{self.host}:{self.port}",
+            'base_topic': self.base_topic,
+            'connected': self.connected,
+            'qos': self.qos,
+            'published': self.published,
+            'queued': queued,
+            'dropped': self.dropped,
+        }
@@ -0,0 +1,271 @@
+"""
+CloudWatcher Sampling Profiler
+Modified: 2026-10-19 - Initial creation
+
+On-demand statistical profiler for the running service (/debug/profile).
+Samples the Python stacks of all threads (sys._current_frames) at a fixed
+rate for a few seconds and aggregates them into
+
+- collapsed stacks ("thread;frame;frame count" per line, root first),
+  the input format of flamegraph.pl, speedscope and inferno
+- a summary: top functions by self and total time, samples and CPU seconds per thread,
+  and per device the time split over the background reader stages
+  (serial, esp, control, publish, idle - from the StageMonitor, see
+  watchdog.py) with the hottest functions of each stage
+
+Nothing is installed into the interpreter (no sys.setprofile/settrace):
+the request thread itself wakes up every 1/rate seconds, walks the
+frames and goes back to sleep, so the other threads run at full speed.
+The time spent sampling is reported as overhead_pct (of one core).
+Only one profile runs at a time.
+
+Frames are labelled "file.py:function", the reader threads get their
+current stage as pseudo-frame below the thread name ("[stage:serial]"),
+so serial waits, the ESP fetch, Jinja rendering and jsonify show up as
+separate towers. Threads parked in threading/queue/selectors waits or
+sleeping polling loops (idle web server, watchdog, config watcher) are
+left out unless include_idle is set; the serial port's select() is not
+idle and always counted. Stacks show where threads are, not whether they
+use the CPU - cpu_s in the summary has the CPU seconds per thread
+(Linux per-thread clocks) to tell busy threads from waiting ones.
+"""
+
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional
+
+import config
+
+# Leaf frames in these modules are threads waiting for work
+IDLE_MODULES = ('threading.py', 'queue.py', 'selectors.py', 'socketserver.py')
+# Polling loops whose own frame is the leaf only while in time.sleep()
+IDLE_FUNCTIONS = ('clock.py:sleep', 'watchdog.py:_run', 'config_reload.py:_run')
+
+# Anonymous threads ("Thread-12 (process_request_thread)") are grouped by target
+_ANONYMOUS_THREAD = re.compile(r'^Thread-\d+ \((.+)\)$')
+
+# Functions listed per summary table
+TOP_FUNCTIONS = 15
+TOP_STAGE_FUNCTIONS = 5
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is requested while another one is running."""
+
+
+class SamplingProfiler:
+    """Samples all thread stacks and aggregates them (one profile at a time)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Frame label per code object (labels are built once, not per sample)
+        self._labels: Dict = {}
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+            self._labels[code] = label
+        return label
+
+    @staticmethod
+    def _thread_names() -> Dict[int, str]:
+        return {
+            thread.ident: _ANONYMOUS_THREAD.sub(r'\1', thread.name) for thread in threading.enumerate()
+        }
+
+    def _idle(self, code) -> bool:
+        return os.path.basename(code.co_filename) in IDLE_MODULES or self._label(code) in IDLE_FUNCTIONS
+
+    @staticmethod
+    def _cpu_times() -> Dict[int, float]:
+        """Return CPU seconds per thread ident (empty where per-thread clocks are unavailable)."""
+        times = {}
+        for thread in threading.enumerate():
+            try:
+                times[thread.ident] = time.clock_gettime(time.pthread_getcpuclockid(thread.ident))
+            except (AttributeError, OSError, TypeError):
+                pass
+        return times
+
+    def _stack(self, frame) -> tuple:
+        """Return the code objects of a stack, leaf first."""
+        codes = []
+        while frame is not None:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        return tuple(codes)
+
+    def run(self, seconds: float, rate: float = None, devices: Optional[Dict] = None,
+            include_idle: bool = False) -> 'Profile':
+        """
+        Sample all threads for a while.
+
+        Args:
+            seconds: Sampling duration (at most PROFILE_MAX_SECONDS)
+            rate: Samples per second (default PROFILE_RATE, at most PROFILE_MAX_RATE)
+            devices: name -> CloudWatcherDevice, for the per-stage breakdown
+            include_idle: Keep samples of threads waiting in threading/queue/selectors
+
+        Raises:
+            ValueError: seconds or rate out of range
+            ProfilerBusy: Another profile is running
+        """
+        rate = config.PROFILE_RATE if rate is None else rate
+        if not 0 < seconds <= config.PROFILE_MAX_SECONDS:
+            raise ValueError(f"seconds must be in 0..{config.PROFILE_MAX_SECONDS}")
+        if not 0 < rate <= config.PROFILE_MAX_RATE:
+            raise ValueError(f"rate must be in 0..{config.PROFILE_MAX_RATE}")
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running")
+        try:
+            return self._sample(seconds, rate, devices or {}, include_idle)
+        finally:
+            self._lock.release()
+
+    def _sample(self, seconds: float, rate: float, devices: Dict, include_idle: bool) -> 'Profile':
+        own = threading.get_ident()
+        interval = 1.0 / rate
+        profile = Profile(rate)
+        started = time.perf_counter()
+        deadline = started + seconds
+        next_sample = started
+        busy = 0.0
+        cpu_started = self._cpu_times()
+
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            if now < next_sample:
+                time.sleep(next_sample - now)
+                continue
+            next_sample += interval
+            if next_sample < now:
+                # Fell behind (GIL held elsewhere): skip missed ticks instead of bursting
+                next_sample = now + interval
+
+            names = self._thread_names()
+            readers = {
+                dev.thread.ident: dev for dev in devices.values() if dev.thread is not None
+            }
+            frames = sys._current_frames()
+            for ident, frame in frames.items():
+                if ident == own:
+                    continue
+                stack = self._stack(frame)
+                if not stack:
+                    continue
+                dev = readers.get(ident)
+                stage = None
+                if dev is not None:
+                    # Reader time is split over stages including idle (waiting for the next cycle)
+                    stage = dev.monitor.current or 'idle'
+                    profile.add_stage(dev.name, stage, stack[0])
+                if not include_idle and stage in (None, 'idle') and self._idle(stack[0]):
+                    continue
+                profile.add(names.get(ident, f"thread-{ident}"), stage, stack)
+            frames = frame = None
+            profile.ticks += 1
+            busy += time.perf_counter() - now
+
+        profile.elapsed = time.perf_counter() - started
+        names = self._thread_names()
+        for ident, cpu in self._cpu_times().items():
+            if ident != own:
+                name = names.get(ident, f"thread-{ident}")
+                profile.cpu[name] = profile.cpu.get(name, 0.0) + cpu - cpu_started.get(ident, 0.0)
+        profile.overhead = busy
+        profile.labels = self._label
+        return profile
+
+
+class Profile:
+    """Aggregated samples of one profiler run."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.ticks = 0
+        self.elapsed = 0.0
+        self.overhead = 0.0
+        self.labels = None
+        # thread -> CPU seconds used during the run
+        self.cpu: Dict[str, float] = {}
+        # (thread, stage, stack) -> samples
+        self.stacks: Counter = Counter()
+        # device -> stage -> samples, device -> stage -> leaf code -> samples
+        self.stages: Dict[str, Counter] = defaultdict(Counter)
+        self.stage_leaves: Dict[str, Dict[str, Counter]] = defaultdict(lambda: defaultdict(Counter))
+
+    def add(self, thread: str, stage: Optional[str], stack: tuple):
+        self.stacks[(thread, stage, stack)] += 1
+
+    def add_stage(self, device: str, stage: str, leaf):
+        self.stages[device][stage] += 1
+        self.stage_leaves[device][stage][leaf] += 1
+
+    @property
+    def samples(self) -> int:
+        return sum(self.stacks.values())
+
+    def collapsed(self) -> Iterable[str]:
+        """Yield collapsed stack lines, most frequent first."""
+        label = self.labels
+        for (thread, stage, stack), count in self.stacks.most_common():
+            root = [thread] if stage is None else [thread, f"[stage:{stage}]"]
+            yield ';'.join(root + [label(code) for code in reversed(stack)]) + f" {count}\n"
+
+    def _top(self, counter: Counter, total: int, limit: int) -> List[Dict]:
+        return [
+            {'function': self.labels(code), 'samples': count,
+             'pct': round(100 * count / total, 1) if total else 0.0}
+            for code, count in counter.most_common(limit)
+        ]
+
+    def summary(self) -> Dict:
+        """Return top functions, threads and the per-stage breakdown."""
+        samples = self.samples
+        self_time: Counter = Counter()
+        total_time: Counter = Counter()
+        threads: Counter = Counter()
+        for (thread, _, stack), count in self.stacks.items():
+            self_time[stack[0]] += count
+            for code in set(stack):
+                total_time[code] += count
+            threads[thread] += count
+
+        stages = {}
+        for device, counter in self.stages.items():
+            device_samples = sum(counter.values())
+            stages[device] = {
+                stage: {
+                    'samples': count,
+                    'seconds': round(count / self.ticks * self.elapsed, 2) if self.ticks else 0.0,
+                    'pct': round(100 * count / device_samples, 1),
+                    'top': self._top(self.stage_leaves[device][stage], count, TOP_STAGE_FUNCTIONS),
+                }
+                for stage, count in counter.most_common()
+            }
+
+        return {
+            'seconds': round(self.elapsed, 2),
+            'rate_hz': self.rate,
+            'ticks': self.ticks,
+            'samples': samples,
+            'overhead_pct': round(100 * self.overhead / self.elapsed, 2) if self.elapsed else None,
+            'threads': dict(threads.most_common()),
+            'cpu_s': {
+                thread: round(seconds, 3)
+                for thread, seconds in sorted(self.cpu.items(), key=lambda item: -item[1])
+            },
+            'self': self._top(self_time, samples, TOP_FUNCTIONS),
+            'total': self._top(total_time, samples, TOP_FUNCTIONS),
+            'stages': stages,
+        }
+
+
+PROFILER = SamplingProfiler()
@@ -0,0 +1,251 @@
+"""
+CloudWatcher Rain-Onset Fast Path
+Modified: 2026-10-19 - Initial creation
+Modified: 2026-10-19 - Use the device clock (virtual time for replay)
+
+The regular cycle sees rain at best once per READ_INTERVAL, after a full
+multi-sample read_all(). The fast path polls only the rain frequency
+(E!, one 2-block command) every RAIN_FAST_INTERVAL seconds in its own
+thread and detects a steep drop:
+
+- CUSUM: one-sided cumulative sum of (baseline - value - k); fires when
+  it exceeds h. Robust against single noisy samples.
+- Slope: least-squares slope over the last RAIN_ONSET_WINDOW seconds;
+  fires on a fast fall even before the CUSUM has accumulated.
+
+Both require the value to be at least RAIN_ONSET_MIN_DROP below the dry
+baseline (slow EWMA of the frequency while armed). After an
+onset the detector re-arms when the frequency recovers or after
+RAIN_ONSET_REARM seconds.
+
+On onset the device publishes a 'rain_onset' event (MQTT, /api/stream)
+and starts heater impulse drying right away. The debounced is_raining /
+is_wet flags are still decided by the regular cycle.
+"""
+
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Number of onset events kept for the API
+MAX_EVENTS = 50
+
+
+class RainOnsetDetector:
+    """CUSUM + slope detector for a steep drop in rain frequency."""
+
+    def __init__(
+        self,
+        cusum_k: float = None,
+        cusum_h: float = None,
+        min_drop: float = None,
+        slope: float = None,
+        window_s: float = None,
+        rearm_s: float = None,
+        baseline_alpha: float = None,
+    ):
+        """
+        Initialize detector (defaults from config.RAIN_ONSET_*).
+
+        Args:
+            cusum_k: Allowed drift per sample before the CUSUM grows (Hz)
+            cusum_h: CUSUM alarm level (Hz)
+            min_drop: Minimum drop below baseline for any alarm (Hz)
+            slope: Slope alarm level (Hz/s, negative)
+            window_s: Slope regression window (seconds)
+            rearm_s: Re-arm after this long even if the frequency stays low (seconds)
+            baseline_alpha: EWMA factor of the dry baseline per sample
+        """
+        self.cusum_k = config.RAIN_ONSET_CUSUM_K if cusum_k is None else cusum_k
+        self.cusum_h = config.RAIN_ONSET_CUSUM_H if cusum_h is None else cusum_h
+        self.min_drop = config.RAIN_ONSET_MIN_DROP if min_drop is None else min_drop
+        self.slope = config.RAIN_ONSET_SLOPE if slope is None else slope
+        self.window_s = window_s or config.RAIN_ONSET_WINDOW
+        self.rearm_s = rearm_s or config.RAIN_ONSET_REARM
+        self.baseline_alpha = baseline_alpha or config.RAIN_ONSET_BASELINE_ALPHA
+
+        self.baseline: Optional[float] = None
+        self.cusum = 0.0
+        self.armed = True
+        self.triggered_at: Optional[float] = None
+        self._window: deque = deque()
+
+    def configure(self):
+        """Re-read thresholds from config (live config reload, state is kept)."""
+        self.cusum_k = config.RAIN_ONSET_CUSUM_K
+        self.cusum_h = config.RAIN_ONSET_CUSUM_H
+        self.min_drop = config.RAIN_ONSET_MIN_DROP
+        self.slope = config.RAIN_ONSET_SLOPE
+        self.window_s = config.RAIN_ONSET_WINDOW
+        self.rearm_s = config.RAIN_ONSET_REARM
+        self.baseline_alpha = config.RAIN_ONSET_BASELINE_ALPHA
+
+    def _slope(self) -> Optional[float]:
+        """Least-squares slope (Hz/s) over the window, None with < 3 samples."""
+        n = len(self._window)
+        if n < 3:
+            return None
+        t0 = self._window[0][0]
+        mean_t = sum(t - t0 for t, _ in self._window) / n
+        mean_v = sum(v for _, v in self._window) / n
+        cov = sum((t - t0 - mean_t) * (v - mean_v) for t, v in self._window)
+        var = sum((t - t0 - mean_t) ** 2 for t, _ in self._window)
+        return cov / var if var > 0 else None
+
+    def update(self, value: float, t: float) -> Optional[Dict]:
+        """
+        Feed one rain frequency sample.
+
+        Args:
+            value: Rain frequency (Hz)
+            t: Sample time (epoch seconds)
+
+        Returns:
+            Detection dict if a rain onset was detected, else None
+        """
+        self._window.append((t, value))
+        while self._window and t - self._window[0][0] > self.window_s:
+            self._window.popleft()
+
+        if self.baseline is None:
+            self.baseline = value
+            return None
+
+        drop = self.baseline - value
+        slope = self._slope()
+
+        if not self.armed:
+            # Re-arm on recovery or after the hold time (new, wetter baseline)
+            if drop < self.min_drop / 2 or t - self.triggered_at >= self.rearm_s:
+                self.armed = True
+                self.cusum = 0.0
+                if drop >= self.min_drop / 2:
+                    self.baseline = value
+            return None
+
+        self.cusum = max(0.0, self.cusum + drop - self.cusum_k)
+
+        detector = None
+        if drop >= self.min_drop:
+            if self.cusum > self.cusum_h:
+                detector = 'cusum'
+            elif slope is not None and slope <= self.slope:
+                detector = 'slope'
+
+        if detector is None:
+            # Slow EWMA follows drift (dew, temperature), not a sudden drop
+            self.baseline += self.baseline_alpha * (value - self.baseline)
+            return None
+
+        self.armed = False
+        self.triggered_at = t
+        return {
+            'detector': detector,
+            'value': value,
+            'baseline': round(self.baseline, 1),
+            'drop': round(drop, 1),
+            'slope': round(slope, 1) if slope is not None else None,
+            'cusum': round(self.cusum, 1),
+        }
+
+    def get_status(self) -> Dict:
+        return {
+            'armed': self.armed,
+            'baseline': round(self.baseline, 1) if self.baseline is not None else None,
+            'cusum': round(self.cusum, 1),
+            'slope': self._slope(),
+        }
+
+
+class RainFastPath:
+    """High-rate E! polling thread feeding a RainOnsetDetector."""
+
+    def __init__(self, device, interval: float = None, detector: RainOnsetDetector = None):
+        """
+        Initialize fast path.
+
+        Args:
+            device: CloudWatcherDevice (reader, on_rain_onset())
+            interval: Poll interval in seconds (default: config.RAIN_FAST_INTERVAL)
+            detector: Detector instance (default: from config)
+        """
+        self.device = device
+        self.interval = interval or config.RAIN_FAST_INTERVAL
+        self.detector = detector or RainOnsetDetector()
+        self.events: deque = deque(maxlen=MAX_EVENTS)
+        self.polls = 0
+        self.failures = 0
+        self.last_value: Optional[int] = None
+        self.thread: Optional[threading.Thread] = None
+
+    def configure(self):
+        """Re-read interval and detector thresholds from config."""
+        self.interval = config.RAIN_FAST_INTERVAL
+        self.detector.configure()
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self._run, name=f"rain-fast-{self.device.name}", daemon=True)
+        self.thread.start()
+        logger.info(f"[{self.device.name}] Rain fast path started (every {self.interval}s)")
+
+    def _run(self):
+        clock = self.device.clock
+        while True:
+            started = clock.time()
+            try:
+                self.poll()
+            except Exception as e:
+                logger.warning(f"[{self.device.name}] Rain fast path poll failed: {e}")
+            clock.sleep(max(0.0, self.interval - (clock.time() - started)))
+
+    def poll(self, now: float = None) -> Optional[Dict]:
+        """Read E! once and run the detector. Returns the onset event, if any."""
+        reader = self.device.reader
+        if reader is None:
+            return None
+
+        value = reader.read_rain_freq()
+        self.polls += 1
+        if value is None:
+            self.failures += 1
+            return None
+        self.last_value = value
+
+        now = self.device.clock.time() if now is None else now
+        detection = self.detector.update(value, now)
+        if detection is None:
+            return None
+
+        event = {
+            'flag': 'rain_onset',
+            'state': True,
+            'timestamp': datetime.fromtimestamp(now, timezone.utc).isoformat(),
+            **detection,
+        }
+        self.events.append(event)
+        logger.info(
+            f"[{self.device.name}] Rain onset ({detection['detector']}): "
+            f"rain_freq={value} Hz, {detection['drop']} Hz below baseline")
+        self.device.on_rain_onset(event)
+        return event
+
+    def get_events(self, limit: int = MAX_EVENTS) -> List[Dict]:
+        """Return the most recent onset events (oldest first)."""
+        return list(self.events)[-limit:]
+
+    def get_status(self) -> Dict:
+        return {
+            'interval': self.interval,
+            'polls': self.polls,
+            'failures': self.failures,
+            'last_value': self.last_value,
+            'detector': self.detector.get_status(),
+            'last_event': self.events[-1] if self.events else None,
+        }
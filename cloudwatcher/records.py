@@ -0,0 +1,198 @@
+"""
+CloudWatcher Record Types
+Modified: 2026-10-19 - Initial creation
+
+Typed, slotted records for the values passed around every cycle:
+
+- Reading:       result of read_all() (serial, dummy and replay readers)
+- HeaterStatus:  result of HeatingController.get_status()
+
+Every field exists and is None when not measured, so consumers use
+attribute access (reading.rain_freq) instead of dict lookups with
+defaults. Slots keep a reading at a fraction of the size of the
+equivalent dict. The field getter used by to_dict() is generated once
+per class, getter() builds one for a field subset (snapshots, API).
+
+For code that still treats a reading as a mapping, records support
+get(), [] and `in` (a field is "in" a record when it is not None).
+
+ReadingColumns stores many readings column-wise in array('d') buffers
+(8 bytes per value, None as NaN) for large in-memory histories such as
+replay recordings.
+"""
+
+import math
+from array import array
+from operator import attrgetter
+from typing import Dict, Iterable, Optional, Sequence
+
+
+class Record:
+    """Base class: fixed fields in __slots__, None = not available."""
+
+    __slots__ = ()
+    FIELDS: tuple = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._values = attrgetter(*cls.FIELDS)
+
+    def __init__(self, **values):
+        for name in self.FIELDS:
+            setattr(self, name, values.pop(name, None))
+        if values:
+            raise TypeError(f"{type(self).__name__}: unknown fields {', '.join(sorted(values))}")
+
+    @classmethod
+    def from_dict(cls, values: Optional[Dict]) -> Optional['Record']:
+        """Build a record from a dict (unknown keys are ignored, None stays None)."""
+        if values is None:
+            return None
+        return cls(**{name: values.get(name) for name in cls.FIELDS})
+
+    @classmethod
+    def getter(cls, fields: Sequence[str]):
+        """Return a function record -> tuple of the given fields (built once, reused per call)."""
+        unknown = [name for name in fields if name not in cls.FIELDS]
+        if unknown:
+            raise ValueError(f"{cls.__name__}: unknown fields {', '.join(unknown)}")
+        if len(fields) == 1:
+            name = fields[0]
+            return lambda record: (getattr(record, name),)
+        return attrgetter(*fields)
+
+    def to_dict(self) -> Dict:
+        """Return all fields as a dict (JSON, MQTT, snapshots)."""
+        return dict(zip(self.FIELDS, self._values(self)))
+
+    def replace(self, **changes) -> 'Record':
+        """Return a copy with some fields changed."""
+        values = self.to_dict()
+        values.update(changes)
+        return type(self)(**values)
+
+    # Mapping-style access for callers that predate the records
+    def get(self, name: str, default=None):
+        value = getattr(self, name, None)
+        return default if value is None else value
+
+    def __getitem__(self, name: str):
+        if name not in self.FIELDS:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def __setitem__(self, name: str, value):
+        if name not in self.FIELDS:
+            raise KeyError(name)
+        setattr(self, name, value)
+
+    def __contains__(self, name: str) -> bool:
+        return getattr(self, name, None) is not None
+
+    def __eq__(self, other) -> bool:
+        return type(other) is type(self) and self._values(self) == other._values(other)
+
+    def __repr__(self) -> str:
+        fields = ', '.join(f"{name}={value!r}" for name, value in zip(self.FIELDS, self._values(self))
+                           if value is not None)
+        return f"{type(self).__name__}({fields})"
+
+
+class Reading(Record):
+    """One filtered reading of a CloudWatcher unit (read_all())."""
+
+    FIELDS = (
+        'sky_temp_c', 'rain_freq', 'is_raining', 'is_wet', 'heater_pwm',
+        'rain_sensor_temp_c', 'light_sensor_raw', 'mpsas', 'is_daylight',
+        'filter_stats',
+    )
+    __slots__ = FIELDS
+
+    sky_temp_c: Optional[float]
+    rain_freq: Optional[int]
+    is_raining: Optional[bool]
+    is_wet: Optional[bool]
+    heater_pwm: Optional[int]
+    rain_sensor_temp_c: Optional[float]
+    light_sensor_raw: Optional[int]
+    mpsas: Optional[float]
+    is_daylight: Optional[bool]
+    filter_stats: Optional[Dict]
+
+
+class HeaterStatus(Record):
+    """Last decision of the heater controller (config is shared, not copied)."""
+
+    FIELDS = ('ambient_temp', 'sensor_temp', 'delta', 'pwm', 'reason', 'in_impulse', 'config')
+    __slots__ = FIELDS
+
+    ambient_temp: Optional[float]
+    sensor_temp: Optional[float]
+    delta: Optional[float]
+    pwm: Optional[int]
+    reason: Optional[str]
+    in_impulse: Optional[bool]
+    config: Optional[Dict]
+
+
+class ReadingColumns:
+    """
+    Column store of timestamped values in array('d') buffers.
+
+    Each channel takes 8 bytes per row (None is stored as NaN); rows are
+    rebuilt on access with the channel's type (int, float or bool).
+    """
+
+    def __init__(self, channels: Sequence[str], types: Optional[Dict[str, type]] = None):
+        """
+        Initialize empty columns.
+
+        Args:
+            channels: Channel names
+            types: Channel name -> int/bool (default float)
+        """
+        self.channels = tuple(channels)
+        self.types = {name: (types or {}).get(name, float) for name in self.channels}
+        self.timestamps = array('d')
+        self.columns = {name: array('d') for name in self.channels}
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def append(self, ts: float, values):
+        """Append one row (dict or Record; missing channels = None)."""
+        self.timestamps.append(ts)
+        for name, column in self.columns.items():
+            value = values.get(name)
+            column.append(math.nan if value is None else float(value))
+
+    def extend(self, rows: Iterable[tuple]):
+        """Append (ts, values) rows."""
+        for ts, values in rows:
+            self.append(ts, values)
+
+    def value(self, name: str, index: int):
+        """Return one value with its channel type (None if missing)."""
+        value = self.columns[name][index]
+        if math.isnan(value):
+            return None
+        kind = self.types[name]
+        return value if kind is float else kind(value)
+
+    def row(self, index: int) -> Dict:
+        """Return one row as {channel: value}."""
+        return {name: self.value(name, index) for name in self.channels}
+
+    def sorted(self) -> 'ReadingColumns':
+        """Return a copy ordered by timestamp."""
+        order = sorted(range(len(self)), key=self.timestamps.__getitem__)
+        result = ReadingColumns(self.channels, self.types)
+        result.timestamps = array('d', (self.timestamps[i] for i in order))
+        result.columns = {
+            name: array('d', (column[i] for i in order)) for name, column in self.columns.items()
+        }
+        return result
+
+    def nbytes(self) -> int:
+        """Memory used by the buffers."""
+        return sum(col.itemsize * len(col) for col in (self.timestamps, *self.columns.values()))
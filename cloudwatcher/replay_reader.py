@@ -0,0 +1,215 @@
+"""
+CloudWatcher Replay Reader
+Modified: 2026-10-19 - Initial creation
+Modified: 2026-10-19 - Recordings in array-backed columns, Reading records from read_all()
+Modified: 2026-10-19 - set_pwm() accepts the reader timeout argument
+
+Plays back recorded sessions through the normal reader interface
+(read_all, read_rain_freq, set_pwm, read_device_info, ...), so the whole
+service - heater controller, debounced flags, rain fast path, API and
+push streams - runs on realistic nights without hardware.
+
+Recordings:
+- history database (history_store.py), rows of one device
+- CSV export (export.py --format csv): column 'ts' plus channels
+
+Time: the reader returns the recorded row at the current time of a
+VirtualClock (clock.py) that starts at the first recorded timestamp and
+runs 1x..1000x faster than real time. The same clock is given to the
+device and its HeatingController, so read interval, impulse timing,
+dwell times and staleness all run on recorded time. With loop=True the
+recording repeats (virtual time keeps increasing).
+
+Recorded ESP temperatures are returned by read_ambient() and used
+instead of the ESP HTTP fetch.
+
+Recordings are held column-wise (records.ReadingColumns, 8 bytes per
+value), so multi-week histories fit in memory on a Pi.
+
+Usage:
+    python3 cloudwatcher_service.py --replay cloudwatcher_history.db --speed 60
+    python3 cloudwatcher_service.py --replay night.csv --speed 1000
+"""
+
+import bisect
+import csv
+import logging
+import os
+import sqlite3
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+import config
+from clock import VirtualClock
+from cloudwatcher_reader import ERROR_COUNTERS, PWM_MAX, PWM_MIN
+from records import Reading, ReadingColumns
+
+logger = logging.getLogger(__name__)
+
+# Recorded channels used for playback
+REPLAY_CHANNELS = (
+    'sky_temp_c', 'rain_freq', 'rain_sensor_temp_c', 'light_sensor_raw', 'mpsas',
+    'esp_temp_shadow_c', 'esp_temp_sun_c',
+)
+REPLAY_TYPES = {'rain_freq': int, 'light_sensor_raw': int}
+
+
+def _parse_ts(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        ts = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        return (ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)).timestamp()
+
+
+class Recording:
+    """Recorded rows sorted by time (column store)."""
+
+    def __init__(self, source: str, rows: ReadingColumns):
+        if len(rows) < 2:
+            raise ValueError(f"Recording {source} has fewer than 2 rows")
+        self.source = source
+        self.rows = rows
+        self.timestamps = rows.timestamps
+        self.start = self.timestamps[0]
+        # Loop length: recorded span plus one typical step
+        step = (self.timestamps[-1] - self.timestamps[0]) / (len(rows) - 1)
+        self.duration = self.timestamps[-1] - self.timestamps[0] + step
+
+    @classmethod
+    def load(cls, path: str, device: str = 'default') -> 'Recording':
+        """
+        Load a recording from a history database or CSV export.
+
+        Args:
+            path: .db/.sqlite file (history store) or CSV file
+            device: Device name in the history database
+        """
+        if not os.path.exists(path):
+            raise ValueError(f"Recording not found: {path}")
+
+        rows = ReadingColumns(REPLAY_CHANNELS, REPLAY_TYPES)
+        if path.endswith(('.db', '.sqlite', '.sqlite3')):
+            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            try:
+                cursor = conn.execute(
+                    f"SELECT ts, {', '.join(REPLAY_CHANNELS)} FROM readings WHERE device = ? ORDER BY ts",
+                    (device,))
+                rows.extend((row[0], dict(zip(REPLAY_CHANNELS, row[1:]))) for row in cursor)
+            finally:
+                conn.close()
+        else:
+            with open(path, newline='', encoding='utf-8') as f:
+                rows.extend(
+                    (_parse_ts(record['ts']), {
+                        name: float(record[name]) if record.get(name) not in (None, '') else None
+                        for name in REPLAY_CHANNELS
+                    })
+                    for record in csv.DictReader(f))
+            rows = rows.sorted()
+
+        timestamps = rows.timestamps
+        logger.info(f"Recording {path}: {len(rows)} rows, {(timestamps[-1] - timestamps[0]) / 3600:.1f} h, "
+                    f"{rows.nbytes() / 1024:.0f} KiB"
+                    if len(rows) else f"Recording {path}: no rows")
+        return cls(path, rows)
+
+
+class ReplayReader:
+    """Reader that returns recorded values at the time of a virtual clock."""
+
+    def __init__(self, recording: Recording, clock: VirtualClock = None, loop: bool = True):
+        """
+        Initialize replay reader.
+
+        Args:
+            recording: Loaded recording
+            clock: Virtual clock shared with the device (default: new clock at 1x)
+            loop: Repeat the recording instead of stopping at its end
+        """
+        self.recording = recording
+        self.clock = clock or VirtualClock(recording.start)
+        self.loop = loop
+        self.filter_stats: Dict[str, Dict[str, int]] = {}
+        self.last_pwm_ack: Optional[int] = None
+        self._pwm = 0
+        self._finished = False
+        logger.info(f"Using ReplayReader ({recording.source}, {self.clock.speed:g}x)")
+
+    def close(self):
+        pass
+
+    def _current(self) -> Optional[int]:
+        """Return the index of the recorded row at the current virtual time (None after the end)."""
+        rec = self.recording
+        offset = self.clock.time() - rec.start
+        if offset >= rec.duration:
+            if not self.loop:
+                if not self._finished:
+                    logger.info("Replay finished")
+                    self._finished = True
+                return None
+            offset %= rec.duration
+        index = bisect.bisect_right(rec.timestamps, rec.start + offset) - 1
+        return max(index, 0)
+
+    def _value(self, name: str):
+        index = self._current()
+        return None if index is None else self.recording.rows.value(name, index)
+
+    def read_all(self, num_samples: int = None, include_pwm: bool = True) -> Optional[Reading]:
+        """Return the recorded reading in read_all() format (flags from config thresholds)."""
+        index = self._current()
+        if index is None:
+            return None
+        row = self.recording.rows.row(index)
+        if row['sky_temp_c'] is None:
+            return None
+
+        result = Reading(
+            sky_temp_c=row['sky_temp_c'],
+            heater_pwm=self._pwm if include_pwm else None,
+            rain_sensor_temp_c=row['rain_sensor_temp_c'],
+            light_sensor_raw=row['light_sensor_raw'],
+            filter_stats={},
+        )
+        rain_freq = row['rain_freq']
+        if rain_freq is not None:
+            result.rain_freq = rain_freq
+            result.is_raining = rain_freq < config.RAIN_THRESHOLD
+            result.is_wet = rain_freq < config.WET_THRESHOLD
+        if row['mpsas'] is not None:
+            result.mpsas = row['mpsas']
+            result.is_daylight = row['mpsas'] < config.MPSAS_DAYLIGHT_THRESHOLD
+        return result
+
+    def read_rain_freq(self) -> Optional[int]:
+        return self._value('rain_freq')
+
+    def read_ambient(self) -> tuple[Optional[float], Optional[float]]:
+        """Recorded ESP temperatures (shadow, sun)."""
+        index = self._current()
+        if index is None:
+            return None, None
+        rows = self.recording.rows
+        return rows.value('esp_temp_shadow_c', index), rows.value('esp_temp_sun_c', index)
+
+    def set_pwm(self, value: int, timeout: float = None) -> bool:
+        self._pwm = max(PWM_MIN, min(PWM_MAX, value))
+        self.last_pwm_ack = self._pwm
+        return True
+
+    def read_errors(self) -> Dict[str, int]:
+        return {name: 0 for name in ERROR_COUNTERS.values()}
+
+    def read_switch(self) -> str:
+        return 'closed'
+
+    def read_device_info(self) -> Dict:
+        return {
+            'name': 'ReplayCloudWatcher',
+            'firmware': 'replay',
+            'source': self.recording.source,
+            'rows': len(self.recording.rows),
+            'speed': self.clock.speed,
+        }
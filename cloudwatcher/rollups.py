@@ -0,0 +1,273 @@
+"""
+CloudWatcher History Rollups
+Modified: 2026-10-19 - Initial creation
+Modified: 2026-10-19 - sky_delta_c against the same ambient as trends/heater (fused, shadow fallback)
+Modified: 2026-10-19 - Open coarse buckets checkpointed at every finest-tier boundary
+
+Multi-resolution aggregates of the reading history, maintained
+incrementally as every reading arrives (no re-aggregation of raw rows).
+
+Tiers (ROLLUP_TIERS): 1 min, 10 min, 1 h buckets aligned to UTC epoch.
+Per bucket and channel: sum, min, max and count (mean = sum / count).
+
+- The open bucket of every tier is accumulated in memory; when a reading
+  falls into the next bucket the closed bucket is written (one row per
+  tier and device, so a tier costs one INSERT per bucket, not per reading).
+- Rows are upserts that merge with an existing row, so a bucket that was
+  flushed at shutdown and continues after restart stays correct.
+- At every boundary of the finest tier the open buckets of the coarser
+  tiers are checkpointed: their accumulation so far is merged into the
+  row and the in-memory bucket starts empty again. A crash, watchdog kill
+  or power cut loses at most one finest-tier bucket, not an hour.
+- Each tier has its own retention (ROLLUP_RETENTION_DAYS).
+- Queries pick the coarsest tier whose bucket width still satisfies the
+  requested resolution; the open bucket is merged in from memory.
+
+Tables live in the history database (shared connection of HistoryStore).
+"""
+
+import logging
+import time
+from typing import Dict, List, Optional, Sequence
+
+import config
+from history_store import PRUNE_INTERVAL, HistoryStore
+from trends import select_ambient
+
+logger = logging.getLogger(__name__)
+
+# Aggregated channels ('sky_delta_c' = ambient - sky temperature, ambient = fused
+# estimate with the ESP shadow sensor as fallback, as in trends.py)
+ROLLUP_CHANNELS = (
+    'sky_temp_c', 'sky_delta_c', 'rain_freq', 'rain_sensor_temp_c',
+    'mpsas', 'heater_pwm', 'esp_temp_shadow_c',
+)
+
+# Per channel: sum, min, max, count
+STATS = ('sum', 'min', 'max', 'n')
+
+
+def derive_values(values: Dict) -> Dict:
+    """Return rollup channel values of a snapshot (adds sky_delta_c)."""
+    result = {name: values.get(name) for name in ROLLUP_CHANNELS}
+    sky, ambient = values.get('sky_temp_c'), select_ambient(values)
+    result['sky_delta_c'] = round(ambient - sky, 2) if sky is not None and ambient is not None else None
+    return result
+
+
+class _Bucket:
+    """In-memory accumulator of one open bucket."""
+
+    __slots__ = ('start', 'acc')
+
+    def __init__(self, start: int):
+        self.start = start
+        self.acc: Dict[str, list] = {}
+
+    def add(self, values: Dict):
+        for name, value in values.items():
+            if value is None:
+                continue
+            a = self.acc.get(name)
+            if a is None:
+                self.acc[name] = [value, value, value, 1]
+            else:
+                a[0] += value
+                if value < a[1]:
+                    a[1] = value
+                if value > a[2]:
+                    a[2] = value
+                a[3] += 1
+
+    def row(self) -> List:
+        row = []
+        for name in ROLLUP_CHANNELS:
+            row.extend(self.acc.get(name, (None, None, None, 0)))
+        return row
+
+
+class RollupStore:
+    """Incrementally maintained rollup tiers for all devices."""
+
+    def __init__(self, store: HistoryStore, tiers: Dict[str, int] = None, retention_days: Dict[str, float] = None):
+        """
+        Create rollup tables in the history database.
+
+        Args:
+            store: HistoryStore whose connection and lock are shared
+            tiers: Mapping tier name -> bucket width in seconds (default: config.ROLLUP_TIERS)
+            retention_days: Mapping tier name -> retention in days (default: config.ROLLUP_RETENTION_DAYS)
+        """
+        self.store = store
+        self.tiers = dict(sorted((tiers or config.ROLLUP_TIERS).items(), key=lambda t: t[1]))
+        self.retention_days = retention_days or config.ROLLUP_RETENTION_DAYS
+        self._open: Dict[tuple, _Bucket] = {}
+        self._last_prune = 0.0
+        self._create_schema()
+
+    def _table(self, tier: str) -> str:
+        return f"rollup_{tier}"
+
+    def _create_schema(self):
+        columns = ', '.join(
+            f"{name}_{stat} {'INTEGER NOT NULL DEFAULT 0' if stat == 'n' else 'REAL'}"
+            for name in ROLLUP_CHANNELS for stat in STATS)
+        with self.store._lock, self.store.conn:
+            for tier in self.tiers:
+                self.store.conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {self._table(tier)} ("
+                    f"device TEXT NOT NULL, bucket INTEGER NOT NULL, {columns}, "
+                    f"PRIMARY KEY (device, bucket)) WITHOUT ROWID"
+                )
+
+    def _upsert_sql(self, tier: str) -> str:
+        names = [f"{name}_{stat}" for name in ROLLUP_CHANNELS for stat in STATS]
+        merge = []
+        for name in ROLLUP_CHANNELS:
+            merge += [
+                f"{name}_sum = COALESCE({name}_sum, 0) + COALESCE(excluded.{name}_sum, 0)",
+                f"{name}_min = MIN(COALESCE({name}_min, excluded.{name}_min), COALESCE(excluded.{name}_min, {name}_min))",
+                f"{name}_max = MAX(COALESCE({name}_max, excluded.{name}_max), COALESCE(excluded.{name}_max, {name}_max))",
+                f"{name}_n = {name}_n + excluded.{name}_n",
+            ]
+        return (
+            f"INSERT INTO {self._table(tier)} (device, bucket, {', '.join(names)}) "
+            f"VALUES ({', '.join('?' * (len(names) + 2))}) "
+            f"ON CONFLICT (device, bucket) DO UPDATE SET {', '.join(merge)}"
+        )
+
+    def _flush(self, tier: str, device: str, bucket: _Bucket):
+        with self.store._lock, self.store.conn:
+            self.store.conn.execute(self._upsert_sql(tier), [device, bucket.start] + bucket.row())
+
+    def add(self, device: str, ts: float, values: Dict):
+        """
+        Add one reading to all tiers.
+
+        Args:
+            device: Device name
+            ts: UTC epoch seconds
+            values: Snapshot (channels not in ROLLUP_CHANNELS are ignored)
+        """
+        values = derive_values(values)
+        # Tiers are sorted by width: a rollover of the first one checkpoints the others
+        rolled = False
+        for tier, width in self.tiers.items():
+            start = int(ts // width) * width
+            key = (tier, device)
+            bucket = self._open.get(key)
+            if bucket is not None and (bucket.start != start or rolled):
+                if bucket.acc:
+                    self._flush(tier, device, bucket)
+                rolled = rolled or bucket.start != start
+                bucket = None
+            if bucket is None:
+                bucket = self._open[key] = _Bucket(start)
+            bucket.add(values)
+
+        if time.time() - self._last_prune > PRUNE_INTERVAL:
+            self.prune()
+
+    def flush_all(self):
+        """Write all open buckets (shutdown); they are merged again after restart."""
+        for (tier, device), bucket in list(self._open.items()):
+            self._flush(tier, device, bucket)
+        self._open.clear()
+
+    def prune(self) -> int:
+        """Delete buckets older than each tier's retention. Returns rows deleted."""
+        self._last_prune = time.time()
+        deleted = 0
+        with self.store._lock, self.store.conn:
+            for tier in self.tiers:
+                cutoff = self._last_prune - self.retention_days[tier] * 86400
+                deleted += self.store.conn.execute(
+                    f"DELETE FROM {self._table(tier)} WHERE bucket < ?", (cutoff,)).rowcount
+        if deleted:
+            logger.info(f"Rollups: pruned {deleted} bucket(s)")
+        return deleted
+
+    def pick_tier(self, resolution: float) -> Optional[str]:
+        """Return the coarsest tier with bucket width <= resolution (None = raw data)."""
+        chosen = None
+        for tier, width in self.tiers.items():
+            if width <= resolution:
+                chosen = tier
+        return chosen
+
+    @staticmethod
+    def check_channels(channels: Optional[Sequence[str]]) -> List[str]:
+        """Validate rollup channel names (None = all)."""
+        if not channels:
+            return list(ROLLUP_CHANNELS)
+        unknown = [c for c in channels if c not in ROLLUP_CHANNELS]
+        if unknown:
+            raise ValueError(f"Unknown rollup channel(s): {', '.join(unknown)}")
+        return list(channels)
+
+    def query(
+        self,
+        device: str,
+        tier: str,
+        start: float,
+        end: float,
+        channels: Optional[Sequence[str]] = None,
+    ) -> Dict[str, Dict[str, list]]:
+        """
+        Return buckets of one tier overlapping [start, end].
+
+        Returns:
+            Mapping channel -> {'t': bucket starts, 'mean', 'min', 'max', 'count'}
+            (buckets without values for a channel are skipped for that channel)
+        """
+        if tier not in self.tiers:
+            raise ValueError(f"Unknown rollup tier '{tier}' (use one of {', '.join(self.tiers)})")
+        channels = self.check_channels(channels)
+        width = self.tiers[tier]
+        first = int(start // width) * width
+
+        columns = ', '.join(f"{name}_{stat}" for name in channels for stat in STATS)
+        with self.store._lock:
+            rows = self.store.conn.execute(
+                f"SELECT bucket, {columns} FROM {self._table(tier)} "
+                f"WHERE device = ? AND bucket BETWEEN ? AND ? ORDER BY bucket",
+                (device, first, end),
+            ).fetchall()
+
+        # Merge the open (not yet written) bucket
+        bucket = self._open.get((tier, device))
+        if bucket is not None and first <= bucket.start <= end:
+            open_row = [bucket.start]
+            for name in channels:
+                open_row.extend(bucket.acc.get(name, (None, None, None, 0)))
+            if rows and rows[-1][0] == bucket.start:
+                rows[-1] = self._merge_rows(rows[-1], open_row)
+            else:
+                rows.append(tuple(open_row))
+
+        result = {name: {'t': [], 'mean': [], 'min': [], 'max': [], 'count': []} for name in channels}
+        for row in rows:
+            for i, name in enumerate(channels):
+                s, lo, hi, n = row[1 + i * 4:5 + i * 4]
+                if not n:
+                    continue
+                series = result[name]
+                series['t'].append(row[0])
+                series['mean'].append(s / n)
+                series['min'].append(lo)
+                series['max'].append(hi)
+                series['count'].append(n)
+        return result
+
+    @staticmethod
+    def _merge_rows(a, b) -> tuple:
+        merged = [a[0]]
+        for i in range(1, len(a), 4):
+            (s1, lo1, hi1, n1), (s2, lo2, hi2, n2) = a[i:i + 4], b[i:i + 4]
+            merged += [
+                (s1 or 0) + (s2 or 0),
+                min(v for v in (lo1, lo2) if v is not None) if n1 or n2 else None,
+                max(v for v in (hi1, hi2) if v is not None) if n1 or n2 else None,
+                n1 + n2,
+            ]
+        return tuple(merged)
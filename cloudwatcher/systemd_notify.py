@@ -0,0 +1,65 @@
+"""
+Minimal systemd notification (sd_notify) without external dependencies
+Modified: 2026-10-19 - Initial creation
+Modified: 2026-10-19 - notify_watchdog() (WatchdogSec keep-alive)
+
+Sends state strings (READY=1, STATUS=..., WATCHDOG=1, STOPPING=1) to the
+socket given in $NOTIFY_SOCKET. Outside systemd (no NOTIFY_SOCKET) all
+calls are no-ops, so the service runs unchanged from a shell.
+
+Requires Type=notify in cloudwatcher.service.
+"""
+
+import logging
+import os
+import socket
+
+logger = logging.getLogger(__name__)
+
+
+def notify(state: str) -> bool:
+    """
+    Send a notification to systemd.
+
+    Args:
+        state: Newline-separated assignments, e.g. "READY=1\\nSTATUS=ok"
+
+    Returns:
+        True if sent, False if not running under systemd or sending failed
+    """
+    address = os.environ.get('NOTIFY_SOCKET')
+    if not address:
+        return False
+
+    # Abstract namespace socket
+    if address.startswith('@'):
+        address = '\0' + address[1:]
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.connect(address)
+            sock.sendall(state.encode('utf-8'))
+        return True
+    except OSError as e:
+        logger.warning(f"systemd notify failed: {e}")
+        return False
+
+
+def notify_ready(status: str = None) -> bool:
+    """Report service readiness (optionally with a status line)."""
+    return notify('READY=1' + (f'\nSTATUS={status}' if status else ''))
+
+
+def notify_status(status: str) -> bool:
+    """Update the status line shown by systemctl status."""
+    return notify(f'STATUS={status}')
+
+
+def notify_watchdog() -> bool:
+    """Feed the systemd watchdog (WatchdogSec=)."""
+    return notify('WATCHDOG=1')
+
+
+def notify_stopping() -> bool:
+    """Report that the service is shutting down."""
+    return notify('STOPPING=1')
@@ -0,0 +1,305 @@
+"""
+CloudWatcher Trends and Nowcast
+Modified: 2026-10-19 - Initial creation
+Modified: 2026-10-19 - Deltas against the fused ambient estimate (ESP shadow as fallback)
+
+Incremental linear trends over the sensor stream of one device.
+
+Every channel keeps a sliding-window least-squares regression
+(SlidingRegression): running sums of t, v, t*t, t*v and v*v are updated
+when a reading enters or leaves the window, so an update costs O(1)
+regardless of the window length (TREND_WINDOW).
+
+From the regressions the engine derives once per cycle:
+- slope per minute and fit quality (r2) of every channel
+- time-to-threshold estimates (minutes, None = not approaching):
+    wet_in_min            rain_freq falls to WET_THRESHOLD (dew/rain forming)
+    sensor_margin_in_min  rain sensor - ambient falls to HEATER_MIN_DELTA
+    cloud_change_in_min   ambient - sky reaches the next THRESHOLDS boundary
+    daylight_in_min       MPSAS falls to MPSAS_DAYLIGHT_THRESHOLD (dawn)
+- cloud outlook: 'clouding_up', 'clearing' or 'steady'
+- nowcast: fitted values TREND_HORIZON minutes ahead
+
+Fits with r2 below TREND_MIN_R2 (noise, no real trend) give no
+time-to-threshold estimates and count as 'steady'.
+
+The dew point itself is not measured (no humidity sensor); the ambient
+temperature (fused estimate, see ambient_fusion.py, else ESP shadow) is
+the reference for the sensor margin, as in the heater control.
+
+The flat summary fields (SUMMARY_FIELDS) are part of every published
+snapshot (change stream, MQTT); the full detail is served by /api/trends.
+"""
+
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+import config
+
+# Channels with a trend ('sky_delta_c' = ambient - sky, 'sensor_delta_c' = rain sensor - ambient)
+TREND_CHANNELS = (
+    'sky_temp_c', 'sky_delta_c', 'rain_freq', 'rain_sensor_temp_c',
+    'sensor_delta_c', 'mpsas', 'esp_temp_shadow_c',
+)
+
+# Fields added to the device snapshot
+SUMMARY_FIELDS = (
+    'sky_delta_trend', 'cloud_outlook', 'cloud_change_in_min',
+    'wet_in_min', 'sensor_margin_in_min', 'daylight_in_min',
+)
+
+# Sums are rebuilt relative to a new time origin after this many windows
+# (bounds floating point error of the running sums)
+REBASE_WINDOWS = 100
+
+
+def select_ambient(values: Dict) -> Optional[float]:
+    """Ambient temperature of a snapshot: fused estimate, ESP shadow sensor as fallback."""
+    ambient = values.get('ambient_temp_c')
+    return values.get('esp_temp_shadow_c') if ambient is None else ambient
+
+
+def trend_values(snapshot: Dict) -> Dict:
+    """Return trend channel values of a snapshot (adds derived deltas)."""
+    values = {name: snapshot.get(name) for name in TREND_CHANNELS}
+    sky = snapshot.get('sky_temp_c')
+    sensor = snapshot.get('rain_sensor_temp_c')
+    ambient = select_ambient(snapshot)
+    if ambient is not None:
+        values['sky_delta_c'] = ambient - sky if sky is not None else None
+        values['sensor_delta_c'] = sensor - ambient if sensor is not None else None
+    return values
+
+
+def cloud_condition(delta: Optional[float]) -> Optional[str]:
+    """Cloud condition of an ambient - sky delta (config.THRESHOLDS)."""
+    if delta is None:
+        return None
+    for name, threshold in sorted(config.THRESHOLDS.items(), key=lambda t: -t[1]):
+        if delta > threshold:
+            return name
+    return 'overcast'
+
+
+class SlidingRegression:
+    """Least-squares line over a sliding time window with O(1) updates."""
+
+    __slots__ = ('window_s', 'points', 'origin', 'st', 'sv', 'stt', 'stv', 'svv')
+
+    def __init__(self, window_s: float):
+        self.window_s = window_s
+        self.points: deque = deque()
+        self.origin: Optional[float] = None
+        self.st = self.sv = self.stt = self.stv = self.svv = 0.0
+
+    def _accumulate(self, x: float, v: float, sign: float):
+        self.st += sign * x
+        self.sv += sign * v
+        self.stt += sign * x * x
+        self.stv += sign * x * v
+        self.svv += sign * v * v
+
+    def _rebase(self, origin: float):
+        self.origin = origin
+        self.st = self.sv = self.stt = self.stv = self.svv = 0.0
+        for t, v in self.points:
+            self._accumulate(t - origin, v, 1.0)
+
+    def add(self, t: float, v: float):
+        """Add a sample at time t (epoch seconds, increasing) and drop expired ones."""
+        if self.origin is None:
+            self.origin = t
+        self.points.append((t, v))
+        self._accumulate(t - self.origin, v, 1.0)
+
+        while t - self.points[0][0] > self.window_s:
+            old_t, old_v = self.points.popleft()
+            self._accumulate(old_t - self.origin, old_v, -1.0)
+
+        if t - self.origin > REBASE_WINDOWS * self.window_s:
+            self._rebase(self.points[0][0])
+
+    @property
+    def n(self) -> int:
+        return len(self.points)
+
+    def fit(self) -> Optional[tuple]:
+        """Return (slope per second, intercept at origin, r2), None if undetermined."""
+        n = len(self.points)
+        if n < 2:
+            return None
+        var_t = n * self.stt - self.st * self.st
+        if var_t <= 1e-9 * max(1.0, self.stt * n):
+            return None
+        cov = n * self.stv - self.st * self.sv
+        slope = cov / var_t
+        intercept = (self.sv - slope * self.st) / n
+        var_v = n * self.svv - self.sv * self.sv
+        r2 = min(1.0, cov * cov / (var_t * var_v)) if var_v > 1e-12 * max(1.0, self.svv * n) else 1.0
+        return slope, intercept, r2
+
+    def predict(self, t: float) -> Optional[float]:
+        """Fitted value at time t, None if undetermined."""
+        fit = self.fit()
+        if fit is None:
+            return None
+        slope, intercept, _ = fit
+        return intercept + slope * (t - self.origin)
+
+
+class TrendEngine:
+    """Sliding-window trends, time-to-threshold estimates and nowcast of one device."""
+
+    def __init__(self, window_s: float = None, min_points: int = None, horizon_min: float = None):
+        """
+        Initialize engine (defaults from config.TREND_*).
+
+        Args:
+            window_s: Regression window (seconds)
+            min_points: Minimum samples in the window before a trend is reported
+            horizon_min: Nowcast horizon (minutes)
+        """
+        self.window_s = window_s or config.TREND_WINDOW
+        self.min_points = min_points or config.TREND_MIN_POINTS
+        self.horizon_min = horizon_min or config.TREND_HORIZON
+        self.regressions = {name: SlidingRegression(self.window_s) for name in TREND_CHANNELS}
+        self.updated: Optional[float] = None
+        self.summary: Dict = dict.fromkeys(SUMMARY_FIELDS)
+
+    def configure(self):
+        """Re-read settings from config (live config reload, samples are kept)."""
+        self.window_s = config.TREND_WINDOW
+        self.min_points = config.TREND_MIN_POINTS
+        self.horizon_min = config.TREND_HORIZON
+        for regression in self.regressions.values():
+            regression.window_s = self.window_s
+
+    def update(self, t: float, snapshot: Dict) -> Dict:
+        """
+        Add one reading and recompute the summary.
+
+        Args:
+            t: Reading time (epoch seconds)
+            snapshot: Device snapshot (see device.build_snapshot)
+
+        Returns:
+            Summary fields (SUMMARY_FIELDS)
+        """
+        for name, value in trend_values(snapshot).items():
+            if value is not None:
+                self.regressions[name].add(t, float(value))
+        self.updated = t
+        self.summary = self._summarize()
+        return self.summary
+
+    def _fit(self, name: str) -> Optional[tuple]:
+        regression = self.regressions[name]
+        if regression.n < self.min_points or self.updated - regression.points[-1][0] > self.window_s:
+            return None
+        return regression.fit()
+
+    def slope_per_min(self, name: str) -> Optional[float]:
+        """Current slope of a channel in units per minute (None = no trend yet)."""
+        fit = self._fit(name)
+        return fit[0] * 60 if fit else None
+
+    def predict(self, name: str, minutes: float, min_r2: float = 0.0) -> Optional[float]:
+        """Fitted value of a channel `minutes` after the last update (None if r2 < min_r2)."""
+        fit = self._fit(name)
+        if fit is None or fit[2] < min_r2:
+            return None
+        return self.regressions[name].predict(self.updated + minutes * 60)
+
+    def time_to(self, name: str, threshold: float, falling: bool = True) -> Optional[float]:
+        """
+        Minutes until the fitted line of a channel crosses a threshold.
+
+        Args:
+            name: Channel name
+            threshold: Threshold value
+            falling: Approach from above (True) or below (False)
+
+        Returns:
+            Minutes (0 = already crossed), None if not approaching, beyond
+            TREND_MAX_LEAD or the fit is too noisy (r2 < TREND_MIN_R2)
+        """
+        fit = self._fit(name)
+        if fit is None:
+            return None
+        slope = fit[0]
+        current = self.regressions[name].predict(self.updated)
+        if (current <= threshold) if falling else (current >= threshold):
+            return 0.0
+        if ((slope >= 0) if falling else (slope <= 0)) or fit[2] < config.TREND_MIN_R2:
+            return None
+        minutes = (threshold - current) / slope / 60
+        return round(minutes, 1) if minutes <= config.TREND_MAX_LEAD else None
+
+    def _cloud_change(self) -> tuple[Optional[str], Optional[float]]:
+        """Cloud outlook and minutes until the next cloud condition boundary."""
+        name, sign = 'sky_delta_c', 1.0
+        fit = self._fit(name)
+        if fit is None:
+            # No ambient temperature: a warming sky means clouding up
+            name, sign = 'sky_temp_c', -1.0
+            fit = self._fit(name)
+        if fit is None:
+            return None, None
+
+        slope = fit[0] * 60
+        steady = config.TREND_STEADY_SLOPE
+        if fit[2] < config.TREND_MIN_R2:
+            return 'steady', None
+        if sign * slope <= -steady:
+            outlook = 'clouding_up'
+        elif sign * slope >= steady:
+            outlook = 'clearing'
+        else:
+            return 'steady', None
+        if name != 'sky_delta_c':
+            return outlook, None
+
+        # Next THRESHOLDS boundary in the direction of the trend
+        current = self.regressions[name].predict(self.updated)
+        boundaries = sorted(config.THRESHOLDS.values())
+        if outlook == 'clouding_up':
+            below = [b for b in boundaries if b < current]
+            return outlook, self.time_to(name, below[-1], falling=True) if below else None
+        above = [b for b in boundaries if b >= current]
+        return outlook, self.time_to(name, above[0], falling=False) if above else None
+
+    def _summarize(self) -> Dict:
+        slope = self.slope_per_min('sky_delta_c')
+        outlook, cloud_change = self._cloud_change()
+        return {
+            'sky_delta_trend': round(slope, 3) if slope is not None else None,
+            'cloud_outlook': outlook,
+            'cloud_change_in_min': cloud_change,
+            'wet_in_min': self.time_to('rain_freq', config.WET_THRESHOLD),
+            'sensor_margin_in_min': self.time_to('sensor_delta_c', config.HEATER_MIN_DELTA),
+            'daylight_in_min': self.time_to('mpsas', config.MPSAS_DAYLIGHT_THRESHOLD),
+        }
+
+    def get_status(self) -> Dict:
+        """Full trend detail for /api/trends."""
+        channels = {}
+        for name, regression in self.regressions.items():
+            fit = self._fit(name) if self.updated is not None else None
+            channels[name] = {
+                'n': regression.n,
+                'value': round(regression.points[-1][1], 2) if regression.n else None,
+                'fitted': round(regression.predict(self.updated), 2) if fit else None,
+                'slope_per_min': round(fit[0] * 60, 4) if fit else None,
+                'r2': round(fit[2], 3) if fit else None,
+                'nowcast': round(self.predict(name, self.horizon_min), 2) if fit else None,
+            }
+        nowcast_delta = channels['sky_delta_c']['nowcast']
+        return {
+            'window_s': self.window_s,
+            'horizon_min': self.horizon_min,
+            'updated': datetime.fromtimestamp(self.updated, timezone.utc).isoformat() if self.updated else None,
+            'summary': self.summary,
+            'cloud_condition_nowcast': cloud_condition(nowcast_delta),
+            'channels': channels,
+        }
@@ -0,0 +1,241 @@
+"""
+CloudWatcher Reader Watchdog
+Modified: 2026-10-19 - Initial creation
+Modified: 2026-10-19 - Loop deadline from the device's current (adaptive) read interval
+
+Every device cycle runs in stages with a latency budget each
+(WATCHDOG_BUDGETS, seconds of real time):
+
+    serial   read_all(), D!/F! diagnostics, opening the port
+    esp      ambient temperature fetch
+    control  heater PWM calculation and write
+    publish  change tracker, history, rollups, snapshot file
+
+A StageMonitor per device records the running stage and per-stage
+durations. The Watchdog thread checks all devices every WATCHDOG_INTERVAL
+seconds. A device is stalled when a stage exceeds its budget, or when no
+stage started for the current read interval + WATCHDOG_LOOP_GRACE (thread died or hung
+outside a stage). On a stall the watchdog
+
+1. drives the heater to WATCHDOG_SAFE_PWM (from a helper thread, the
+   serial port may be the part that hangs),
+2. restarts the device's I/O worker with a fresh reader; the hung thread
+   is retired and exits when its blocking call returns (closing the old
+   port usually makes it return at once). Restarts are at least
+   WATCHDOG_RESTART_INTERVAL seconds apart.
+
+The stall ends with the first stage completed by the new worker; stall
+count and durations are kept as metrics (/api/raw 'watchdog').
+
+systemd: with WatchdogSec= in cloudwatcher.service the watchdog sends
+WATCHDOG=1 on every check, unless a device stays stalled longer than
+WATCHDOG_MAX_STALL - then systemd restarts the whole service.
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+import config
+import systemd_notify
+
+logger = logging.getLogger(__name__)
+
+STAGES = ('serial', 'esp', 'control', 'publish')
+
+
+class WorkerRetired(Exception):
+    """Raised in a retired (replaced) I/O thread when it resumes."""
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat() if ts else None
+
+
+class StageMonitor:
+    """Running stage, per-stage durations and stall metrics of one device."""
+
+    def __init__(self):
+        # Incremented when the I/O worker is replaced
+        self.generation = 0
+        self.current: Optional[str] = None
+        self.current_started: Optional[float] = None  # monotonic
+        self.last_progress = time.monotonic()
+        self.durations = {
+            stage: {'last': None, 'max': 0.0, 'count': 0, 'over_budget': 0} for stage in STAGES
+        }
+        # Stall state, maintained by the Watchdog
+        self.stalled: Optional[str] = None
+        self.stall_started: Optional[float] = None    # monotonic
+        self.stall_started_at: Optional[float] = None  # epoch seconds
+        self.stalls = 0
+        self.stall_seconds = 0.0
+        self.last_stall: Optional[Dict] = None
+        self.restarts = 0
+        self.last_restart = 0.0  # monotonic
+        self.safe_pwm_writes = 0
+
+    def retire_worker(self):
+        """Mark the running I/O worker as replaced (its next stage raises WorkerRetired)."""
+        self.generation += 1
+
+    @contextmanager
+    def stage(self, name: str, generation: int):
+        """
+        Track one stage of the cycle.
+
+        Args:
+            name: Stage name (STAGES)
+            generation: Worker generation of the calling thread
+
+        Raises:
+            WorkerRetired: The calling worker was replaced (before or during the stage)
+        """
+        if generation != self.generation:
+            raise WorkerRetired()
+        started = time.monotonic()
+        self.current, self.current_started = name, started
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            stats = self.durations[name]
+            stats['last'] = round(elapsed, 3)
+            stats['max'] = max(stats['max'], round(elapsed, 3))
+            stats['count'] += 1
+            if elapsed > config.WATCHDOG_BUDGETS[name]:
+                stats['over_budget'] += 1
+            if generation == self.generation:
+                if self.current_started == started:
+                    self.current = self.current_started = None
+                self.last_progress = time.monotonic()
+        # Result of a call that outlived its worker is discarded
+        if generation != self.generation:
+            raise WorkerRetired()
+
+    def overdue(self, now: float, loop_deadline: float) -> Optional[str]:
+        """Return the stage that blew its budget ('loop' = no stage started in time), else None."""
+        current, started = self.current, self.current_started
+        if current is not None and started is not None:
+            return current if now - started > config.WATCHDOG_BUDGETS[current] else None
+        return 'loop' if now - self.last_progress > loop_deadline else None
+
+    def get_status(self) -> Dict:
+        now = time.monotonic()
+        return {
+            'stage': self.current,
+            'stage_running_s': round(now - self.current_started, 1) if self.current_started else None,
+            'stalled': self.stalled,
+            'stall_running_s': round(now - self.stall_started, 1) if self.stall_started else None,
+            'stalls': self.stalls,
+            'stall_seconds_total': round(self.stall_seconds, 1),
+            'last_stall': self.last_stall,
+            'worker_restarts': self.restarts,
+            'safe_pwm_writes': self.safe_pwm_writes,
+            'stages': self.durations,
+        }
+
+
+class Watchdog:
+    """Checks the stage monitors of all devices, recovers stalled devices, feeds systemd."""
+
+    def __init__(self, devices: Dict, interval: float = None):
+        """
+        Initialize watchdog.
+
+        Args:
+            devices: Device registry (name -> CloudWatcherDevice)
+            interval: Check interval in seconds (default: config.WATCHDOG_INTERVAL,
+                      at most half of the systemd WatchdogSec)
+        """
+        self.devices = devices
+        self.interval = interval or config.WATCHDOG_INTERVAL
+        self.systemd_usec = int(os.environ.get('WATCHDOG_USEC', 0) or 0)
+        if self.systemd_usec:
+            self.interval = min(self.interval, self.systemd_usec / 2e6)
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='watchdog', daemon=True)
+        self.thread.start()
+        logger.info(
+            f"Watchdog started (every {self.interval:g}s"
+            + (f", systemd WatchdogSec={self.systemd_usec / 1e6:g}s)" if self.systemd_usec else ")"))
+
+    def _run(self):
+        while True:
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Watchdog check failed: {e}")
+            time.sleep(self.interval)
+
+    def check(self) -> bool:
+        """
+        Check all devices once.
+
+        Returns:
+            True if systemd was fed (no device stalled beyond WATCHDOG_MAX_STALL)
+        """
+        now = time.monotonic()
+        healthy = True
+        for dev in self.devices.values():
+            monitor = dev.monitor
+            loop_deadline = dev.cadence.interval / dev.clock.speed + config.WATCHDOG_LOOP_GRACE
+            overdue = monitor.overdue(now, loop_deadline)
+
+            if overdue is None:
+                if monitor.stalled is None:
+                    continue
+                if monitor.last_progress > monitor.stall_started:
+                    self._end_stall(dev, now)
+                    continue
+                # Restarted worker has not completed a stage yet
+            elif monitor.stalled is None:
+                self._begin_stall(dev, overdue, now)
+
+            if overdue is not None and now - monitor.last_restart >= config.WATCHDOG_RESTART_INTERVAL:
+                monitor.restarts += 1
+                monitor.last_restart = now
+                logger.warning(f"[{dev.name}] Watchdog: restarting I/O worker (restart #{monitor.restarts})")
+                dev.restart_worker()
+            if now - monitor.stall_started > config.WATCHDOG_MAX_STALL:
+                healthy = False
+
+        if healthy:
+            systemd_notify.notify_watchdog()
+        return healthy
+
+    def _begin_stall(self, dev, stage: str, now: float):
+        monitor = dev.monitor
+        # The stall counts from the start of the hanging stage (or the last progress)
+        started = (monitor.current_started if stage != 'loop' else None) or monitor.last_progress
+        monitor.stalled = stage
+        monitor.stall_started = started
+        monitor.stall_started_at = time.time() - (now - started)
+        monitor.stalls += 1
+        logger.error(
+            f"[{dev.name}] Watchdog: stage '{stage}' over budget ({now - started:.0f}s), "
+            f"heater to safe PWM {config.WATCHDOG_SAFE_PWM}")
+        threading.Thread(
+            target=self._fail_safe, args=(dev, stage), name=f"watchdog-safe-{dev.name}", daemon=True).start()
+
+    def _fail_safe(self, dev, stage: str):
+        if dev.fail_safe(config.WATCHDOG_SAFE_PWM, f"watchdog_safe ({stage} stalled)"):
+            dev.monitor.safe_pwm_writes += 1
+
+    def _end_stall(self, dev, now: float):
+        monitor = dev.monitor
+        duration = now - monitor.stall_started
+        monitor.stall_seconds += duration
+        monitor.last_stall = {
+            'stage': monitor.stalled,
+            'started': _iso(monitor.stall_started_at),
+            'duration_s': round(duration, 1),
+        }
+        logger.info(f"[{dev.name}] Watchdog: recovered after {duration:.0f}s ('{monitor.stalled}' stall)")
+        monitor.stalled = monitor.stall_started = monitor.stall_started_at = None
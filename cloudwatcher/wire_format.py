@@ -0,0 +1,125 @@
+"""
+CloudWatcher Wire Formats
+Modified: 2026-10-19 - Initial creation
+
+Content negotiation between JSON and compact binary encodings of the
+API payloads (snapshots, history, feed pages, stream frames):
+
+- 'json':    application/json (default, always available)
+- 'msgpack': application/msgpack (requires msgpack)
+- 'cbor':    application/cbor (requires cbor2)
+
+The format is chosen by ?format= or by the Accept header (q-values are
+honoured, formats whose library is missing are skipped). Every response
+carries the payload schema and version in X-CloudWatcher-Schema, e.g.
+"data/1"; the version is raised when fields change incompatibly.
+
+Streams (/api/stream) in a binary format are sequences of encoded
+frames without separators (MessagePack and CBOR items are
+self-delimiting, CBOR as application/cbor-seq); keep-alive frames are nil.
+"""
+
+from typing import Dict, Optional, Tuple
+
+FORMATS = ('json', 'msgpack', 'cbor')
+
+# Schema version of all payloads (X-CloudWatcher-Schema: <schema>/<version>)
+SCHEMA_VERSION = 1
+SCHEMA_HEADER = 'X-CloudWatcher-Schema'
+
+MEDIA_TYPES = {
+    'json': 'application/json',
+    'msgpack': 'application/msgpack',
+    'cbor': 'application/cbor',
+}
+STREAM_MEDIA_TYPES = {
+    'json': 'text/event-stream',
+    'msgpack': 'application/msgpack',
+    'cbor': 'application/cbor-seq',
+}
+# Accepted media types -> format
+ACCEPT_TYPES = {
+    'application/json': 'json',
+    'application/msgpack': 'msgpack',
+    'application/x-msgpack': 'msgpack',
+    'application/vnd.msgpack': 'msgpack',
+    'application/cbor': 'cbor',
+    'application/cbor-seq': 'cbor',
+}
+
+
+def available(fmt: str) -> bool:
+    """Return True if the library of a format is installed."""
+    try:
+        if fmt == 'msgpack':
+            import msgpack  # noqa: F401
+        elif fmt == 'cbor':
+            import cbor2  # noqa: F401
+        return fmt in FORMATS
+    except ImportError:
+        return False
+
+
+def _parse_accept(accept: str) -> list:
+    """Return [(q, media type)] of an Accept header, best first."""
+    entries = []
+    for position, part in enumerate(accept.split(',')):
+        fields = [f.strip() for f in part.split(';')]
+        media = fields[0].lower()
+        q = 1.0
+        for param in fields[1:]:
+            if param.startswith('q='):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if media and q > 0:
+            entries.append((-q, position, media))
+    return [(-q, media) for q, _, media in sorted(entries)]
+
+
+def negotiate(accept: Optional[str] = None, fmt: Optional[str] = None) -> str:
+    """
+    Choose the response format.
+
+    Args:
+        accept: Accept header
+        fmt: Explicit format (?format=), overrides the Accept header
+
+    Returns:
+        Format name
+
+    Raises:
+        ValueError: Explicit format unknown or its library missing
+    """
+    if fmt:
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format '{fmt}' (use one of {', '.join(FORMATS)})")
+        if not available(fmt):
+            raise ValueError(f"Format '{fmt}' requires {'msgpack' if fmt == 'msgpack' else 'cbor2'} (pip install it)")
+        return fmt
+
+    for _, media in _parse_accept(accept or ''):
+        candidate = ACCEPT_TYPES.get(media)
+        if candidate and available(candidate):
+            return candidate
+        if media in ('*/*', 'application/*'):
+            return 'json'
+    return 'json'
+
+
+def encode(payload, fmt: str) -> bytes:
+    """Encode a JSON-compatible payload in a binary format ('msgpack' or 'cbor')."""
+    if fmt == 'msgpack':
+        import msgpack
+        return msgpack.packb(payload, use_bin_type=True)
+    if fmt == 'cbor':
+        import cbor2
+        return cbor2.dumps(payload)
+    raise ValueError(f"No binary encoding for format '{fmt}'")
+
+
+def schema_headers(schema: str, fmt: str, stream: bool = False) -> Tuple[str, Dict[str, str]]:
+    """Return (content type, headers) of a response."""
+    media = (STREAM_MEDIA_TYPES if stream else MEDIA_TYPES)[fmt]
+    return media, {SCHEMA_HEADER: f"{schema}/{SCHEMA_VERSION}", 'Vary': 'Accept'}
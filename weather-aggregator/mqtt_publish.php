@@ -0,0 +1,116 @@
+<?php
+/**
+ * MQTT Publish - Weather Aggregator
+ *
+ * Minimal native MQTT 3.1.1 client for the MagicMirror notification after every PWS push:
+ * CONNECT, PUBLISH (QoS 0, not retained) and DISCONNECT over one TCP socket.
+ * Replaces the mosquitto_pub call, which forked a process per push and passed the
+ * JSON payload through the shell (broke on payloads containing quotes).
+ *
+ * Modified: 2026-10-19 - Initial creation
+ */
+
+/**
+ * Encode MQTT remaining length (variable byte integer, 7 bits per byte)
+ */
+function mqttRemainingLength($length) {
+    $encoded = '';
+    do {
+        $byte = $length % 128;
+        $length = intdiv($length, 128);
+        if ($length > 0) {
+            $byte |= 0x80;
+        }
+        $encoded .= chr($byte);
+    } while ($length > 0);
+    return $encoded;
+}
+
+/**
+ * Encode MQTT UTF-8 string (2-byte big-endian length prefix)
+ */
+function mqttString($value) {
+    return pack('n', strlen($value)) . $value;
+}
+
+/**
+ * Build an MQTT packet from type byte and body
+ */
+function mqttPacket($type, $body) {
+    return chr($type) . mqttRemainingLength(strlen($body)) . $body;
+}
+
+/**
+ * Write all bytes to the socket (fwrite may write partially)
+ */
+function mqttWrite($socket, $data) {
+    $total = 0;
+    $length = strlen($data);
+    while ($total < $length) {
+        $written = fwrite($socket, substr($data, $total));
+        if ($written === false || $written === 0) {
+            return false;
+        }
+        $total += $written;
+    }
+    return true;
+}
+
+/**
+ * Read exactly $length bytes from the socket, null on timeout/EOF
+ */
+function mqttRead($socket, $length) {
+    $data = '';
+    while (strlen($data) < $length) {
+        $chunk = fread($socket, $length - strlen($data));
+        if ($chunk === false || $chunk === '') {
+            return null;
+        }
+        $data .= $chunk;
+    }
+    return $data;
+}
+
+/**
+ * Publish one message to the broker (QoS 0, not retained)
+ *
+ * @param string $host Broker host
+ * @param int $port Broker port
+ * @param string $topic Topic
+ * @param string $payload Message payload
+ * @param float $timeout Connect/read timeout in seconds
+ * @return string|null Error message, null on success
+ */
+function mqttPublish($host, $port, $topic, $payload, $timeout = 2.0) {
+    $socket = @stream_socket_client("tcp://$host:$port", $errno, $errstr, $timeout);
+    if (!$socket) {
+        return "connect to $host:$port failed: $errstr ($errno)";
+    }
+    stream_set_timeout($socket, (int)ceil($timeout));
+
+    try {
+        // CONNECT: protocol "MQTT" level 4 (3.1.1), clean session, keep-alive 30 s
+        $clientId = 'weather-aggregator-' . getmypid();
+        $connect = mqttString('MQTT') . chr(4) . chr(0x02) . pack('n', 30) . mqttString($clientId);
+        if (!mqttWrite($socket, mqttPacket(0x10, $connect))) {
+            return 'CONNECT not sent';
+        }
+
+        // CONNACK: 0x20 0x02 <session present> <return code>
+        $connack = mqttRead($socket, 4);
+        if ($connack === null || ord($connack[0]) !== 0x20) {
+            return 'no CONNACK from broker';
+        }
+        if (ord($connack[3]) !== 0) {
+            return 'connection refused by broker (code ' . ord($connack[3]) . ')';
+        }
+
+        if (!mqttWrite($socket, mqttPacket(0x30, mqttString($topic) . $payload))) {
+            return 'PUBLISH not sent';
+        }
+        mqttWrite($socket, mqttPacket(0xE0, ''));
+        return null;
+    } finally {
+        fclose($socket);
+    }
+}
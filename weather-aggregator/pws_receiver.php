@@ -16,6 +16,7 @@
  * Modified: 2026-02-04 - Fixed UV parameter case sensitivity (UV → uv)
  * Modified: 2026-02-04 - Added rain_sensor_temp_c for heater control feedback
  * Modified: 2026-02-05 - Added esp_temp_shadow_c, esp_temp_sun_c from CloudWatcher
+ * Modified: 2026-10-19 - MQTT notification via native client (mqtt_publish.php) instead of mosquitto_pub
  */
 
 // Error reporting for development (disable in production)
@@ -38,6 +39,7 @@ if (!file_exists(__DIR__ . '/config.php')) {
 require_once __DIR__ . '/db_connect.php';
 require_once __DIR__ . '/config.php';
 require_once __DIR__ . '/wmo_derivation.php';
+require_once __DIR__ . '/mqtt_publish.php';
 
 /**
  * Convert Fahrenheit to Celsius
@@ -315,16 +317,10 @@ try {
         'cloudwatcher_online' => ($cw['sky_temp_c'] !== null),
         'data_age_s' => 0
     ]);
-    $mqttCmd = sprintf(
-        "mosquitto_pub -h %s -p %d -t '%s' -m '%s' 2>&1",
-        MQTT_BROKER_HOST,
-        MQTT_BROKER_PORT,
-        MQTT_TOPIC,
-        $mqttPayload
-    );
-    $mqttResult = shell_exec($mqttCmd);
-    if ($mqttResult) {
-        logMessage("MQTT publish error: " . trim($mqttResult));
+    // Native publish over one socket (no mosquitto_pub process per push)
+    $mqttError = mqttPublish(MQTT_BROKER_HOST, MQTT_BROKER_PORT, MQTT_TOPIC, $mqttPayload);
+    if ($mqttError) {
+        logMessage("MQTT publish error: " . $mqttError);
     }
 
     // Success response (expected by PWS)